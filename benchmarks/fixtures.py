@@ -0,0 +1,309 @@
+"""
+Synthetic Benchmark Fixtures
+
+Generates a self-contained scene that mirrors the production data layout, so
+benchmarks run offline instead of against the NAS paths in dataset/config.yaml:
+
+- `input.tif`: 13-band uint16 Sentinel-2-like stack (UTM, 10 m pixels)
+- `output.tif`: 2-band float32 model output (band 1 class 1-4, band 2 uncertainty 0-1)
+- `basins.shp`: fake HydroBASINS Level-12 grid (HYBAS_ID, NEXT_DOWN, SUB_AREA)
+  covering the scene footprint with a margin
+- `imerg.nc`: IMERG-like return-period grid (0.1°, 2yr ... 100yr) around the
+  footprint; written only when an xarray NetCDF backend is installed
+- `config.yaml`: config pointing at the files above, with the center basin selected
+
+Content is deterministic for a given seed and size, so runs are comparable.
+
+Usage:
+    python -m benchmarks.fixtures <out_dir> [--size 2048] [--basins 4000] [--layout tiled]
+"""
+
+import os
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_SIZE = 2048            # Pixels per side
+DEFAULT_BASINS = 4000          # Approximate number of basin polygons
+DEFAULT_SEED = 0
+INPUT_BANDS = 13
+PIXEL_SIZE = 10.0              # Meters
+CRS = "EPSG:32755"             # UTM 55S (eastern Australia)
+ORIGIN = (500000.0, 6200000.0)  # Upper-left corner in CRS units
+BASIN_MARGIN = 0.5             # Degrees of basin coverage beyond the footprint
+BASIN_VERTICES = 64            # Vertices per basin ring (HydroBASINS rings are dense)
+WRITE_ROWS = 256               # Rows per window when writing
+CLASS_EDGES = (0.45, 0.6, 0.7)  # Water-level thresholds between classes 1-4
+IMERG_RESOLUTION = 0.1         # Degrees
+IMERG_MARGIN = 3.0             # Degrees of IMERG grid beyond the footprint
+IMERG_CHUNK = 16               # Cells per NetCDF chunk side
+RETURN_PERIODS = (2, 5, 10, 25, 50, 100)
+
+LAYOUTS = ('tiled', 'striped', 'cog')
+
+
+# ============================================================================
+# Rasters
+# ============================================================================
+
+def _smooth_field(rng, shape, scale):
+    """Low-frequency random field in [0, 1] (bilinear upsampling of coarse noise)."""
+    coarse = rng.random((max(2, shape[0] // scale + 2), max(2, shape[1] // scale + 2)))
+    rows = np.linspace(0, coarse.shape[0] - 1.001, shape[0])
+    cols = np.linspace(0, coarse.shape[1] - 1.001, shape[1])
+    r0, c0 = rows.astype(int), cols.astype(int)
+    fr, fc = (rows - r0)[:, None], (cols - c0)[None, :]
+    top = coarse[r0][:, c0] * (1 - fc) + coarse[r0][:, c0 + 1] * fc
+    bottom = coarse[r0 + 1][:, c0] * (1 - fc) + coarse[r0 + 1][:, c0 + 1] * fc
+    return top * (1 - fr) + bottom * fr
+
+
+def _profile(size, count, dtype, layout):
+    from rasterio.transform import from_origin
+
+    profile = {
+        'driver': "GTiff", 'width': size, 'height': size, 'count': count, 'dtype': dtype,
+        'crs': CRS, 'transform': from_origin(*ORIGIN, PIXEL_SIZE, PIXEL_SIZE),
+        'compress': "DEFLATE", 'BIGTIFF': "IF_SAFER",
+    }
+    if layout != 'striped':
+        profile.update(tiled=True, blockxsize=512, blockysize=512)
+    return profile
+
+
+def _finish(tmp_path, path, layout):
+    """Move a written raster into place, converting it to a COG for layout='cog'."""
+    if layout == 'cog':
+        from rasterio.shutil import copy as rio_copy
+
+        rio_copy(tmp_path, path, driver="COG", COMPRESS="DEFLATE", OVERVIEW_RESAMPLING="NEAREST")
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+def write_input(path, size=DEFAULT_SIZE, seed=DEFAULT_SEED, layout='tiled'):
+    """
+    Write a 13-band uint16 reflectance-like stack.
+
+    Bands share a smooth land-cover field plus per-band gain and pixel noise,
+    so the file compresses roughly like real imagery.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    rng = np.random.default_rng(seed)
+    field = _smooth_field(rng, (size, size), 64).astype(np.float32)
+    gains = rng.uniform(800, 4000, INPUT_BANDS).astype(np.float32)
+
+    tmp_path = f"{path}.tmp.tif"
+    with rasterio.open(tmp_path, "w", **_profile(size, INPUT_BANDS, "uint16", layout)) as dst:
+        for row in range(0, size, WRITE_ROWS):
+            rows = min(WRITE_ROWS, size - row)
+            base = field[row:row + rows]
+            block = np.empty((INPUT_BANDS, rows, size), dtype=np.uint16)
+            for b in range(INPUT_BANDS):
+                noise = rng.normal(0, 60, base.shape).astype(np.float32)
+                block[b] = np.clip(base * gains[b] + 200 + noise, 1, 10000)
+            dst.write(block, window=Window(0, row, size, rows))
+    _finish(tmp_path, path, layout)
+
+
+def write_output(path, size=DEFAULT_SIZE, seed=DEFAULT_SEED, layout='tiled'):
+    """
+    Write a 2-band float32 model output: class (1-4) and uncertainty (0-1).
+
+    Classes follow a smooth "water level" field (land, water, cloud, flood
+    water), and uncertainty peaks at class boundaries.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    rng = np.random.default_rng(seed + 1)
+    level = _smooth_field(rng, (size, size), 128)
+    classes = np.digitize(level, CLASS_EDGES).astype(np.float32) + 1
+    distance = np.min(np.abs(level[None] - np.asarray(CLASS_EDGES)[:, None, None]), axis=0)
+    uncertainty = np.clip(1.0 - distance * 8 + rng.normal(0, 0.05, level.shape), 0, 1).astype(np.float32)
+
+    tmp_path = f"{path}.tmp.tif"
+    with rasterio.open(tmp_path, "w", **_profile(size, 2, "float32", layout)) as dst:
+        for row in range(0, size, WRITE_ROWS):
+            window = Window(0, row, size, min(WRITE_ROWS, size - row))
+            rows = slice(row, row + window.height)
+            dst.write(np.stack([classes[rows], uncertainty[rows]]), window=window)
+    _finish(tmp_path, path, layout)
+
+
+# ============================================================================
+# Basins
+# ============================================================================
+
+def footprint_bounds(size=DEFAULT_SIZE):
+    """Lon/lat bounds of the synthetic scene."""
+    from rasterio.warp import transform_bounds
+
+    left, top = ORIGIN
+    return transform_bounds(CRS, "EPSG:4326", left, top - size * PIXEL_SIZE, left + size * PIXEL_SIZE, top)
+
+
+def write_basins(path, bounds, n_basins=DEFAULT_BASINS, seed=DEFAULT_SEED):
+    """
+    Write a fake Level-12 basin layer: a jittered grid of dense polygons.
+
+    Each basin drains to its eastern neighbour (the last column drains to the
+    sea, NEXT_DOWN = 0), giving the topology module long upstream chains.
+
+    Returns:
+        int: HYBAS_ID of the basin at the center of `bounds`
+    """
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed + 2)
+    west, south, east, north = bounds[0] - BASIN_MARGIN, bounds[1] - BASIN_MARGIN, \
+        bounds[2] + BASIN_MARGIN, bounds[3] + BASIN_MARGIN
+    aspect = (east - west) / (north - south)
+    ny = max(1, int(round(np.sqrt(n_basins / aspect))))
+    nx = max(1, int(round(n_basins / ny)))
+    dx, dy = (east - west) / nx, (north - south) / ny
+
+    # Shared jittered grid vertices, so neighbouring basins tile without gaps
+    gx = west + dx * (np.arange(nx + 1)[None, :] + rng.uniform(-0.2, 0.2, (ny + 1, nx + 1)))
+    gy = south + dy * (np.arange(ny + 1)[:, None] + rng.uniform(-0.2, 0.2, (ny + 1, nx + 1)))
+    gx[:, 0], gx[:, -1], gy[0, :], gy[-1, :] = west, east, south, north
+
+    rings, ids, next_down = [], [], []
+    for j in range(ny):
+        for i in range(nx):
+            corners = [(gx[j, i], gy[j, i]), (gx[j, i + 1], gy[j, i + 1]),
+                       (gx[j + 1, i + 1], gy[j + 1, i + 1]), (gx[j + 1, i], gy[j + 1, i])]
+            rings.append(corners)
+            hybas_id = 5120000000 + (j * nx + i) * 10
+            ids.append(hybas_id)
+            next_down.append(hybas_id + 10 if i + 1 < nx else 0)
+
+    polygons = shapely.polygons(rings)
+    perimeter = shapely.length(polygons)
+    polygons = shapely.segmentize(polygons, perimeter.min() / BASIN_VERTICES)
+    gdf = gpd.GeoDataFrame(
+        {'HYBAS_ID': np.array(ids, dtype=np.int64), 'NEXT_DOWN': np.array(next_down, dtype=np.int64),
+         'SUB_AREA': np.round(rng.uniform(5, 50, len(ids)), 1)},
+        geometry=polygons, crs="EPSG:4326",
+    )
+    gdf.to_file(path, engine="pyogrio")
+    return int(ids[(ny // 2) * nx + nx // 2])
+
+
+# ============================================================================
+# Precipitation
+# ============================================================================
+
+def write_imerg(path, bounds, seed=DEFAULT_SEED):
+    """
+    Write an IMERG-like return-period NetCDF: one variable per period (mm/day),
+    increasing with the period, chunked so subsets touch only some chunks.
+
+    Requires an xarray NetCDF backend (netCDF4 or h5netcdf).
+    """
+    import xarray as xr
+
+    rng = np.random.default_rng(seed + 3)
+    west, south = np.floor(np.array(bounds[:2]) - IMERG_MARGIN)
+    east, north = np.ceil(np.array(bounds[2:]) + IMERG_MARGIN)
+    lats = np.round(np.arange(south, north, IMERG_RESOLUTION) + IMERG_RESOLUTION / 2, 3)
+    lons = np.round(np.arange(west, east, IMERG_RESOLUTION) + IMERG_RESOLUTION / 2, 3)
+    base = 40 + 60 * _smooth_field(rng, (lats.size, lons.size), 8)
+    data_vars = {
+        f"{years}yr": (("lat", "lon"), (base * (1 + 0.35 * np.log(years / 2))).astype(np.float32),
+                       {'units': 'mm/day', 'long_name': f"{years}-year return period daily precipitation"})
+        for years in RETURN_PERIODS
+    }
+    dataset = xr.Dataset(data_vars, coords={'lat': lats, 'lon': lons})
+    encoding = {name: {'chunksizes': (IMERG_CHUNK, IMERG_CHUNK), 'zlib': True} for name in data_vars}
+    dataset.to_netcdf(path, encoding=encoding)
+
+
+# ============================================================================
+# Scene
+# ============================================================================
+
+def make_fixtures(out_dir, size=DEFAULT_SIZE, n_basins=DEFAULT_BASINS, seed=DEFAULT_SEED,
+                  layout='tiled', force=False):
+    """
+    Generate the synthetic scene and its config, reusing files that exist.
+
+    Args:
+        out_dir: Fixture directory
+        size: Raster width and height in pixels
+        n_basins: Approximate number of basin polygons
+        seed: Random seed
+        layout: 'tiled', 'striped' (like many NAS GeoTIFFs) or 'cog'
+        force: Regenerate even if the files exist
+
+    Returns:
+        dict: Paths (input_path, output_path, watershed_path, config_path, imerg_path) and watershed_id
+    """
+    import yaml
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    os.makedirs(out_dir, exist_ok=True)
+    out_dir = os.path.abspath(out_dir)
+    scene = {
+        'input_path': os.path.join(out_dir, "input.tif"),
+        'output_path': os.path.join(out_dir, "output.tif"),
+        'watershed_path': os.path.join(out_dir, "basins.shp"),
+        'config_path': os.path.join(out_dir, "config.yaml"),
+        'imerg_path': os.path.join(out_dir, "imerg.nc"),
+    }
+
+    if force or not os.path.exists(scene['input_path']):
+        print(f"[BENCH] Writing {size}x{size} 13-band input ({layout}) ...")
+        write_input(scene['input_path'], size, seed, layout)
+    if force or not os.path.exists(scene['output_path']):
+        print(f"[BENCH] Writing {size}x{size} 2-band output ({layout}) ...")
+        write_output(scene['output_path'], size, seed, layout)
+
+    config = {}
+    if not force and os.path.exists(scene['config_path']):
+        with open(scene['config_path']) as f:
+            config = yaml.safe_load(f) or {}
+    watershed_id = (config.get('watershed') or {}).get('default_id')
+    if force or watershed_id is None or not os.path.exists(scene['watershed_path']):
+        print(f"[BENCH] Writing ~{n_basins} synthetic basins ...")
+        watershed_id = write_basins(scene['watershed_path'], footprint_bounds(size), n_basins, seed)
+
+    if force or not os.path.exists(scene['imerg_path']):
+        try:
+            write_imerg(scene['imerg_path'], footprint_bounds(size), seed)
+        except (ImportError, ValueError) as e:
+            print(f"[BENCH] Skipping IMERG fixture (no NetCDF backend): {e}")
+
+    config = {
+        'model': {'input_path': scene['input_path'], 'output_path': scene['output_path']},
+        'watershed': {'path': scene['watershed_path'], 'default_id': watershed_id},
+    }
+    if os.path.exists(scene['imerg_path']):
+        config['imerg'] = {'path': scene['imerg_path']}
+    with open(scene['config_path'], "w") as f:
+        yaml.safe_dump(config, f)
+    scene['watershed_id'] = watershed_id
+    return scene
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark fixtures")
+    parser.add_argument("out_dir")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Raster size in pixels")
+    parser.add_argument("--basins", type=int, default=DEFAULT_BASINS, help="Approximate basin count")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--layout", choices=LAYOUTS, default='tiled')
+    parser.add_argument("--force", action="store_true", help="Regenerate existing files")
+    args = parser.parse_args()
+
+    print(make_fixtures(args.out_dir, args.size, args.basins, args.seed, args.layout, args.force))
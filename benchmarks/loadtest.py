@@ -0,0 +1,209 @@
+"""
+Tile Server Load Test
+
+Serves the synthetic fixtures (see fixtures.py) from the real tile server and
+fetches tiles over HTTP from an increasing number of concurrent clients,
+alternating input and output layers as users panning split views do. For
+each render worker configuration (see src/tiles/workers.py) it reports
+throughput (tiles/s) and latency percentiles per concurrency level, e.g. to
+compare the serialized baseline (0 workers) with thread and process pools.
+
+Every request carries a distinct vmax and the tile cache starts empty, so
+each request measures a render rather than a cache lookup.
+
+Usage:
+    python -m benchmarks.loadtest [--configs 0 thread:4 process:4] [--concurrency 1 2 4 8 16]
+                                  [--requests 200] [--zoom 14] [--output load.json]
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import (DEFAULT_FIXTURE_ROOT, INPUT_STYLE, _git_revision, _redirect_caches,
+                            latency_percentiles)
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_CONFIGS = ("0", "thread:4", "process:4")
+DEFAULT_CONCURRENCY = (1, 2, 4, 8, 16)
+DEFAULT_REQUESTS = 200         # Requests per concurrency level
+DEFAULT_ZOOM = 14              # Native resolution of the 10 m fixtures
+REQUEST_TIMEOUT = 60.0         # Seconds per tile request
+
+
+# ============================================================================
+# Requests
+# ============================================================================
+
+def parse_config(text):
+    """
+    Parse a worker configuration: "0" (serialized), "4" (default mode) or "process:4".
+
+    Returns:
+        tuple: (workers, mode)
+    """
+    from src.tiles.workers import TILE_WORKER_MODE
+
+    mode, _, workers = str(text).rpartition(':')
+    return int(workers), mode or TILE_WORKER_MODE
+
+
+class TileRequests:
+    """
+    Endless sequence of cache-missing tile URLs over the fixture footprint.
+
+    Args:
+        templates: (URL template without vmax, base vmax) per layer
+        tiles: (z, x, y) tuples to cycle through
+    """
+
+    def __init__(self, templates, tiles):
+        self.templates = templates
+        self.tiles = tiles
+        self.count = 0
+
+    def take(self, n):
+        urls = []
+        for _ in range(n):
+            i = self.count
+            self.count += 1
+            template, vmax = self.templates[i % len(self.templates)]
+            z, x, y = self.tiles[(i // len(self.templates)) % len(self.tiles)]
+            # A vmax offset that never repeats gives every request its own cache key
+            urls.append(template.format(z=z, x=x, y=y) + f"&vmax={vmax + i * 1e-6:.6f}")
+        return urls
+
+
+def _fetch(url):
+    """Latency in seconds, or None when the request failed."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+    except (urllib.error.URLError, OSError):
+        return None
+    return time.perf_counter() - start
+
+
+def run_level(urls, concurrency):
+    """
+    Fetch URLs from `concurrency` client threads.
+
+    Returns:
+        dict: tiles/s, latency percentiles (seconds) and error count
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(_fetch, urls))
+    elapsed = time.perf_counter() - start
+    ok = [latency for latency in latencies if latency is not None]
+    result = {'concurrency': concurrency, 'tiles_per_s': len(ok) / elapsed, 'errors': len(urls) - len(ok)}
+    if ok:
+        result.update(latency_percentiles(ok))
+    return result
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def run_load_test(configs=DEFAULT_CONFIGS, concurrency=DEFAULT_CONCURRENCY, n_requests=DEFAULT_REQUESTS,
+                  zoom=DEFAULT_ZOOM, size=2048, n_basins=4000, fixture_root=DEFAULT_FIXTURE_ROOT):
+    """
+    Serve the fixtures and measure every worker configuration at every concurrency level.
+
+    Must run before any `src` module is imported (see run.run_benchmarks()).
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    from benchmarks.fixtures import footprint_bounds, make_fixtures
+
+    fixture_dir = os.path.abspath(os.path.join(fixture_root, f"tiled-{size}-{n_basins}-0"))
+    _redirect_caches(fixture_dir)
+    scene = make_fixtures(fixture_dir, size=size, n_basins=n_basins, layout='tiled')
+    # An empty tile cache, so requests of an earlier run do not hit
+    tile_cache_dir = tempfile.mkdtemp(prefix="loadtest-tiles-")
+    os.environ['TILE_CACHE_DIR'] = tile_cache_dir
+
+    from src.step2.app import UNCERTAINTY_COLORMAP
+    from src.tiles import workers as tile_workers
+    from src.tiles.pool import get_tile_pool
+    from src.tiles.prewarm import enumerate_tiles, served_path
+
+    pool = get_tile_pool(host='127.0.0.1', port=0)
+    # The optimized copies the app would serve (see src/tiles/cogify.py)
+    input_client = pool.acquire(served_path(scene['input_path']))
+    output_client = pool.acquire(served_path(scene['output_path']))
+    input_style = {k: v for k, v in INPUT_STYLE.items() if k != 'vmax'}
+    requests = TileRequests([
+        (input_client.get_tile_url(**input_style), INPUT_STYLE['vmax']),
+        (output_client.get_tile_url(indexes=2, colormap=UNCERTAINTY_COLORMAP, vmin=0.0), 1.0),
+    ], enumerate_tiles(footprint_bounds(size), [zoom]))
+
+    results = {}
+    try:
+        for config in configs:
+            workers, mode = parse_config(config)
+            label = f"{mode}:{workers}" if workers else "serialized"
+            tile_workers.configure_tile_workers(workers, mode)
+            # Untimed warm-up: start worker processes and open their dataset handles
+            run_level(requests.take(max(2, 2 * workers)), max(1, workers))
+            results[label] = []
+            for level in concurrency:
+                result = run_level(requests.take(n_requests), level)
+                results[label].append(result)
+                print(f"[BENCH] {label:<12} concurrency {level:>3}: {result['tiles_per_s']:7.1f} tiles/s, "
+                      f"p95 {result.get('p95', float('nan')) * 1000:7.1f} ms, {result['errors']} errors")
+    finally:
+        tile_workers.configure_tile_workers(0)
+        pool.release(input_client)
+        pool.release(output_client)
+        pool.shutdown()
+        shutil.rmtree(tile_cache_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'cpu_count': os.cpu_count(),
+            'gdal_cachemax_mb': tile_workers.TILE_GDAL_CACHEMAX_MB,
+            'gdal_num_threads': tile_workers.TILE_GDAL_NUM_THREADS,
+        },
+        'fixture': {'size': size, 'basins': n_basins, 'zoom': zoom, 'requests_per_level': n_requests},
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test the tile server under concurrent clients")
+    parser.add_argument("--configs", nargs="+", default=list(DEFAULT_CONFIGS),
+                        help="Render worker configurations: 0 (serialized), N, thread:N or process:N")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY))
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Requests per concurrency level")
+    parser.add_argument("--zoom", type=int, default=DEFAULT_ZOOM)
+    parser.add_argument("--size", type=int, default=2048, help="Fixture raster size in pixels")
+    parser.add_argument("--basins", type=int, default=4000, help="Fixture basin count")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURE_ROOT, help="Fixture root directory")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    report = run_load_test(args.configs, args.concurrency, args.requests, args.zoom, args.size, args.basins,
+                           args.fixtures)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"[BENCH] Results written to {args.output}")
+    else:
+        print(text)
@@ -0,0 +1,356 @@
+"""
+Benchmark Runner
+
+Times the hot paths of the app against synthetic fixtures (see fixtures.py)
+and writes the results as JSON, so runs can be compared across commits:
+
+- `validate_inputs` (eager and windowed)
+- `check_uncertainty_range` (cold: statistics scan, warm: cached sidecar)
+- `get_candidate_watersheds` (cold and memoized)
+- `_create_watershed_layer`
+- Tile render latency percentiles per layer and zoom (uncached renders)
+
+Every cache the app writes (basin store, statistics, tiles, COGs) is
+redirected into the fixture directory, and cold timings clear the relevant
+cache first, so the configured scene and its caches are never touched.
+
+Usage:
+    python -m benchmarks.run [--size 2048] [--basins 4000] [--zooms 10 12 14]
+                             [--tiles 40] [--repeat 3] [--output results.json]
+    python -m benchmarks.run --compare base.json head.json
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_FIXTURE_ROOT = os.path.join("dataset", "cache", "benchmarks")
+DEFAULT_ZOOMS = (10, 12, 14)
+DEFAULT_TILES = 40             # Tiles sampled per layer and zoom
+DEFAULT_REPEAT = 3
+PERCENTILES = (50, 90, 95, 99)
+INPUT_STYLE = {'indexes': [4, 3, 2], 'vmin': 0, 'vmax': 3000}
+
+
+# ============================================================================
+# Timing Helpers
+# ============================================================================
+
+def _summary(samples):
+    """Summarize timings in seconds."""
+    return {
+        'runs': len(samples),
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'max': max(samples),
+    }
+
+
+def timeit(fn, repeat=DEFAULT_REPEAT, setup=None):
+    """
+    Time a callable `repeat` times.
+
+    Args:
+        fn: Callable under test
+        repeat: Number of timed runs
+        setup: Optional callable run (untimed) before each run, e.g. to clear caches
+
+    Returns:
+        dict: min/median/mean/max seconds
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+
+def latency_percentiles(samples):
+    """Percentiles (seconds) of per-call latencies."""
+    values = np.asarray(samples)
+    result = {f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}
+    result.update(count=len(samples), mean=float(values.mean()), max=float(values.max()))
+    return result
+
+
+def _quiet(fn):
+    """Run fn with stdout suppressed (the app logs every step)."""
+    import contextlib
+    import io
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+# ============================================================================
+# Benchmarks
+# ============================================================================
+
+def bench_validation(scene, repeat):
+    from src.validator import validate_inputs
+
+    results = {}
+    for mode in ("eager", "windowed"):
+        def run(mode=mode):
+            data_in, data_out = validate_inputs(scene['input_path'], scene['output_path'], mode=mode)
+            # Eager mode is only complete once the arrays are loaded
+            if mode == "eager":
+                data_in.load(), data_out.load()
+        results[mode] = timeit(_quiet(run), repeat)
+    return results
+
+
+def bench_uncertainty_range(scene, repeat):
+    import rioxarray
+
+    from src.raster_stats import sidecar_path
+    from src.validator import check_uncertainty_range
+
+    path = scene['output_path']
+    da = rioxarray.open_rasterio(path, masked=True, cache=False).sel(band=[2])
+
+    def clear():
+        if sidecar_path(path).exists():
+            os.remove(sidecar_path(path))
+
+    run = _quiet(lambda: check_uncertainty_range(da, path))
+    return {'cold': timeit(run, repeat, setup=clear), 'warm': timeit(run, repeat)}
+
+
+def bench_candidate_watersheds(repeat, cache_dirs):
+    from src.step1 import utils
+
+    def clear():
+        utils._find_candidates.cache_clear()
+        from src.hydrobasins import store
+        store._get_store.cache_clear()
+        shutil.rmtree(cache_dirs['basins'], ignore_errors=True)
+
+    def clear_memo():
+        utils._find_candidates.cache_clear()
+
+    run = _quiet(utils.get_candidate_watersheds)
+    results = {
+        'cold_store': timeit(run, repeat, setup=clear),
+        'indexed': timeit(run, repeat, setup=clear_memo),
+        'memoized': timeit(run, repeat),
+    }
+    results['candidates'] = len(_quiet(utils.get_candidate_watersheds)()[0])
+    return results
+
+
+def bench_watershed_layer(repeat):
+    from src.step2.app import _create_watershed_layer
+
+    layer = _quiet(_create_watershed_layer)()
+    if layer is None:
+        return {'error': "no watershed layer created"}
+    return timeit(_quiet(_create_watershed_layer), repeat)
+
+
+def bench_tiles(scene, zooms, n_tiles):
+    """Uncached render latency per layer and zoom, over tiles sampled in the footprint."""
+    from localtileserver.tiler import format_to_encoding, get_reader, get_tile
+    from rio_tiler.errors import TileOutsideBounds
+
+    from benchmarks.fixtures import footprint_bounds
+    from src.step2.app import output_layer_style
+    from src.tiles import bandmath
+    from src.tiles.prewarm import enumerate_tiles
+
+    layers = {
+        'input': (scene['input_path'], INPUT_STYLE),
+        'classification': (scene['output_path'], output_layer_style("Flood Classification", None)),
+        'uncertainty': (scene['output_path'], output_layer_style("Uncertainty", 1.0)),
+        'flood_mask': (scene['output_path'], output_layer_style("Flood Mask", 0.5)),
+    }
+    img_format = format_to_encoding('png')
+    rng = np.random.default_rng(0)
+    bounds = footprint_bounds(scene['size'])
+    results = {}
+    for name, (path, style) in layers.items():
+        style = {k: v for k, v in style.items() if k != 'name'}
+        if 'expression' in style:
+            # Band-math mask: one two-band read plus the expression, as served
+            def render(reader, z, x, y, expression=style['expression'], threshold=style['threshold']):
+                bands = reader.tile(x, y, z, indexes=bandmath.MASK_INDEXES, resampling_method="nearest").array
+                return bandmath.render_mask(bands, expression, threshold, img_format)
+        else:
+            def render(reader, z, x, y, style=style):
+                return get_tile(reader, z, x, y, img_format=img_format, **style)
+        reader = get_reader(path)
+        try:
+            results[name] = {}
+            for z in zooms:
+                tiles = enumerate_tiles(bounds, [z])
+                if len(tiles) > n_tiles:
+                    tiles = [tiles[i] for i in sorted(rng.choice(len(tiles), n_tiles, replace=False))]
+                samples = []
+                for _, x, y in tiles:
+                    start = time.perf_counter()
+                    try:
+                        render(reader, z, x, y)
+                    except TileOutsideBounds:
+                        continue
+                    samples.append(time.perf_counter() - start)
+                results[name][str(z)] = latency_percentiles(samples) if samples else {'count': 0}
+        finally:
+            reader.close()
+    return results
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _redirect_caches(fixture_dir):
+    """Point every app cache at the fixture directory (before src modules are imported)."""
+    cache_dirs = {
+        'basins': os.path.join(fixture_dir, "cache", "hydrobasins"),
+        'stats': os.path.join(fixture_dir, "cache", "stats"),
+        'tiles': os.path.join(fixture_dir, "cache", "tiles"),
+        'cog': os.path.join(fixture_dir, "cache", "cog"),
+    }
+    for path in cache_dirs.values():
+        os.makedirs(path, exist_ok=True)
+    os.environ['FLOOD_CONFIG'] = os.path.join(fixture_dir, "config.yaml")
+    os.environ['BASIN_STORE_DIR'] = cache_dirs['basins']
+    os.environ['STATS_CACHE_DIR'] = cache_dirs['stats']
+    os.environ['TILE_CACHE_DIR'] = cache_dirs['tiles']
+    os.environ['COG_CACHE_DIR'] = cache_dirs['cog']
+    return cache_dirs
+
+
+def run_benchmarks(size, n_basins, layout='tiled', zooms=DEFAULT_ZOOMS, n_tiles=DEFAULT_TILES,
+                   repeat=DEFAULT_REPEAT, fixture_root=DEFAULT_FIXTURE_ROOT, seed=0):
+    """
+    Generate (or reuse) fixtures and run every benchmark.
+
+    Must run before any `src` module is imported, since cache locations and
+    the config path are read from the environment at import time.
+
+    Returns:
+        dict: JSON-serializable results with run metadata
+    """
+    from benchmarks.fixtures import make_fixtures
+
+    fixture_dir = os.path.abspath(os.path.join(fixture_root, f"{layout}-{size}-{n_basins}-{seed}"))
+    cache_dirs = _redirect_caches(fixture_dir)
+    scene = make_fixtures(fixture_dir, size=size, n_basins=n_basins, seed=seed, layout=layout)
+    scene['size'] = size
+
+    stages = [
+        ("validate_inputs", lambda: bench_validation(scene, repeat)),
+        ("check_uncertainty_range", lambda: bench_uncertainty_range(scene, repeat)),
+        ("get_candidate_watersheds", lambda: bench_candidate_watersheds(repeat, cache_dirs)),
+        ("create_watershed_layer", lambda: bench_watershed_layer(repeat)),
+        ("tile_render", lambda: bench_tiles(scene, zooms, n_tiles)),
+    ]
+    results = {}
+    for name, stage in stages:
+        print(f"[BENCH] {name} ...")
+        start = time.perf_counter()
+        results[name] = stage()
+        print(f"[BENCH] {name} done in {time.perf_counter() - start:.1f}s")
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'fixture': {'size': size, 'basins': n_basins, 'layout': layout, 'seed': seed,
+                    'zooms': list(zooms), 'tiles_per_zoom': n_tiles, 'repeat': repeat},
+        'results': results,
+    }
+
+
+def _flatten(results, prefix=""):
+    """Flatten nested results to {"a.b.median": value} for comparison."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(base_path, head_path, metrics=('median', 'p50', 'p95')):
+    """
+    Print the relative change of timing metrics between two result files.
+
+    Returns:
+        list: (name, base, head, ratio) rows
+    """
+    with open(base_path) as f:
+        base = _flatten(json.load(f)['results'])
+    with open(head_path) as f:
+        head = _flatten(json.load(f)['results'])
+    rows = []
+    for name in sorted(base.keys() & head.keys()):
+        if name.rsplit(".", 1)[-1] in metrics and base[name] > 0:
+            rows.append((name, base[name], head[name], head[name] / base[name]))
+    for name, b, h, ratio in rows:
+        print(f"{name:<60} {b * 1000:10.2f}ms {h * 1000:10.2f}ms {ratio:6.2f}x")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from benchmarks.fixtures import DEFAULT_BASINS, DEFAULT_SIZE, LAYOUTS
+
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Raster size in pixels")
+    parser.add_argument("--basins", type=int, default=DEFAULT_BASINS, help="Approximate basin count")
+    parser.add_argument("--layout", choices=LAYOUTS, default='tiled')
+    parser.add_argument("--zooms", type=int, nargs="+", default=list(DEFAULT_ZOOMS))
+    parser.add_argument("--tiles", type=int, default=DEFAULT_TILES, help="Tiles sampled per layer and zoom")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURE_ROOT, help="Fixture root directory")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    report = run_benchmarks(args.size, args.basins, args.layout, args.zooms, args.tiles,
+                            args.repeat, args.fixtures)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"[BENCH] Results written to {args.output}")
+    else:
+        print(text)
@@ -0,0 +1,242 @@
+"""
+Concurrent Session Load Test
+
+Simulates N browser sessions of the Step 2 page against the synthetic
+fixtures (see fixtures.py), each in its own Solara kernel context, and
+reports:
+
+- Memory per session: RSS growth and live widgets after all sessions render
+- Update latency: concurrent layer-mode toggles (immediate) and threshold
+  changes (debounced), measured until the output layer URL changes
+- Memory released by idle teardown (see src/step2/sessions.py)
+
+Usage:
+    python -m benchmarks.sessions [--sessions 20] [--updates 10] [--output sessions.json]
+"""
+
+import gc
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.run import DEFAULT_FIXTURE_ROOT, _git_revision, _redirect_caches, latency_percentiles
+
+DEFAULT_SESSIONS = 10
+DEFAULT_UPDATES = 10           # Updates of each kind per session
+UPDATE_TIMEOUT = 10.0          # Seconds to wait for an update to reach the layer
+
+
+def _rss_mb():
+    """Resident set size of this process in MB (Linux), or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _measure_memory():
+    gc.collect()
+    return _rss_mb()
+
+
+def _scope_state_per_kernel():
+    """
+    Make Solara keep reactive state per kernel context, as under its server.
+
+    Outside `solara run` (detected from the server modules or the program
+    name) every reactive lives in one global scope shared by all sessions.
+    """
+    sys.argv[0] = "solara"
+
+
+def _live_widgets():
+    from ipywidgets.widgets.widget import _instances
+
+    return _instances
+
+
+class SimulatedSession:
+    """
+    One Step 2 page rendered in a private kernel context.
+
+    Reactive state is per context, as with real sessions. Widgets live in the
+    process-wide ipywidgets registry here, so a session's widgets are the
+    ones its render added.
+    """
+
+    def __init__(self, index):
+        _scope_state_per_kernel()
+        import ipyleaflet
+        import solara
+        from solara.server import kernel, kernel_context
+
+        from src.step2 import app
+
+        self.context = kernel_context.VirtualKernelContext(
+            id=f"bench-{index}", kernel=kernel.Kernel(), session_id=f"bench-session-{index}"
+        )
+        before = set(_live_widgets())
+        with self.context:
+            self.box, self.rc = solara.render(app.Page(), handle_error=False)
+        self.widget_ids = set(_live_widgets()) - before
+        self.map = next(w for w in map(_live_widgets().get, self.widget_ids) if isinstance(w, ipyleaflet.Map))
+
+    def output_layer(self):
+        for layer in self.map.layers:
+            if getattr(layer, 'name', None) in ("Classification", "Uncertainty", "Flood Mask"):
+                return layer
+        return None
+
+    def _wait_for_url(self, before, start):
+        deadline = start + UPDATE_TIMEOUT
+        while time.perf_counter() < deadline:
+            layer = self.output_layer()
+            if layer is not None and layer.url != before:
+                return time.perf_counter() - start
+            time.sleep(0.002)
+        return None
+
+    def update(self, reactive, value):
+        """Set a reactive in this session; seconds until the output layer URL changed."""
+        layer = self.output_layer()
+        before = layer.url if layer is not None else None
+        start = time.perf_counter()
+        with self.context:
+            reactive.set(value)
+        return self._wait_for_url(before, start)
+
+    def widget_count(self):
+        """Widgets from this session's first render that are still open."""
+        return len(self.widget_ids & set(_live_widgets()))
+
+    def close(self):
+        # Unmounting runs the page's cleanups (context.close() would close every
+        # widget in the process without solara's server patches)
+        with self.context:
+            self.rc.close()
+
+
+def _run_updates(session, n_updates, results):
+    """Alternate layer modes, then move the threshold, recording latencies."""
+    from src.step2 import app
+
+    modes, thresholds = [], []
+    for i in range(n_updates):
+        modes.append(session.update(app.map_layer_mode, "Uncertainty" if i % 2 == 0 else "Flood Classification"))
+    session.update(app.map_layer_mode, "Uncertainty")
+    for i in range(n_updates):
+        thresholds.append(session.update(app.uncertainty_threshold, round(0.3 + 0.05 * (i % 10), 2)))
+        # Let the debounce fire so the next change is measured on its own
+        time.sleep(0.05)
+    results.append((modes, thresholds))
+
+
+def run_sessions(n_sessions=DEFAULT_SESSIONS, n_updates=DEFAULT_UPDATES, size=2048, n_basins=4000,
+                 fixture_root=DEFAULT_FIXTURE_ROOT):
+    """
+    Render sessions, drive concurrent updates, then tear them down as idle.
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    from benchmarks.fixtures import make_fixtures
+
+    fixture_dir = os.path.abspath(os.path.join(fixture_root, f"tiled-{size}-{n_basins}-0"))
+    _redirect_caches(fixture_dir)
+    os.environ['SESSION_IDLE_TIMEOUT'] = str(3600)
+    make_fixtures(fixture_dir, size=size, n_basins=n_basins, layout='tiled')
+
+    from src.step2 import app
+    from src.step2.sessions import get_session_tracker
+
+    # Warm process-wide caches with one throwaway session
+    SimulatedSession(-1).close()
+    baseline = _measure_memory()
+
+    print(f"[BENCH] Rendering {n_sessions} sessions ...")
+    render_times, sessions = [], []
+    for i in range(n_sessions):
+        start = time.perf_counter()
+        sessions.append(SimulatedSession(i))
+        render_times.append(time.perf_counter() - start)
+    loaded = _measure_memory()
+    widgets = [s.widget_count() for s in sessions]
+
+    print(f"[BENCH] Driving {n_updates} updates of each kind in {n_sessions} concurrent sessions ...")
+    results = []
+    threads = [threading.Thread(target=_run_updates, args=(s, n_updates, results)) for s in sessions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    modes = [v for r in results for v in r[0] if v is not None]
+    thresholds = [v for r in results for v in r[1] if v is not None]
+    missed = sum(v is None for r in results for v in (*r[0], *r[1]))
+
+    print("[BENCH] Tearing down idle sessions ...")
+    tracker = get_session_tracker()
+    torn_down = tracker.sweep(now=time.monotonic() + tracker.idle_timeout + 1)
+    suspended = sum(1 for s in sessions if _suspended(s, app))
+    after_teardown = _measure_memory()
+    widgets_after = [s.widget_count() for s in sessions]
+
+    for s in sessions:
+        s.close()
+
+    per_session = (loaded - baseline) / n_sessions if baseline is not None else None
+    return {
+        'meta': {'revision': _git_revision(), 'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 'python': sys.version.split()[0], 'cpu_count': os.cpu_count()},
+        'params': {'sessions': n_sessions, 'updates': n_updates, 'size': size, 'basins': n_basins},
+        'results': {
+            'render_seconds': latency_percentiles(render_times),
+            'memory': {
+                'baseline_rss_mb': baseline,
+                'loaded_rss_mb': loaded,
+                'per_session_rss_mb': per_session,
+                'after_teardown_rss_mb': after_teardown,
+                'widgets_per_session': float(np.mean(widgets)),
+                'widgets_per_session_after_teardown': float(np.mean(widgets_after)),
+            },
+            'layer_mode_update_seconds': latency_percentiles(modes) if modes else None,
+            'threshold_update_seconds': latency_percentiles(thresholds) if thresholds else None,
+            'missed_updates': missed,
+            'torn_down': torn_down,
+            'suspended': suspended,
+        },
+    }
+
+
+def _suspended(session, app):
+    with session.context:
+        return app.session_suspended.value
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate concurrent Step 2 sessions")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS)
+    parser.add_argument("--updates", type=int, default=DEFAULT_UPDATES, help="Updates of each kind per session")
+    parser.add_argument("--size", type=int, default=2048, help="Fixture raster size in pixels")
+    parser.add_argument("--basins", type=int, default=4000, help="Fixture basin count")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURE_ROOT, help="Fixture root directory")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    report = run_sessions(args.sessions, args.updates, args.size, args.basins, args.fixtures)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"[BENCH] Results written to {args.output}")
+    else:
+        print(text)
@@ -0,0 +1,309 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# Columns of the results table, in order
+RESULT_FIELDS = [
+    "scene_id", "status", "error", "input_path", "output_path",
+    "crs_match", "grid_match", "width", "height",
+    "uncertainty_min", "uncertainty_max", "uncertainty_mean", "uncertainty_std",
+    "uncertainty_normalized", "nan_count", "class_counts",
+    "watershed_id", "watershed_candidates",
+    "input_thumbnail", "output_thumbnail", "seconds",
+]
+DEFAULT_OUTPUT_SUFFIX = "_output_EDL"
+DEFAULT_MEMORY_MB = 512
+THUMBNAIL_SIZE = 512
+# Classification palette for thumbnails (class value -> RGB); unknown classes are grey
+CLASS_PALETTE = {
+    0: (0, 0, 0),
+    1: (139, 90, 43),
+    2: (0, 92, 230),
+    3: (220, 220, 220),
+    4: (0, 200, 255),
+}
+
+def discover_scenes(input_dir: str, output_dir: str, output_suffix: str = DEFAULT_OUTPUT_SUFFIX) -> list[dict]:
+    """
+    Pairs scenes by file stem: `<input_dir>/<id>.tif` with `<output_dir>/<id><suffix>.tif`.
+
+    Matches the WorldFloods layout (`S2/<scene>.tif` and EDL `<scene>_output_EDL.tif`).
+    Inputs without an output are skipped with a warning.
+    """
+    scenes = []
+    for input_path in sorted(Path(input_dir).glob("*.tif")):
+        output_path = Path(output_dir) / f"{input_path.stem}{output_suffix}.tif"
+        if not output_path.exists():
+            print(f"Warning: no output for {input_path.name} (expected {output_path.name})")
+            continue
+        scenes.append({"scene_id": input_path.stem, "input_path": str(input_path), "output_path": str(output_path)})
+    return scenes
+
+def read_manifest(path: str) -> list[dict]:
+    """
+    Reads a CSV manifest with columns input_path, output_path and optional scene_id.
+
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = Path(path).parent
+    scenes = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            input_path = base / row["input_path"]
+            output_path = base / row["output_path"]
+            scene_id = row.get("scene_id") or input_path.stem
+            scenes.append({"scene_id": scene_id, "input_path": str(input_path), "output_path": str(output_path)})
+    return scenes
+
+def completed_scenes(results_path: str) -> set:
+    """Scene IDs already processed successfully (for resuming)."""
+    if not Path(results_path).exists():
+        return set()
+    with open(results_path, newline="") as f:
+        return {row["scene_id"] for row in csv.DictReader(f) if row.get("status") == "ok"}
+
+def _class_counts(path: str, band: int, block_budget_mb: float) -> dict:
+    """Per-class pixel counts of a classification band, streamed in row strips."""
+    import numpy as np
+    from rasterio.windows import Window
+
+    from src.read_cache import open_raster
+
+    counts = np.zeros(0, dtype=np.int64)
+    with open_raster(path) as src:
+        row_bytes = src.width * np.dtype(src.dtypes[band - 1]).itemsize
+        rows = max(1, int(block_budget_mb * 1024 * 1024 // row_bytes))
+        for row in range(0, src.height, rows):
+            data = src.read(band, window=Window(0, row, src.width, min(rows, src.height - row)), masked=True)
+            values = np.ma.compressed(data)
+            values = values[np.isfinite(values)].astype(np.int64) if values.dtype.kind == "f" else values.astype(np.int64)
+            values = values[values >= 0]
+            if values.size:
+                block = np.bincount(values)
+                if block.size > counts.size:
+                    counts = np.pad(counts, (0, block.size - counts.size))
+                counts[:block.size] += block
+    return {int(c): int(n) for c, n in enumerate(counts) if n}
+
+def _best_watershed(input_path: str, shp_path: str) -> tuple:
+    """The candidate basin with the largest overlap with the footprint, and the candidate count."""
+    import shapely
+    from src.step1.utils import find_candidate_watersheds, raster_footprint
+
+    gdf, _ = find_candidate_watersheds(input_path, shp_path)
+    if gdf.empty:
+        return None, 0
+    # Degree areas are only compared with each other, so no projection is needed
+    overlap = shapely.area(shapely.intersection(gdf.geometry.values, raster_footprint(input_path)))
+    return int(gdf.iloc[int(overlap.argmax())]["HYBAS_ID"]), len(gdf)
+
+def _write_png(path: Path, rgb) -> str:
+    import warnings
+    import rasterio
+    from rasterio.errors import NotGeoreferencedWarning
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        dst = rasterio.open(path, "w", driver="PNG", width=rgb.shape[2], height=rgb.shape[1],
+                            count=3, dtype="uint8")
+    with dst:
+        dst.write(rgb)
+    return str(path)
+
+def _thumbnail_shape(src, size: int) -> tuple:
+    scale = max(1.0, max(src.width, src.height) / size)
+    return max(1, int(src.height / scale)), max(1, int(src.width / scale))
+
+def render_thumbnails(scene: dict, thumbnail_dir: str, size: int = THUMBNAIL_SIZE) -> tuple[str, str]:
+    """
+    Writes a true-color input PNG and a classification PNG for a scene.
+
+    Both come from decimated reads (served from overviews when present), so
+    cost does not scale with scene size.
+    """
+    import numpy as np
+    from rasterio.enums import Resampling
+
+    from src.read_cache import open_raster
+
+    target = Path(thumbnail_dir)
+    with open_raster(scene["input_path"]) as src:
+        # True color from the 13-band stack; first band as grey for other inputs
+        bands = [4, 3, 2] if src.count >= 4 else [1, 2, 3] if src.count == 3 else [1, 1, 1]
+        data = src.read(bands, out_shape=(3, *_thumbnail_shape(src, size)),
+                        masked=True, resampling=Resampling.average).astype(np.float32)
+    rgb = np.zeros(data.shape, dtype=np.uint8)
+    for i, band in enumerate(data):
+        valid = np.ma.compressed(band)
+        valid = valid[np.isfinite(valid)]
+        if valid.size:
+            lo, hi = np.percentile(valid, (2, 98))
+            rgb[i] = np.clip((np.ma.filled(band, lo) - lo) / max(hi - lo, 1e-6) * 255, 0, 255).astype(np.uint8)
+    input_png = _write_png(target / f"{scene['scene_id']}_input.png", rgb)
+
+    with open_raster(scene["output_path"]) as src:
+        classes = src.read(1, out_shape=_thumbnail_shape(src, size), masked=True, resampling=Resampling.nearest)
+    classes = np.ma.filled(classes.astype(np.float32), 0)
+    classes = np.nan_to_num(classes).astype(np.int64)
+    rgb = np.full((3, *classes.shape), 128, dtype=np.uint8)
+    for value, color in CLASS_PALETTE.items():
+        rgb[:, classes == value] = np.array(color, dtype=np.uint8)[:, None]
+    output_png = _write_png(target / f"{scene['scene_id']}_output.png", rgb)
+    return input_png, output_png
+
+def process_scene(scene: dict, shp_path: str | None = None, thumbnail_dir: str | None = None,
+                  memory_mb: float = DEFAULT_MEMORY_MB) -> dict:
+    """
+    Validates, measures and matches one scene pair. Runs in a worker process.
+
+    Memory is bounded by memory_mb: half goes to GDAL's block cache and half
+    to the read windows of the statistics passes.
+
+    Returns:
+        dict: One results row (status "ok" or "error")
+    """
+    import rasterio
+    from src.validator import check_alignment, check_uncertainty_range, validate_inputs
+    from src.raster_stats import compute_band_stats
+
+    start = time.perf_counter()
+    row = {"scene_id": scene["scene_id"], "input_path": scene["input_path"], "output_path": scene["output_path"]}
+    block_budget_mb = memory_mb / 2
+    try:
+        with rasterio.Env(GDAL_CACHEMAX=int(memory_mb / 2)):
+            # Validation: metadata-only checks and lazy arrays (no full-scene reads)
+            alignment = check_alignment(scene["input_path"], scene["output_path"])
+            _, data_out = validate_inputs(scene["input_path"], scene["output_path"], mode="windowed")
+            row.update(crs_match=alignment["crs_match"], grid_match=alignment["grid_match"],
+                       width=data_out.rio.width, height=data_out.rio.height)
+
+            # Statistics: uncertainty band (streamed, cached in the sidecar) and class counts
+            uncertainty = compute_band_stats(scene["output_path"], band=2, block_budget_mb=block_budget_mb)
+            band_unc = data_out.sel(band=[2])
+            checked = check_uncertainty_range(band_unc, path=scene["output_path"])
+            row.update(uncertainty_min=uncertainty["min"], uncertainty_max=uncertainty["max"],
+                       uncertainty_mean=uncertainty["mean"], uncertainty_std=uncertainty["std"],
+                       uncertainty_normalized=checked is not band_unc,
+                       nan_count=uncertainty["nan_count"],
+                       class_counts=json.dumps(_class_counts(scene["output_path"], 1, block_budget_mb)))
+
+            if shp_path:
+                row["watershed_id"], row["watershed_candidates"] = _best_watershed(scene["input_path"], shp_path)
+            if thumbnail_dir:
+                row["input_thumbnail"], row["output_thumbnail"] = render_thumbnails(scene, thumbnail_dir)
+        row["status"] = "ok"
+    except Exception as e:
+        row.update(status="error", error=f"{type(e).__name__}: {e}")
+        traceback.print_exc()
+    row["seconds"] = round(time.perf_counter() - start, 2)
+    return row
+
+def _append_row(results_path: str, row: dict):
+    path = Path(results_path)
+    new_file = not path.exists() or path.stat().st_size == 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+def write_parquet(results_path: str) -> str | None:
+    """Converts the CSV results table to Parquet (needs pyarrow); keeps only the latest row per scene."""
+    import pandas as pd
+
+    table = pd.read_csv(results_path).drop_duplicates("scene_id", keep="last")
+    parquet_path = str(Path(results_path).with_suffix(".parquet"))
+    try:
+        table.to_parquet(parquet_path, index=False)
+    except ImportError as e:
+        print(f"Warning: Parquet output unavailable ({e}); results remain in {results_path}")
+        return None
+    return parquet_path
+
+def run_batch(scenes: list[dict], results_path: str, shp_path: str | None = None,
+              thumbnail_dir: str | None = None, workers: int = 1,
+              memory_mb: float = DEFAULT_MEMORY_MB, resume: bool = True) -> dict:
+    """
+    Processes scene pairs across a process pool and appends rows to a CSV results table.
+
+    Rows are written as each scene finishes, so an interrupted run loses at
+    most the scenes in flight; with resume=True, scenes already recorded as
+    "ok" are skipped. Workers are recycled after every scene so per-worker
+    memory does not accumulate.
+
+    Args:
+        scenes: Dicts with scene_id, input_path, output_path
+        results_path: CSV results table (appended to)
+        shp_path: HydroBASINS shapefile for watershed matching (skipped if None)
+        thumbnail_dir: Directory for PNG thumbnails (skipped if None)
+        workers: Worker processes
+        memory_mb: Memory budget per worker for GDAL cache and read windows
+        resume: Skip scenes already completed in results_path
+
+    Returns:
+        dict: Counts of ok, error and skipped scenes, and elapsed seconds
+    """
+    done = completed_scenes(results_path) if resume else set()
+    pending = [s for s in scenes if s["scene_id"] not in done]
+    print(f"Batch: {len(scenes)} scenes, {len(scenes) - len(pending)} already done, {len(pending)} to process")
+
+    summary = {"ok": 0, "error": 0, "skipped": len(scenes) - len(pending)}
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context, max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(process_scene, scene, shp_path, thumbnail_dir, memory_mb): scene
+            for scene in pending
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            scene = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                # Worker crashed (e.g. killed for memory): record and continue
+                row = {**scene, "status": "error", "error": f"{type(e).__name__}: {e}"}
+            _append_row(results_path, row)
+            summary[row["status"]] += 1
+            elapsed = time.perf_counter() - start
+            print(f"[{i}/{len(pending)}] {row['scene_id']}: {row['status']} "
+                  f"({row.get('seconds', '-')}s, {i / elapsed:.2f} scenes/s)")
+    summary["elapsed"] = round(time.perf_counter() - start, 2)
+    print(f"Batch finished: {summary}")
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate, measure and match many flood scenes")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV with input_path, output_path[, scene_id]")
+    source.add_argument("--input-dir", help="Directory of input scenes (paired with --output-dir)")
+    parser.add_argument("--output-dir", help="Directory of model outputs")
+    parser.add_argument("--output-suffix", default=DEFAULT_OUTPUT_SUFFIX)
+    parser.add_argument("--results", default="dataset/batch/results.csv", help="Results CSV (appended to)")
+    parser.add_argument("--parquet", action="store_true", help="Also write <results>.parquet")
+    parser.add_argument("--watersheds", help="HydroBASINS shapefile for watershed matching")
+    parser.add_argument("--thumbnails", help="Directory for PNG thumbnails")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_MB, help="Memory budget per worker")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess scenes already done")
+    args = parser.parse_args()
+
+    if args.manifest:
+        batch_scenes = read_manifest(args.manifest)
+    else:
+        if not args.output_dir:
+            parser.error("--input-dir requires --output-dir")
+        batch_scenes = discover_scenes(args.input_dir, args.output_dir, args.output_suffix)
+
+    run_batch(batch_scenes, args.results, shp_path=args.watersheds, thumbnail_dir=args.thumbnails,
+              workers=args.workers, memory_mb=args.memory_mb, resume=not args.no_resume)
+    if args.parquet:
+        write_parquet(args.results)
@@ -0,0 +1,139 @@
+"""
+Lazy Application Bootstrap
+
+Startup helpers that keep module import cheap:
+
+- Earth Engine is optional and initialized only on first use, never with an
+  interactive `ee.Authenticate()` unless explicitly allowed.
+- A startup timer records milestones (imports, first render, map ready) so
+  time-to-first-render can be tracked as a metric.
+
+Environment:
+    FLOOD_EE_MODE      off | lazy (default) | eager
+    FLOOD_EE_PROJECT   Earth Engine project (default geemap-484609)
+    FLOOD_EE_AUTH      1 to allow interactive ee.Authenticate() as a fallback
+    STARTUP_REPORT     Path of the JSON timing report
+                       (default dataset/cache/startup_timing.json)
+"""
+
+import json
+import os
+import threading
+import time
+
+_IMPORT_TIME = time.perf_counter()
+
+EE_MODE = os.environ.get("FLOOD_EE_MODE", "lazy")
+EE_PROJECT = os.environ.get("FLOOD_EE_PROJECT", "geemap-484609")
+EE_ALLOW_AUTH = os.environ.get("FLOOD_EE_AUTH") == "1"
+STARTUP_REPORT_PATH = os.environ.get("STARTUP_REPORT", "dataset/cache/startup_timing.json")
+
+# ============================================================================
+# Earth Engine
+# ============================================================================
+
+_ee_lock = threading.Lock()
+_ee_state = {"attempted": False, "ready": False}
+
+
+def init_earth_engine():
+    """
+    Initialize Earth Engine once, without prompting.
+
+    Returns:
+        bool: True if Earth Engine is usable
+    """
+    if EE_MODE == "off":
+        return False
+    with _ee_lock:
+        if _ee_state["attempted"]:
+            return _ee_state["ready"]
+        _ee_state["attempted"] = True
+        start = time.perf_counter()
+        try:
+            import ee
+        except ImportError:
+            print("[BOOT] earthengine-api not installed; Earth Engine disabled")
+            return False
+        try:
+            ee.Initialize(project=EE_PROJECT)
+            _ee_state["ready"] = True
+        except Exception as e:
+            if EE_ALLOW_AUTH:
+                try:
+                    ee.Authenticate()
+                    ee.Initialize(project=EE_PROJECT)
+                    _ee_state["ready"] = True
+                except Exception as e2:
+                    print(f"[BOOT] Earth Engine initialization failed: {e2}")
+            else:
+                print(f"[BOOT] Earth Engine unavailable (offline or not authenticated): {e}")
+        mark("earth_engine", time.perf_counter() - start)
+        return _ee_state["ready"]
+
+
+def start_earth_engine_in_background():
+    """Kick off Earth Engine initialization without blocking (FLOOD_EE_MODE=eager)."""
+    if EE_MODE == "eager":
+        threading.Thread(target=init_earth_engine, name="ee-init", daemon=True).start()
+
+
+# ============================================================================
+# Startup Timing
+# ============================================================================
+
+_marks = {}
+_marks_lock = threading.Lock()
+
+
+def _process_age():
+    """Seconds since the interpreter started (falls back to bootstrap import)."""
+    try:
+        import psutil
+        return time.time() - psutil.Process().create_time()
+    except Exception:
+        return time.perf_counter() - _IMPORT_TIME
+
+
+def mark(name, duration=None):
+    """
+    Record a startup milestone (first occurrence only).
+
+    Args:
+        name: Milestone name
+        duration: Optional duration of the step itself, in seconds
+    """
+    with _marks_lock:
+        if name in _marks:
+            return False
+        _marks[name] = {"since_start": round(_process_age(), 4)}
+        if duration is not None:
+            _marks[name]["duration"] = round(duration, 4)
+        return True
+
+
+def startup_report():
+    """
+    Snapshot of recorded startup milestones.
+
+    Returns:
+        dict: milestone -> {since_start, duration?} in seconds
+    """
+    with _marks_lock:
+        return dict(_marks)
+
+
+def write_startup_report(path=STARTUP_REPORT_PATH):
+    """Print the timing report and save it as JSON."""
+    report = startup_report()
+    print("[BOOT] Startup timing (seconds since process start):")
+    for name, values in sorted(report.items(), key=lambda kv: kv[1]["since_start"]):
+        extra = f" (took {values['duration']:.3f})" if "duration" in values else ""
+        print(f"[BOOT]   {name:<24} {values['since_start']:8.3f}{extra}")
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        print(f"[BOOT] Could not write startup report: {e}")
+    return report
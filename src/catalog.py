@@ -0,0 +1,294 @@
+"""
+Local Scene Catalog
+
+Lists the scenes the app can show, so a session can switch scenes at runtime
+instead of editing dataset/config.yaml and restarting the server. The catalog
+is the configured scene plus every scene in a STAC-like JSON index:
+
+    {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": "EMSR286_08ITUANGO", "bbox": [w, s, e, n],
+         "geometry": {...footprint polygon...},
+         "properties": {"title": ..., "datetime": "2018-05-16", "emsr": "EMSR286",
+                        "hybas_id": 5120012340},
+         "assets": {"input": {"href": "S2/EMSR286_08ITUANGO.tif"},
+                    "output": {"href": "EDL/EMSR286_08ITUANGO_output_EDL.tif"},
+                    "watersheds": {"href": "/data/HydroBASINS/hybas_au_lev12_v1c.shp"}}}]}
+
+Relative hrefs are resolved against the index's directory. The index can be
+written by hand or built by scanning a directory pair (WorldFloods layout,
+see src/batch.py); rescans only re-read rasters whose size or mtime changed.
+
+Usage:
+    python -m src.catalog --input-dir S2/ --output-dir EDL/ [--watersheds basins.shp]
+
+Environment:
+    SCENE_CATALOG      Index file (default dataset/catalog.json)
+    SCENE_CACHE_SIZE   Recent scenes whose statistics and tile sources stay cached (default 8)
+"""
+
+import functools
+import json
+import os
+import re
+
+from src.config import get_scene
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+CATALOG_PATH = os.environ.get('SCENE_CATALOG', 'dataset/catalog.json')
+SCENE_CACHE_SIZE = int(os.environ.get('SCENE_CACHE_SIZE', 8))
+
+EMSR_PATTERN = re.compile(r"EMSR\d{3,4}", re.IGNORECASE)
+DATE_PATTERN = re.compile(r"(?<!\d)(20\d{2})[-_]?(0[1-9]|1[0-2])[-_]?(0[1-9]|[12]\d|3[01])(?!\d)")
+
+
+# ============================================================================
+# Index Format
+# ============================================================================
+
+def _resolve(href, base_dir):
+    if not href:
+        return None
+    return href if os.path.isabs(href) else os.path.normpath(os.path.join(base_dir, href))
+
+
+def scene_from_feature(feature, base_dir="."):
+    """
+    Convert an index feature to a scene record.
+
+    Returns:
+        dict: id, title, input_path, output_path, watershed_path, watershed_id,
+            bbox, datetime, emsr
+    """
+    props = feature.get('properties') or {}
+    assets = feature.get('assets') or {}
+    href = lambda key: _resolve((assets.get(key) or {}).get('href'), base_dir)
+    return {
+        'id': str(feature['id']),
+        'title': props.get('title') or str(feature['id']),
+        'input_path': href('input'),
+        'output_path': href('output'),
+        'watershed_path': href('watersheds'),
+        'watershed_id': props.get('hybas_id'),
+        'bbox': feature.get('bbox'),
+        'datetime': props.get('datetime'),
+        'emsr': props.get('emsr'),
+        'signature': props.get('signature'),
+    }
+
+
+def scene_to_feature(scene):
+    """Convert a scene record to an index feature (absolute hrefs)."""
+    geometry = None
+    if scene.get('bbox'):
+        w, s, e, n = scene['bbox']
+        geometry = {'type': "Polygon", 'coordinates': [[[w, s], [e, s], [e, n], [w, n], [w, s]]]}
+    assets = {
+        key: {'href': scene[field], 'type': "image/tiff; application=geotiff"}
+        for key, field in (('input', 'input_path'), ('output', 'output_path'))
+        if scene.get(field)
+    }
+    if scene.get('watershed_path'):
+        assets['watersheds'] = {'href': scene['watershed_path']}
+    properties = {k: scene.get(k) for k in ('title', 'datetime', 'emsr', 'signature')}
+    properties['hybas_id'] = scene.get('watershed_id')
+    return {'type': "Feature", 'id': scene['id'], 'bbox': scene.get('bbox'), 'geometry': geometry,
+            'properties': properties, 'assets': assets}
+
+
+def read_index(path):
+    """
+    Read a catalog index.
+
+    Returns:
+        list: Scene records (see scene_from_feature)
+    """
+    with open(path) as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    features = data.get('features', []) if isinstance(data, dict) else data
+    return [scene_from_feature(feature, base_dir) for feature in features]
+
+
+def write_index(scenes, path):
+    """Write scene records as a catalog index (atomically)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'type': "FeatureCollection", 'features': [scene_to_feature(s) for s in scenes]},
+                  f, indent=1)
+    os.replace(tmp_path, path)
+
+
+# ============================================================================
+# Directory Scan
+# ============================================================================
+
+def _signature(*paths):
+    """Size and mtime of the scene files, to detect changed scenes on rescan."""
+    return [[os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in paths]
+
+
+def _acquisition_date(name, tags):
+    match = DATE_PATTERN.search(name)
+    if match:
+        return "-".join(match.groups())
+    stamp = tags.get('TIFFTAG_DATETIME') or tags.get('DATE_ACQUIRED') or ""
+    match = DATE_PATTERN.search(stamp.replace(":", "-"))
+    return "-".join(match.groups()) if match else None
+
+
+def describe_scene(scene_id, input_path, output_path, watershed_path=None):
+    """
+    Build a scene record from its files: footprint bbox, date and EMSR code.
+
+    Only raster headers are read. The watershed with the largest overlap is
+    looked up when a basin layer is given.
+
+    Returns:
+        dict: Scene record
+    """
+    from src.read_cache import open_raster
+    from src.step1.utils import raster_footprint
+
+    with open_raster(input_path) as src:
+        tags = src.tags()
+    emsr = EMSR_PATTERN.search(scene_id)
+    scene = {
+        'id': scene_id,
+        'title': scene_id,
+        'input_path': os.path.abspath(input_path),
+        'output_path': os.path.abspath(output_path),
+        'watershed_path': os.path.abspath(watershed_path) if watershed_path else None,
+        'watershed_id': None,
+        'bbox': [round(float(v), 6) for v in raster_footprint(input_path).bounds],
+        'datetime': _acquisition_date(scene_id, tags),
+        'emsr': emsr.group(0).upper() if emsr else None,
+        'signature': _signature(input_path, output_path),
+    }
+    if watershed_path:
+        from src.batch import _best_watershed
+
+        scene['watershed_id'] = _best_watershed(input_path, watershed_path)[0]
+    return scene
+
+
+def scan_scenes(input_dir, output_dir, output_suffix=None, watershed_path=None, previous=()):
+    """
+    Index every input/output pair in a directory pair.
+
+    Args:
+        input_dir, output_dir: Scene directories (paired by stem, see batch.discover_scenes)
+        output_suffix: Output file suffix (default `_output_EDL`)
+        watershed_path: Optional HydroBASINS layer for per-scene watershed IDs
+        previous: Records from an earlier scan; unchanged scenes are reused as-is
+
+    Returns:
+        list: Scene records
+    """
+    from src.batch import DEFAULT_OUTPUT_SUFFIX, discover_scenes
+
+    known = {s['id']: s for s in previous}
+    watershed_abspath = os.path.abspath(watershed_path) if watershed_path else None
+    scenes = []
+    for pair in discover_scenes(input_dir, output_dir, output_suffix or DEFAULT_OUTPUT_SUFFIX):
+        scene_id = pair['scene_id']
+        old = known.get(scene_id)
+        if old and old.get('signature') == _signature(pair['input_path'], pair['output_path']) \
+                and old.get('watershed_path') == watershed_abspath:
+            scenes.append(old)
+            continue
+        try:
+            scenes.append(describe_scene(scene_id, pair['input_path'], pair['output_path'], watershed_path))
+            print(f"[CATALOG] Indexed {scene_id}")
+        except Exception as e:
+            print(f"[CATALOG] Skipping {scene_id}: {e}")
+    return scenes
+
+
+# ============================================================================
+# Catalog
+# ============================================================================
+
+@functools.lru_cache(maxsize=1)
+def _load_index(path, mtime_ns):
+    try:
+        return read_index(path)
+    except Exception as e:
+        print(f"[CATALOG] Could not read {path}: {e}")
+        return []
+
+
+def _configured_scene():
+    scene = dict(get_scene())
+    input_path = scene['input_path']
+    scene_id = os.path.splitext(os.path.basename(input_path))[0] if input_path else "config"
+    scene.update(id=scene_id, title=f"{scene_id} (configured)", bbox=None, datetime=None, emsr=None)
+    return scene
+
+
+def get_catalog():
+    """
+    The configured scene followed by every indexed scene.
+
+    The index is re-read only when its mtime changes. Indexed scenes without
+    a basin layer of their own use the configured one.
+
+    Returns:
+        list: Scene records; IDs are unique
+    """
+    configured = _configured_scene()
+    scenes = [configured]
+    if os.path.exists(CATALOG_PATH):
+        seen = {configured['id'], os.path.abspath(configured['input_path'] or "")}
+        for scene in _load_index(CATALOG_PATH, os.stat(CATALOG_PATH).st_mtime_ns):
+            if scene['id'] in seen or os.path.abspath(scene['input_path'] or "") in seen:
+                continue
+            seen.update((scene['id'], os.path.abspath(scene['input_path'] or "")))
+            if not scene['watershed_path']:
+                scene = dict(scene, watershed_path=configured['watershed_path'])
+            scenes.append(scene)
+    return scenes
+
+
+def get_catalog_scene(scene_id=None):
+    """
+    Look up a scene by ID.
+
+    Args:
+        scene_id: Catalog ID, or None for the configured scene
+
+    Returns:
+        dict: Scene record (the configured scene when the ID is unknown)
+    """
+    scenes = get_catalog()
+    if scene_id is not None:
+        for scene in scenes:
+            if scene['id'] == scene_id:
+                return scene
+        print(f"[CATALOG] Unknown scene {scene_id}; using the configured scene")
+    return scenes[0]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or refresh the local scene catalog")
+    parser.add_argument("--input-dir", required=True, help="Directory of input rasters")
+    parser.add_argument("--output-dir", required=True, help="Directory of model outputs")
+    parser.add_argument("--output-suffix", help="Output file suffix (default _output_EDL)")
+    parser.add_argument("--watersheds", help="HydroBASINS layer for per-scene watershed IDs")
+    parser.add_argument("--index", default=CATALOG_PATH, help="Index file to write")
+    parser.add_argument("--rebuild", action="store_true", help="Re-read every scene")
+    args = parser.parse_args()
+
+    previous = read_index(args.index) if os.path.exists(args.index) and not args.rebuild else []
+    scanned = scan_scenes(args.input_dir, args.output_dir, args.output_suffix, args.watersheds, previous)
+    # Keep hand-written entries from other directories
+    scanned_ids = {s['id'] for s in scanned}
+    kept = [s for s in previous if s['id'] not in scanned_ids
+            and os.path.dirname(s['input_path'] or "") != os.path.abspath(args.input_dir)]
+    write_index(kept + scanned, args.index)
+    print(f"[CATALOG] {len(kept) + len(scanned)} scenes written to {args.index}")
@@ -0,0 +1,83 @@
+"""
+Cached Configuration Accessor
+
+`dataset/config.yaml` is read once per process on first access instead of at
+module import. Set FLOOD_CONFIG to use a different file.
+"""
+
+import copy
+import functools
+import os
+
+CONFIG_PATH = os.environ.get("FLOOD_CONFIG", "dataset/config.yaml")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_config():
+    import yaml
+
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_config():
+    """
+    Return the parsed configuration (a copy; use save_config() to change it).
+
+    Returns:
+        dict: Contents of the config file
+    """
+    return copy.deepcopy(_load_config())
+
+
+def save_config(config):
+    """Write the configuration and invalidate the cached copy."""
+    import yaml
+
+    with open(CONFIG_PATH, "w") as f:
+        yaml.safe_dump(config, f)
+    _load_config.cache_clear()
+
+
+def get_scene():
+    """
+    Paths and IDs of the configured scene.
+
+    Returns:
+        dict: input_path, output_path, watershed_path, watershed_id
+            (None for anything missing or when the config cannot be read)
+    """
+    try:
+        config = _load_config()
+    except Exception as e:
+        print(f"[CONFIG] Configuration error: {e}")
+        config = {}
+    model = config.get("model") or {}
+    watershed = config.get("watershed") or {}
+    return {
+        "input_path": model.get("input_path"),
+        "output_path": model.get("output_path"),
+        "watershed_path": watershed.get("path"),
+        "watershed_id": watershed.get("default_id"),
+    }
+
+
+def get_imerg_source():
+    """
+    Location of the IMERG return-period catalog.
+
+    IMERG_PATH overrides the `imerg` section of the config.
+
+    Returns:
+        dict: path (NetCDF file or intake catalog YAML) and collection
+            (entry of an intake catalog); path is None when not configured
+    """
+    try:
+        imerg = _load_config().get("imerg") or {}
+    except Exception as e:
+        print(f"[CONFIG] Configuration error: {e}")
+        imerg = {}
+    return {
+        "path": os.environ.get("IMERG_PATH") or imerg.get("path"),
+        "collection": imerg.get("collection", "imerg_return_periods"),
+    }
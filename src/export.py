@@ -0,0 +1,329 @@
+"""
+Clipped COG Export
+
+Writes the model output (class and uncertainty bands) clipped to a watershed
+polygon, or to its whole upstream catchment, as a deliverable Cloud
+Optimized GeoTIFF, without loading the scene into memory.
+
+Only the polygon's pixel window is read. It is processed in output-block
+sized tiles by a thread pool, each thread with its own dataset handle: a
+block is read, pixels outside the polygon are set to nodata, and the block
+is written to a tiled temporary GeoTIFF by the calling thread. At most a few
+blocks per worker are in flight, so peak memory stays at a few blocks
+regardless of the polygon's size. Overviews are then built on the temporary
+file (nearest, class codes must not blend) and it is converted to a COG that
+reuses them.
+
+Environment:
+    EXPORT_DIR    Where exports from the app are written (default dataset/exports)
+
+Usage:
+    python -m src.export [--watershed HYBAS_ID] [--upstream] [--source output.tif] [-o out.tif]
+"""
+
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', 'dataset/exports')
+EXPORT_BLOCK_SIZE = 512
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+IN_FLIGHT_PER_WORKER = 2       # Blocks queued per worker (bounds peak memory)
+MIN_OVERVIEW_SIZE = 256        # Overviews are added until the smallest level is below this
+
+
+# ============================================================================
+# Geometry
+# ============================================================================
+
+def clip_geometry(source_path, hybas_id, upstream=False):
+    """
+    Watershed polygon, or its dissolved upstream catchment, in EPSG:4326.
+
+    Raises:
+        ValueError: Basin not found, or no upstream topology for the layer
+    """
+    if upstream:
+        from src.hydrobasins.topology import upstream_geometry
+
+        geometry = upstream_geometry(source_path, int(hybas_id))
+        if geometry is None:
+            raise ValueError(f"No upstream catchment for {hybas_id} (is the topology built?)")
+        return geometry
+    from src.hydrobasins.store import ID_FIELD, read_basins_by_id
+
+    basins = read_basins_by_id(source_path, [int(hybas_id)], columns=[ID_FIELD])
+    if basins.empty:
+        raise ValueError(f"Watershed {hybas_id} not found in {os.path.basename(source_path)}")
+    return basins.geometry.values[0]
+
+
+def _to_crs(geometry, crs):
+    import geopandas as gpd
+
+    return gpd.GeoSeries([geometry], crs="EPSG:4326").to_crs(crs).values[0] if crs else geometry
+
+
+def pixel_window(src, bounds):
+    """
+    Whole-pixel window of a raster covering bounds in its CRS.
+
+    Returns:
+        Window: Clamped to the raster, or None when bounds do not overlap it
+    """
+    from rasterio.errors import WindowError
+    from rasterio.windows import Window, from_bounds
+
+    window = from_bounds(*bounds, transform=src.transform)
+    row, col = math.floor(window.row_off), math.floor(window.col_off)
+    outer = Window(col, row, math.ceil(window.col_off + window.width) - col,
+                   math.ceil(window.row_off + window.height) - row)
+    try:
+        return outer.intersection(Window(0, 0, src.width, src.height))
+    except WindowError:
+        return None
+
+
+# ============================================================================
+# Block Streaming
+# ============================================================================
+
+class _BlockReader:
+    """Per-thread dataset handles, so blocks are read concurrently."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def dataset(self):
+        from src.read_cache import closer_for, open_raster
+
+        src = getattr(self._local, 'src', None)
+        if src is None:
+            src = self._local.src = open_raster(self.path)
+            with self._lock:
+                self._handles.append(closer_for(src))
+        return src
+
+    def close(self):
+        """Close every thread's handle (from the calling thread, in each handle's opening context)."""
+        with self._lock:
+            for close in self._handles:
+                close()
+            self._handles = []
+
+
+def _clip_block(reader, geometry, window, dst_window, nodata):
+    """Read one block and set the pixels outside the polygon to nodata."""
+    import shapely
+    from rasterio.features import geometry_mask
+
+    src = reader.dataset()
+    data = src.read(window=window, masked=True)
+    transform = src.window_transform(window)
+    left, top = transform * (0, 0)
+    right, bottom = transform * (window.width, window.height)
+    # Clipping to the block first keeps rasterizing a dense catchment cheap
+    part = shapely.clip_by_rect(geometry, min(left, right), min(top, bottom), max(left, right), max(top, bottom))
+    shape = int(window.height), int(window.width)
+    if part.is_empty:
+        outside = np.ones(shape, dtype=bool)
+    else:
+        outside = geometry_mask([part], out_shape=shape, transform=transform)
+    filled = np.ma.filled(data, nodata)
+    filled[:, outside] = nodata
+    return dst_window, filled
+
+
+def _blocks(window, block_size):
+    """(source window, destination window) pairs tiling a window."""
+    from rasterio.windows import Window
+
+    for row in range(0, int(window.height), block_size):
+        for col in range(0, int(window.width), block_size):
+            height = min(block_size, int(window.height) - row)
+            width = min(block_size, int(window.width) - col)
+            yield (Window(window.col_off + col, window.row_off + row, width, height),
+                   Window(col, row, width, height))
+
+
+def _overview_factors(width, height):
+    factors, factor = [], 2
+    while max(width, height) / factor >= MIN_OVERVIEW_SIZE:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _temp_path(directory, suffix):
+    """Reserve a unique temporary file name in directory."""
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix=".export-", dir=directory)
+    os.close(fd)
+    return path
+
+
+def export_clipped(source_path, geometry, dst_path, workers=DEFAULT_WORKERS, block_size=EXPORT_BLOCK_SIZE,
+                   progress=None):
+    """
+    Stream a raster clipped to a polygon into a COG.
+
+    Args:
+        source_path: Raster to clip (e.g. the 2-band model output)
+        geometry: Polygon in EPSG:4326
+        dst_path: Destination COG
+        workers: Threads reading and masking blocks
+        block_size: Block edge in pixels (also the COG tile size)
+        progress: Optional callable(done_blocks, total_blocks)
+
+    Returns:
+        dict: path, width, height, blocks, seconds
+
+    Raises:
+        ValueError: The polygon does not overlap the raster
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.shutil import copy as rio_copy
+
+    from src.read_cache import open_raster
+
+    start = time.perf_counter()
+    with open_raster(source_path) as src:
+        geometry = _to_crs(geometry, src.crs)
+        window = pixel_window(src, geometry.bounds)
+        if window is None or window.width == 0 or window.height == 0:
+            raise ValueError("The polygon does not overlap the raster")
+        nodata = src.nodata
+        if nodata is None:
+            nodata = float('nan') if np.dtype(src.dtypes[0]).kind == 'f' else 0
+        profile = dict(
+            driver="GTiff", width=int(window.width), height=int(window.height), count=src.count,
+            dtype=src.dtypes[0], crs=src.crs, transform=src.window_transform(window), nodata=nodata,
+            tiled=True, blockxsize=block_size, blockysize=block_size, compress="DEFLATE",
+            BIGTIFF="IF_SAFER",
+        )
+        descriptions = src.descriptions
+
+    blocks = list(_blocks(window, block_size))
+    total = len(blocks)
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    os.makedirs(dst_dir, exist_ok=True)
+    # Unique intermediates, so concurrent exports to one destination do not collide
+    tmp_path = _temp_path(dst_dir, ".tmp.tif")
+    cog_path = _temp_path(dst_dir, ".cog.tif")
+    reader = _BlockReader(source_path)
+    print(f"[EXPORT] Clipping {os.path.basename(source_path)}: {profile['width']}x{profile['height']} "
+          f"pixels in {total} blocks ({workers} threads)")
+    try:
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            for i, description in enumerate(descriptions, start=1):
+                if description:
+                    dst.set_band_description(i, description)
+            done = 0
+            pending = set()
+            queue = iter(blocks)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as executor:
+                while True:
+                    # Keep a bounded number of blocks in flight
+                    while len(pending) < workers * IN_FLIGHT_PER_WORKER:
+                        block = next(queue, None)
+                        if block is None:
+                            break
+                        pending.add(executor.submit(_clip_block, reader, geometry, *block, nodata))
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        dst_window, data = future.result()
+                        # Writes stay on this thread: a GDAL dataset is not thread-safe
+                        dst.write(data, window=dst_window)
+                        done += 1
+                        if progress is not None:
+                            progress(done, total)
+            factors = _overview_factors(profile['width'], profile['height'])
+            if factors:
+                dst.build_overviews(factors, Resampling.nearest)
+
+        rio_copy(tmp_path, cog_path, driver="COG", BLOCKSIZE=block_size, COMPRESS="DEFLATE",
+                 BIGTIFF="IF_SAFER", OVERVIEWS="FORCE_USE_EXISTING")
+        # Readers of dst_path never see a partially written COG
+        os.replace(cog_path, dst_path)
+    finally:
+        reader.close()
+        for path in (tmp_path, cog_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    seconds = time.perf_counter() - start
+    print(f"[EXPORT] Wrote {dst_path} in {seconds:.1f}s")
+    return {'path': dst_path, 'width': profile['width'], 'height': profile['height'],
+            'blocks': total, 'seconds': seconds}
+
+
+def export_path(scene, hybas_id, upstream=False, export_dir=EXPORT_DIR):
+    """Default destination: `<export_dir>/<output stem>_<HYBAS_ID>[_upstream].tif`."""
+    stem = os.path.splitext(os.path.basename(scene['output_path']))[0]
+    suffix = "_upstream" if upstream else ""
+    return os.path.join(export_dir, f"{stem}_{int(hybas_id)}{suffix}.tif")
+
+
+def export_watershed(scene, upstream=False, dst_path=None, workers=DEFAULT_WORKERS, progress=None):
+    """
+    Export a scene's output clipped to its watershed (or upstream catchment).
+
+    Args:
+        scene: Scene record with output_path, watershed_path and watershed_id
+        upstream: Clip to the whole upstream catchment instead of the basin
+        dst_path: Destination (export_path() by default)
+        workers: Threads reading and masking blocks
+        progress: Optional callable(done_blocks, total_blocks)
+
+    Returns:
+        dict: See export_clipped()
+    """
+    geometry = clip_geometry(scene['watershed_path'], scene['watershed_id'], upstream)
+    dst_path = dst_path or export_path(scene, scene['watershed_id'], upstream)
+    return export_clipped(scene['output_path'], geometry, dst_path, workers=workers, progress=progress)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.config import get_scene
+
+    parser = argparse.ArgumentParser(description="Export the model output clipped to a watershed as a COG")
+    parser.add_argument("--source", help="Raster to clip (default: the configured output)")
+    parser.add_argument("--watersheds", help="HydroBASINS shapefile (default: the configured one)")
+    parser.add_argument("--watershed", type=int, help="HYBAS_ID (default: the configured watershed)")
+    parser.add_argument("--upstream", action="store_true", help="Clip to the whole upstream catchment")
+    parser.add_argument("-o", "--output", help="Destination COG")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    config_scene = get_scene()
+    cli_scene = {
+        'output_path': args.source or config_scene['output_path'],
+        'watershed_path': args.watersheds or config_scene['watershed_path'],
+        'watershed_id': args.watershed or config_scene['watershed_id'],
+    }
+    last = [-1]
+
+    def report(done, total):
+        percent = done * 100 // total
+        if percent // 10 != last[0] // 10:
+            last[0] = percent
+            print(f"[EXPORT] {done}/{total} blocks ({percent}%)")
+
+    export_watershed(cli_scene, upstream=args.upstream, dst_path=args.output, workers=args.workers,
+                     progress=report)
@@ -0,0 +1,173 @@
+"""
+Zoom-dependent Geometry Pyramid
+
+Level-12 basin polygons carry far more vertices than a map at zoom 6-10 can
+show, and every GeoJSON overlay is sent to the browser in full through the
+widget comm. A pyramid holds the same features at a few detail levels: each
+level is simplified to about one screen pixel at its zoom with
+`shapely.coverage_simplify`, which keeps edges shared by neighbouring basins
+identical (no slivers or gaps between candidates), and coordinates are
+rounded to the precision the level needs. Zooms past the last level get the
+full-resolution geometry.
+
+Overlays bound with follow_zoom() swap to the matching level whenever the
+map zoom crosses a level boundary, so the browser only receives the detail
+the current view needs. Feature properties (HYBAS_ID, ...) are identical on
+every level, so click handlers keep working. Levels are pre-styled GeoJSON
+dicts, built once and shared by every session.
+"""
+
+import functools
+import json
+import math
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from src.hydrobasins.store import ID_FIELD, read_basins_by_id
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+PYRAMID_ZOOMS = (6, 8, 10, 12)  # Simplified levels; deeper zooms use full resolution
+TILE_SIZE = 256
+FULL_DECIMALS = 6               # ~0.1 m; coordinate precision of the full level
+
+
+def pixel_degrees(zoom):
+    """Width of one screen pixel in degrees (at the equator) at a zoom level."""
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def _round_coordinates(geometries, decimals):
+    return shapely.transform(geometries, lambda xy: np.round(xy, decimals))
+
+
+def simplify_coverage(geometries, tolerance):
+    """
+    Simplify polygons, keeping shared edges shared.
+
+    Falls back to per-geometry topology-preserving simplification when the
+    input is not a valid coverage (e.g. overlapping polygons).
+    """
+    try:
+        return shapely.coverage_simplify(geometries, tolerance)
+    except Exception:
+        return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+class GeometryPyramid:
+    """
+    Pre-styled GeoJSON of the same features at several detail levels.
+
+    Args:
+        geometries: Polygons in EPSG:4326
+        properties: One dict per geometry (kept on every level)
+        style: Leaflet path style baked into each feature's properties
+        zooms: Zoom levels that get a simplified copy
+    """
+
+    def __init__(self, geometries, properties, style=None, zooms=PYRAMID_ZOOMS):
+        geometries = np.asarray(geometries, dtype=object)
+        self.zooms = tuple(sorted(zooms))
+        self.levels = []
+        for zoom in self.zooms:
+            tolerance = pixel_degrees(zoom)
+            decimals = math.ceil(-math.log10(tolerance)) + 1
+            simplified = _round_coordinates(simplify_coverage(geometries, tolerance), decimals)
+            self.levels.append(self._to_geojson(simplified, properties, style))
+        full = _round_coordinates(geometries, FULL_DECIMALS)
+        self.levels.append(self._to_geojson(full, properties, style))
+
+    @staticmethod
+    def _to_geojson(geometries, properties, style):
+        features = []
+        for i, (geometry, props) in enumerate(zip(geometries, properties)):
+            props = dict(props, style=style) if style else dict(props)
+            features.append({'type': 'Feature', 'id': str(i), 'properties': props,
+                             'geometry': mapping(geometry)})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def level_for_zoom(self, zoom):
+        """Index of the level used at a map zoom (the last one is full resolution)."""
+        for i, level_zoom in enumerate(self.zooms):
+            if zoom <= level_zoom:
+                return i
+        return len(self.zooms)
+
+    def for_zoom(self, zoom):
+        """
+        GeoJSON for a map zoom.
+
+        Returns:
+            dict: FeatureCollection shared by every caller (treat as read-only)
+        """
+        return self.levels[self.level_for_zoom(zoom)]
+
+    def sizes(self):
+        """Serialized size in bytes of each level (simplified levels, then full)."""
+        return [len(json.dumps(level)) for level in self.levels]
+
+
+def _style_key(style):
+    return json.dumps(style, sort_keys=True) if style else None
+
+
+@functools.lru_cache(maxsize=32)
+def _basin_pyramid(source_path, source_mtime, hybas_ids, columns, style_key):
+    basins = read_basins_by_id(source_path, list(hybas_ids), columns=list(columns))
+    properties = [{c: (v.item() if hasattr(v, 'item') else v) for c, v in zip(columns, row)}
+                  for row in basins[list(columns)].itertuples(index=False)]
+    pyramid = GeometryPyramid(basins.geometry.values, properties, json.loads(style_key) if style_key else None)
+    sizes = ", ".join(f"{size / 1024:.0f} KB" for size in pyramid.sizes())
+    print(f"[BASINS] Geometry pyramid for {len(basins)} basins (z{'/z'.join(map(str, pyramid.zooms))}/full): {sizes}")
+    return pyramid
+
+
+def basin_pyramid(source_path, hybas_ids, style=None, columns=(ID_FIELD,)):
+    """
+    Geometry pyramid of HydroBASINS features, memoized per basin set and style.
+
+    Args:
+        source_path: HydroBASINS shapefile
+        hybas_ids: Basins to include
+        style: Leaflet path style baked into the features
+        columns: Attributes kept as feature properties
+
+    Returns:
+        GeometryPyramid: Shared instance (invalidated when the shapefile changes)
+    """
+    ids = tuple(sorted(int(i) for i in np.atleast_1d(hybas_ids)))
+    return _basin_pyramid(str(source_path), os.stat(source_path).st_mtime_ns, ids,
+                          tuple(columns), _style_key(style))
+
+
+# ============================================================================
+# Map Binding
+# ============================================================================
+
+def follow_zoom(m, layer, pyramid):
+    """
+    Keep a GeoJSON layer at the pyramid level matching the map zoom.
+
+    The layer's data is only replaced when the zoom crosses a level boundary.
+
+    Args:
+        m: ipyleaflet Map
+        layer: ipyleaflet GeoJSON layer (created without `style=`)
+        pyramid: GeometryPyramid
+
+    Returns:
+        callable: Cleanup that stops following the zoom
+    """
+    def update(change=None):
+        data = pyramid.for_zoom(m.zoom)
+        if layer.data is not data:
+            layer.data = data
+
+    update()
+    m.observe(update, names='zoom')
+    return lambda: m.unobserve(update, names='zoom')
@@ -0,0 +1,249 @@
+"""
+Indexed HydroBASINS Store
+
+Converts a HydroBASINS shapefile (hosted on the NAS) into an indexed local
+store so sessions never read the whole Level-12 layer again:
+
+- `<stem>.fgb`: FlatGeobuf copy with a packed Hilbert R-tree spatial index
+- `<stem>.index.npz`: sidecar with HYBAS_ID -> FID (sorted for binary search)
+  and per-feature bounding boxes for an in-memory STRtree
+
+Lookups by ID and by bbox read only the matching features.
+
+Usage:
+    python -m src.hydrobasins.store /path/to/hybas_au_lev12_v1c.shp
+"""
+
+import functools
+import importlib.util
+import os
+import sys
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+
+from src.read_cache import local_path
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_STORE_DIR = os.environ.get('BASIN_STORE_DIR', 'dataset/cache/hydrobasins')
+ID_FIELD = 'HYBAS_ID'
+STORE_VERSION = 1
+# Columnar (Arrow) reads when pyarrow is available; avoids per-feature Python objects
+USE_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def _read_frame(path, **kwargs):
+    # NAS-hosted layers are read from a local mirror (see src/read_cache.py)
+    return gpd.read_file(local_path(path), engine="pyogrio", use_arrow=USE_ARROW, **kwargs)
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns, STORE_VERSION], dtype=np.int64)
+
+
+class BasinStore:
+    """
+    Local indexed copy of a HydroBASINS layer.
+
+    Args:
+        source_path: Original HydroBASINS shapefile
+        store_dir: Directory for the FlatGeobuf copy and sidecar index
+    """
+
+    def __init__(self, source_path, store_dir=DEFAULT_STORE_DIR):
+        self.source_path = str(source_path)
+        self.store_dir = Path(store_dir)
+        stem = Path(source_path).stem
+        self.data_path = self.store_dir / f"{stem}.fgb"
+        self.index_path = self.store_dir / f"{stem}.index.npz"
+        self._index = None
+        self._tree = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------------
+
+    def is_built(self):
+        """True when the store exists and matches the source file."""
+        if not self.data_path.exists() or not self.index_path.exists():
+            return False
+        try:
+            with np.load(self.index_path) as idx:
+                return np.array_equal(idx['signature'], _source_signature(self.source_path))
+        except (OSError, KeyError, ValueError):
+            return False
+
+    def build(self):
+        """
+        Convert the source shapefile into the local store.
+
+        Reads the source once, writes a spatially indexed FlatGeobuf and the
+        HYBAS_ID/bbox sidecar.
+        """
+        print(f"[BASINS] Building basin store from {os.path.basename(self.source_path)}...")
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        gdf = gpd.read_file(local_path(self.source_path), engine="pyogrio")
+        if gdf.crs is None:
+            gdf = gdf.set_crs("EPSG:4326")
+
+        tmp_data = self.data_path.with_suffix('.tmp.fgb')
+        pyogrio.write_dataframe(gdf, tmp_data, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+
+        # The spatial index reorders features, so read FIDs back from the copy
+        ids = pyogrio.read_dataframe(
+            tmp_data, columns=[ID_FIELD], read_geometry=False, fid_as_index=True
+        )
+        fids = ids.index.to_numpy(dtype=np.int64)
+        hybas = ids[ID_FIELD].to_numpy(dtype=np.int64)
+        bounds = gdf.set_index(gdf[ID_FIELD].astype(np.int64)).bounds.loc[hybas].to_numpy()
+
+        order = np.argsort(hybas, kind='stable')
+        tmp_index = self.index_path.with_suffix('.tmp.npz')
+        np.savez(
+            tmp_index,
+            ids=hybas[order],
+            fids=fids[order],
+            bounds=bounds[order],
+            signature=_source_signature(self.source_path),
+        )
+        os.replace(tmp_data, self.data_path)
+        os.replace(tmp_index, self.index_path)
+        with self._lock:
+            self._index = None
+            self._tree = None
+        print(f"[BASINS] Basin store ready: {len(hybas)} basins -> {self.data_path}")
+
+    # ------------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------------
+
+    @property
+    def index(self):
+        """Sidecar arrays (ids, fids, bounds), loaded once."""
+        with self._lock:
+            if self._index is None:
+                with np.load(self.index_path) as idx:
+                    self._index = {k: idx[k] for k in ('ids', 'fids', 'bounds')}
+            return self._index
+
+    @property
+    def tree(self):
+        """STRtree over per-basin bounding boxes."""
+        index = self.index
+        with self._lock:
+            if self._tree is None:
+                self._tree = shapely.STRtree(shapely.box(*index['bounds'].T))
+            return self._tree
+
+    def fids_for_ids(self, hybas_ids):
+        """Map HYBAS_IDs to FIDs in the local store (unknown IDs are dropped)."""
+        ids = self.index['ids']
+        wanted = np.atleast_1d(np.asarray(hybas_ids, dtype=np.int64))
+        pos = np.searchsorted(ids, wanted)
+        pos = np.clip(pos, 0, len(ids) - 1)
+        found = ids[pos] == wanted
+        return self.index['fids'][pos[found]]
+
+    def positions_in_bbox(self, bbox):
+        """Index positions of basins whose bbox intersects (minx, miny, maxx, maxy)."""
+        return self.tree.query(shapely.box(*bbox))
+
+    def ids_in_bbox(self, bbox):
+        """HYBAS_IDs of basins whose bbox intersects (minx, miny, maxx, maxy)."""
+        return self.index['ids'][np.sort(self.positions_in_bbox(bbox))]
+
+    # ------------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------------
+
+    def read_fids(self, fids, columns=None):
+        """Read only the given features from the local store."""
+        fids = np.sort(np.asarray(fids, dtype=np.int64))
+        if len(fids) == 0:
+            return gpd.GeoDataFrame(
+                columns=(columns or [ID_FIELD]) + ['geometry'], geometry='geometry', crs="EPSG:4326"
+            )
+        return _read_frame(self.data_path, fids=fids, columns=columns)
+
+    def lookup_ids(self, hybas_ids, columns=None):
+        """
+        Read basins by HYBAS_ID.
+
+        Returns:
+            GeoDataFrame: Matching basins (EPSG:4326)
+        """
+        return self.read_fids(self.fids_for_ids(hybas_ids), columns=columns)
+
+    def lookup_bbox(self, bbox, columns=None):
+        """
+        Read basins whose bounding box intersects bbox.
+
+        Returns:
+            GeoDataFrame: Matching basins (EPSG:4326)
+        """
+        positions = self.positions_in_bbox(bbox)
+        return self.read_fids(self.index['fids'][positions], columns=columns)
+
+
+# ============================================================================
+# Process-wide Access
+# ============================================================================
+
+@functools.lru_cache(maxsize=8)
+def _get_store(source_path, store_dir):
+    return BasinStore(source_path, store_dir)
+
+
+def get_basin_store(source_path, store_dir=DEFAULT_STORE_DIR):
+    """
+    Return the shared BasinStore for a shapefile, or None if it is not built
+    (or out of date with the source).
+    """
+    store = _get_store(str(source_path), str(store_dir))
+    if not store.is_built():
+        print(f"[BASINS] No up-to-date basin store for {os.path.basename(str(source_path))}. "
+              f"Build it with: python -m src.hydrobasins.store {source_path}")
+        return None
+    return store
+
+
+def read_basins_by_id(source_path, hybas_ids, columns=None):
+    """
+    Read basins by HYBAS_ID, through the local store when available.
+
+    Falls back to an attribute-filtered read of the source shapefile.
+    """
+    store = get_basin_store(source_path)
+    if store is not None:
+        return store.lookup_ids(hybas_ids, columns=columns)
+    id_list = ", ".join(str(int(i)) for i in np.atleast_1d(hybas_ids))
+    return _read_frame(source_path, columns=columns, where=f"{ID_FIELD} IN ({id_list})")
+
+
+def read_basins_by_bbox(source_path, bbox, columns=None):
+    """
+    Read basins intersecting a bbox, through the local store when available.
+
+    Falls back to a bbox-filtered read of the source shapefile.
+    """
+    store = get_basin_store(source_path)
+    if store is not None:
+        return store.lookup_bbox(bbox, columns=columns)
+    return _read_frame(source_path, columns=columns, bbox=tuple(bbox))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.hydrobasins.store <hybas_shapefile.shp> [store_dir]")
+        sys.exit(1)
+    target_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_DIR
+    _get_store(sys.argv[1], target_dir).build()
@@ -0,0 +1,221 @@
+"""
+Precomputed Upstream Topology
+
+Builds the HydroBASINS drainage forest (each basin points to NEXT_DOWN) once
+and stores it as nested-set intervals: basins are laid out in depth-first
+preorder from their outlets, so every basin's upstream catchment is the
+contiguous slice order[tin:tout]. "All upstream basins of X" is a binary
+search plus one array slice, regardless of catchment size.
+
+Usage:
+    python -m src.hydrobasins.topology /path/to/hybas_au_lev12_v1c.shp
+"""
+
+import functools
+import os
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyogrio
+import shapely
+
+from src.hydrobasins.store import DEFAULT_STORE_DIR, ID_FIELD, _source_signature, read_basins_by_id
+from src.read_cache import local_path
+
+DOWN_FIELD = 'NEXT_DOWN'
+
+
+def build_intervals(ids, next_down):
+    """
+    Compute nested-set intervals for a drainage forest.
+
+    Args:
+        ids: HYBAS_ID per basin
+        next_down: Downstream HYBAS_ID per basin (0 or unknown for outlets)
+
+    Returns:
+        tuple: (sorted ids, preorder ids, tin, tout) where tin/tout are indexed
+            like the sorted ids and order[tin[i]:tout[i]] is basin i plus
+            everything draining into it
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    next_down = np.asarray(next_down, dtype=np.int64)
+    sort = np.argsort(ids, kind='stable')
+    ids = ids[sort]
+    next_down = next_down[sort]
+    n = len(ids)
+
+    # Parent position of every basin (-1 for outlets / sinks)
+    pos = np.clip(np.searchsorted(ids, next_down), 0, max(n - 1, 0))
+    parent = np.where((n > 0) & (ids[pos] == next_down), pos, -1)
+
+    # Children in CSR form
+    child_order = np.argsort(parent, kind='stable')
+    n_roots = int(np.count_nonzero(parent < 0))
+    children = child_order[n_roots:]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(parent[children], minlength=n), out=offsets[1:])
+    roots = child_order[:n_roots]
+
+    # Iterative DFS preorder; each subtree is contiguous
+    preorder = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    stack = list(roots[::-1])
+    count = 0
+    while stack:
+        node = stack.pop()
+        if visited[node]:
+            continue
+        visited[node] = True
+        preorder[count] = node
+        count += 1
+        stack.extend(children[offsets[node]:offsets[node + 1]][::-1].tolist())
+    if count < n:
+        # Basins on a NEXT_DOWN cycle are unreachable from any outlet
+        print(f"[BASINS] Warning: {n - count} basins not reachable from an outlet")
+        preorder[count:] = np.flatnonzero(~visited)
+
+    # Subtree sizes accumulated in reverse preorder
+    size = np.ones(n, dtype=np.int64)
+    for node in preorder[:count][::-1]:
+        p = parent[node]
+        if p >= 0:
+            size[p] += size[node]
+
+    tin = np.empty(n, dtype=np.int64)
+    tin[preorder] = np.arange(n)
+    tout = tin + np.where(visited, size, 1)
+    return ids, ids[preorder], tin, tout
+
+
+class UpstreamTopology:
+    """
+    Nested-set upstream index for a HydroBASINS layer.
+
+    Args:
+        source_path: Original HydroBASINS shapefile
+        store_dir: Directory holding the precomputed arrays
+    """
+
+    def __init__(self, source_path, store_dir=DEFAULT_STORE_DIR):
+        self.source_path = str(source_path)
+        self.path = Path(store_dir) / f"{Path(source_path).stem}.topology.npz"
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def is_built(self):
+        """True when the topology exists and matches the source file."""
+        if not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                return np.array_equal(data['signature'], _source_signature(self.source_path))
+        except (OSError, KeyError, ValueError):
+            return False
+
+    def build(self):
+        """Read HYBAS_ID/NEXT_DOWN (no geometry) and store the intervals."""
+        print(f"[BASINS] Building upstream topology from {os.path.basename(self.source_path)}...")
+        table = pyogrio.read_dataframe(
+            local_path(self.source_path), columns=[ID_FIELD, DOWN_FIELD], read_geometry=False
+        )
+        ids, order, tin, tout = build_intervals(table[ID_FIELD], table[DOWN_FIELD])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp.npz')
+        np.savez(tmp, ids=ids, order=order, tin=tin, tout=tout,
+                 signature=_source_signature(self.source_path))
+        os.replace(tmp, self.path)
+        with self._lock:
+            self._arrays = None
+        print(f"[BASINS] Upstream topology ready: {len(ids)} basins -> {self.path}")
+
+    @property
+    def arrays(self):
+        with self._lock:
+            if self._arrays is None:
+                with np.load(self.path) as data:
+                    self._arrays = {k: data[k] for k in ('ids', 'order', 'tin', 'tout')}
+            return self._arrays
+
+    def upstream_ids(self, hybas_id, include_self=True):
+        """
+        All basins draining into hybas_id.
+
+        Returns:
+            np.ndarray: HYBAS_IDs in preorder (hybas_id first if included);
+                empty if the ID is unknown
+        """
+        a = self.arrays
+        i = np.searchsorted(a['ids'], hybas_id)
+        if i >= len(a['ids']) or a['ids'][i] != hybas_id:
+            return np.empty(0, dtype=np.int64)
+        start = a['tin'][i] + (0 if include_self else 1)
+        return a['order'][start:a['tout'][i]]
+
+
+# ============================================================================
+# Process-wide Access
+# ============================================================================
+
+@functools.lru_cache(maxsize=8)
+def _get_topology(source_path, store_dir):
+    return UpstreamTopology(source_path, store_dir)
+
+
+def get_topology(source_path, store_dir=DEFAULT_STORE_DIR):
+    """Return the shared UpstreamTopology, or None if it is not built."""
+    topology = _get_topology(str(source_path), str(store_dir))
+    if not topology.is_built():
+        print(f"[BASINS] No up-to-date upstream topology for {os.path.basename(str(source_path))}. "
+              f"Build it with: python -m src.hydrobasins.topology {source_path}")
+        return None
+    return topology
+
+
+def upstream_signature(source_path):
+    """
+    Cache key part identifying a shapefile and its topology build.
+
+    Returns:
+        tuple: (shapefile mtime, topology mtime) in ns, or None if the topology is not built
+    """
+    topology = get_topology(source_path)
+    if topology is None:
+        return None
+    return os.stat(source_path).st_mtime_ns, topology.path.stat().st_mtime_ns
+
+
+@functools.lru_cache(maxsize=32)
+def _upstream_geometry(source_path, signature, hybas_id):
+    topology = _get_topology(source_path, DEFAULT_STORE_DIR)
+    ids = topology.upstream_ids(hybas_id)
+    if len(ids) == 0:
+        return None
+    basins = read_basins_by_id(source_path, ids, columns=[ID_FIELD])
+    return shapely.union_all(basins.geometry.values)
+
+
+def upstream_geometry(source_path, hybas_id):
+    """
+    Dissolved polygon of hybas_id and everything upstream of it.
+
+    Results are memoized per (shapefile, topology build, basin); nothing is
+    memoized while the topology is not built.
+
+    Returns:
+        shapely.Geometry or None: Catchment outline in EPSG:4326
+    """
+    signature = upstream_signature(source_path)
+    if signature is None:
+        return None
+    return _upstream_geometry(str(source_path), signature, int(hybas_id))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.hydrobasins.topology <hybas_shapefile.shp> [store_dir]")
+        sys.exit(1)
+    target_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_DIR
+    _get_topology(sys.argv[1], target_dir).build()
@@ -0,0 +1,261 @@
+"""
+IMERG Return-period Overlay
+
+Precipitation context for the Step 2 map from the IMERG return-period
+catalog (0.1° grid, one variable per return period, e.g. 2yr ... 100yr; see
+dataset/README.md).
+
+Nothing is read until the overlay is switched on. The catalog is then opened
+lazily with xarray (dask-chunked when dask is installed), and only the cells
+around the scene footprint are loaded: the subset is a label-based slice, so
+only the chunks that intersect it are read. Subsets are memoized per
+variable and footprint, and web-mercator tiles are regridded from them by
+nearest-neighbour lookup on demand and stored in the shared TileCache, so
+later views are served from memory or disk.
+
+Configuration: `imerg.path` (and `imerg.collection` for intake catalogs) in
+dataset/config.yaml, or IMERG_PATH. Reading NetCDF needs an xarray backend
+(netCDF4 or h5netcdf); intake catalogs need intake.
+
+Environment:
+    IMERG_PATH          NetCDF file or intake catalog YAML
+    IMERG_MARGIN_DEG    Degrees of context loaded around the footprint (default 1.0)
+"""
+
+import functools
+import importlib.util
+import math
+import os
+import re
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+IMERG_MARGIN_DEG = float(os.environ.get('IMERG_MARGIN_DEG', 1.0))
+IMERG_COLORMAP = 'blues'
+TILE_SIZE = 256
+LAT_NAMES = ('lat', 'latitude', 'y')
+LON_NAMES = ('lon', 'longitude', 'x')
+VMAX_PERCENTILE = 99           # Color range top, from the longest return period's subset
+HAS_DASK = importlib.util.find_spec("dask") is not None
+
+
+# ============================================================================
+# Catalog Access
+# ============================================================================
+
+def _source():
+    from src.config import get_imerg_source
+
+    source = get_imerg_source()
+    path = source['path']
+    if not path or not os.path.exists(path):
+        return None
+    return os.path.abspath(path), os.stat(path).st_mtime_ns, source['collection']
+
+
+@functools.lru_cache(maxsize=4)
+def _open_dataset(path, mtime, collection):
+    """Lazily opened catalog; only metadata is read here."""
+    if path.endswith(('.yaml', '.yml')):
+        import intake
+
+        return intake.open_catalog(path)[collection].to_dask()
+    import xarray as xr
+
+    # chunks={} keeps the file's own chunking as dask chunks
+    return xr.open_dataset(path, chunks={} if HAS_DASK else None)
+
+
+def _dim(da, names):
+    for name in names:
+        if name in da.dims:
+            return name
+    raise ValueError(f"{da.name}: none of the dimensions {names} found in {da.dims}")
+
+
+def _period_years(name):
+    match = re.search(r"\d+", str(name))
+    return int(match.group()) if match else math.inf
+
+
+def _variables(dataset):
+    names = [name for name, da in dataset.data_vars.items()
+             if any(d in da.dims for d in LAT_NAMES) and any(d in da.dims for d in LON_NAMES)]
+    return sorted(names, key=lambda n: (_period_years(n), str(n)))
+
+
+def return_period_variables():
+    """
+    Return-period variables of the configured catalog, shortest period first.
+
+    Returns:
+        list: Variable names (empty when the catalog is not configured or cannot be opened)
+    """
+    source = _source()
+    if source is None:
+        return []
+    try:
+        return _variables(_open_dataset(*source))
+    except Exception as e:
+        print(f"[IMERG] Could not open {source[0]}: {e}")
+        return []
+
+
+# ============================================================================
+# Footprint Subsets
+# ============================================================================
+
+class GridSubset:
+    """
+    Values of one variable on a regular lat/lon subgrid.
+
+    Attributes:
+        values: (lat, lon) float32 array, NaN where missing
+        lats, lons: Cell-center coordinates (either order)
+    """
+
+    def __init__(self, values, lats, lons):
+        self.values = values
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+
+    @staticmethod
+    def _indices(axis, coords):
+        if axis.size == 1:
+            return np.zeros(coords.shape, dtype=np.int64)
+        step = (axis[-1] - axis[0]) / (axis.size - 1)
+        return np.rint((coords - axis[0]) / step).astype(np.int64)
+
+    def regrid(self, lons, lats):
+        """
+        Nearest-cell values at lon/lat arrays (one lon per column, one lat per row).
+
+        Returns:
+            np.ma.MaskedArray: (len(lats), len(lons)); masked outside the subset and at NaN
+        """
+        cols, rows = self._indices(self.lons, lons), self._indices(self.lats, lats)
+        col_ok = (cols >= 0) & (cols < self.lons.size)
+        row_ok = (rows >= 0) & (rows < self.lats.size)
+        values = self.values[np.ix_(np.clip(rows, 0, self.lats.size - 1),
+                                    np.clip(cols, 0, self.lons.size - 1))]
+        mask = ~(row_ok[:, None] & col_ok[None, :]) | np.isnan(values)
+        return np.ma.MaskedArray(values, mask)
+
+
+@functools.lru_cache(maxsize=32)
+def _subset(path, mtime, collection, variable, bounds):
+    dataset = _open_dataset(path, mtime, collection)
+    da = dataset[variable]
+    lat, lon = _dim(da, LAT_NAMES), _dim(da, LON_NAMES)
+    # Extra dimensions (e.g. a length-1 time axis): first entry
+    da = da.isel({d: 0 for d in da.dims if d not in (lat, lon)})
+    if float(da[lon].max()) > 180:
+        # 0-360 longitudes: shift to -180-180 (lazy; only coordinates are rewritten)
+        da = da.assign_coords({lon: (da[lon] + 180) % 360 - 180}).sortby(lon)
+    west, south, east, north = bounds
+    lats = da[lat].values
+    lat_slice = slice(south, north) if lats.size < 2 or lats[0] < lats[-1] else slice(north, south)
+    da = da.sel({lat: lat_slice, lon: slice(west, east)}).transpose(lat, lon)
+    # Only the chunks intersecting the slice are read
+    values = np.asarray(da.values, dtype=np.float32)
+    print(f"[IMERG] Loaded {variable} subset {values.shape[0]}x{values.shape[1]} "
+          f"({values.nbytes / 1024:.0f} KB) around the footprint")
+    return GridSubset(values, da[lat].values, da[lon].values)
+
+
+@functools.lru_cache(maxsize=32)
+def _footprint_bounds(raster_path, mtime):
+    from src.step1.utils import raster_footprint
+
+    west, south, east, north = raster_footprint(raster_path).bounds
+    # Snapped outward to whole degrees so nearby scenes share subsets
+    return (math.floor(west - IMERG_MARGIN_DEG), math.floor(south - IMERG_MARGIN_DEG),
+            math.ceil(east + IMERG_MARGIN_DEG), math.ceil(north + IMERG_MARGIN_DEG))
+
+
+def footprint_subset(variable, raster_path):
+    """
+    One variable around a raster's footprint, memoized.
+
+    Args:
+        variable: Return-period variable
+        raster_path: Scene raster whose footprint defines the area
+
+    Returns:
+        GridSubset: Shared instance, or None when the catalog is not configured
+    """
+    source = _source()
+    if source is None:
+        return None
+    bounds = _footprint_bounds(os.path.abspath(raster_path), os.stat(raster_path).st_mtime_ns)
+    return _subset(*source, variable, bounds)
+
+
+def color_range(raster_path):
+    """
+    (vmin, vmax) shared by every return period of a footprint.
+
+    The top is a high percentile of the longest return period, so colors are
+    comparable when switching periods.
+    """
+    variables = return_period_variables()
+    if not variables:
+        return 0.0, 1.0
+    values = footprint_subset(variables[-1], raster_path).values
+    finite = values[np.isfinite(values)]
+    vmax = float(np.percentile(finite, VMAX_PERCENTILE)) if finite.size else 1.0
+    return 0.0, vmax if vmax > 0 else 1.0
+
+
+# ============================================================================
+# Tiles
+# ============================================================================
+
+def tile_lonlat(z, x, y, size=TILE_SIZE):
+    """Pixel-center longitudes (per column) and latitudes (per row) of a web-mercator tile."""
+    n = 2 ** z
+    offsets = (np.arange(size) + 0.5) / size
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lons, lats
+
+
+def source_key():
+    """(path, mtime) of the configured catalog for cache keys, or None."""
+    source = _source()
+    return source[:2] if source else None
+
+
+def render_tile(variable, raster_path, z, x, y, img_format="PNG", vmax=None):
+    """
+    Regrid one web-mercator tile of a return-period variable.
+
+    Args:
+        variable: Return-period variable
+        raster_path: Scene raster whose footprint bounds the loaded area
+        z, x, y: Tile coordinates
+        img_format: Encoding from format_to_encoding()
+        vmax: Top of the color range (color_range() when None)
+
+    Returns:
+        bytes: Encoded tile, or None when the tile has no data
+    """
+    from rio_tiler.colormap import cmap
+    from rio_tiler.models import ImageData
+
+    subset = footprint_subset(variable, raster_path)
+    if subset is None:
+        return None
+    values = subset.regrid(*tile_lonlat(z, x, y))
+    if values.mask.all():
+        return None
+    vmin, default_vmax = color_range(raster_path)
+    vmax = default_vmax if vmax is None else vmax
+    scaled = np.clip((values.data - vmin) / (vmax - vmin) * 255, 0, 255)
+    image = np.ma.MaskedArray(np.nan_to_num(scaled).astype(np.uint8)[np.newaxis],
+                              values.mask[np.newaxis])
+    return ImageData(image).render(img_format=img_format, colormap=cmap.get(IMERG_COLORMAP))
@@ -1,9 +1,19 @@
+import time
+from src import bootstrap
+
+_start = time.perf_counter()
+
 import solara
 import src.state as state
 
 # Import Pages
 # from src.step1.app import Page as Step1Page  # Temporarily disabled
 from src.step2.app import Page as Step2Page
+from src.tiles.prewarm import start_prewarm_in_background
+
+bootstrap.mark("app_imported", time.perf_counter() - _start)
+bootstrap.start_earth_engine_in_background()
+start_prewarm_in_background()
 
 @solara.component
 def Page():
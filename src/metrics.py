@@ -0,0 +1,256 @@
+"""
+Hot-path Instrumentation
+
+A small, dependency-free metrics layer for the stages that make the map feel
+slow: tile rendering, COG I/O and widget updates. Metrics are exposed in the
+Prometheus text format on the tile server (`/api/metrics`).
+
+- Histograms: tile requests (per layer, zoom and cache tier), tile renders,
+  `update_layers` duration and session setup steps
+- Counters: bytes GDAL reads from each source file while rendering tiles,
+  from the rendering thread's I/O accounting
+
+Optional profiling captures one cProfile (or pyinstrument) report per tile
+request or layer update.
+
+Environment:
+    METRICS_IO         0 to disable per-render byte counting
+    PROFILE_REQUESTS   cprofile | pyinstrument to profile each request
+    PROFILE_DIR        Where reports are written (default dataset/cache/profiles)
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+METRICS_IO = os.environ.get("METRICS_IO", "1") != "0"
+PROFILE_MODE = os.environ.get("PROFILE_REQUESTS", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "dataset/cache/profiles")
+
+# Seconds; covers cache hits (~1 ms) through cold NAS renders (several s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ============================================================================
+# Metric Types
+# ============================================================================
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Label names, passed as keyword arguments to inc()
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+
+class Histogram(Counter):
+    """
+    Cumulative-bucket histogram with optional labels.
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Label names, passed as keyword arguments to observe()
+        buckets: Upper bounds (seconds for timings)
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, count, total) in self._values.items():
+                for bound, n in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", key, (("le", repr(float(bound))),), n))
+                out.append((f"{self.name}_bucket", key, (("le", "+Inf"),), count))
+                out.append((f"{self.name}_count", key, (), count))
+                out.append((f"{self.name}_sum", key, (), total))
+        return out
+
+
+REGISTRY = []
+
+
+def render_prometheus():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        str: Exposition text (content type text/plain; version=0.0.4)
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, extra, value in metric.samples():
+            lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# Application Metrics
+# ============================================================================
+
+TILE_REQUEST_SECONDS = Histogram(
+    "tile_request_seconds", "Cached tile endpoint latency", ("layer", "zoom", "cache"))
+TILE_RENDER_SECONDS = Histogram(
+    "tile_render_seconds", "Tile decode and render time on cache misses", ("layer", "zoom"))
+LAYER_UPDATE_SECONDS = Histogram(
+    "layer_update_seconds", "Step 2 update_layers duration (widget round trip excluded)")
+SETUP_SECONDS = Histogram(
+    "session_setup_seconds", "Per-session setup steps", ("step",))
+GDAL_BYTES_READ = Counter(
+    "gdal_bytes_read_total", "Bytes read while rendering tiles, per source file", ("file",))
+GDAL_READ_CALLS = Counter(
+    "gdal_renders_total", "Tile renders that read from each source file", ("file",))
+
+
+# ============================================================================
+# I/O Accounting
+# ============================================================================
+
+_THREAD_IO = "/proc/thread-self/io"
+
+
+def _thread_read_bytes():
+    """Bytes read by the calling thread so far (Linux), or None if unavailable."""
+    try:
+        with open(_THREAD_IO, "rb") as f:
+            for line in f:
+                if line.startswith(b"rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+@contextlib.contextmanager
+def count_io(file):
+    """
+    Attribute the bytes read by this thread during a with-block to a source file.
+
+    GDAL reads tile data synchronously in the calling thread, so the thread's
+    read counter before and after a render measures that render's I/O
+    without wrapping the dataset. No-op when METRICS_IO=0 or off Linux.
+    """
+    before = _thread_read_bytes() if METRICS_IO else None
+    try:
+        yield
+    finally:
+        if before is not None:
+            after = _thread_read_bytes()
+            if after is not None:
+                # Includes the few hundred bytes of the first proc read
+                GDAL_BYTES_READ.inc(max(0, after - before), file=file)
+                GDAL_READ_CALLS.inc(file=file)
+
+
+# ============================================================================
+# Profiling
+# ============================================================================
+
+_profile_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiled(name):
+    """
+    Profile a with-block when PROFILE_REQUESTS is set.
+
+    cProfile writes `<PROFILE_DIR>/<name>-<timestamp>.prof` (open with snakeviz
+    or pstats); pyinstrument writes an HTML report. Only one block is profiled
+    at a time; concurrent requests run unprofiled.
+    """
+    if not PROFILE_MODE or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        with _profile_capture(name):
+            yield
+    finally:
+        _profile_lock.release()
+
+
+@contextlib.contextmanager
+def _profile_capture(name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}")
+    if PROFILE_MODE == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(f"{stem}.html", "w") as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{stem}.prof")
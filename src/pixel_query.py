@@ -0,0 +1,429 @@
+"""
+Point and Transect Queries on Scene Rasters
+
+Click-to-inspect for the Step 2 map: the class code and uncertainty from the
+output raster and the 13 band reflectances from the input, at a clicked
+point, in a small window around it, or along a drawn transect.
+
+Coordinates are transformed to the raster's CRS with cached pyproj
+Transformers, and only the internal blocks (COG tiles or strips) that
+contain the requested pixels are read. Decoded blocks are kept in a
+process-wide LRU bounded by a byte budget, so nearby clicks and repeated
+transects are answered from memory, and dataset handles stay open between
+queries instead of being reopened on the NAS for every click.
+
+Environment:
+    PIXEL_BLOCK_CACHE_MB   Budget of the decoded block cache (default 128)
+"""
+
+import functools
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_BLOCK_CACHE_BYTES = int(os.environ.get('PIXEL_BLOCK_CACHE_MB', 128)) * 1024 * 1024
+DEFAULT_MAX_OPEN = 8           # Dataset handles kept open (LRU beyond that)
+MAX_BLOCK_PIXELS = 1024 * 1024 # Larger internal blocks (e.g. one-strip files) are read in READ_BLOCK tiles
+READ_BLOCK = 256
+MAX_TRANSECT_SAMPLES = 4096    # Transects longer than this many pixels are sampled more coarsely
+
+# Output band 1 values (see dataset/README.md)
+CLASS_NAMES = {0: "invalid", 1: "land", 2: "water", 3: "cloud", 4: "flood_trace"}
+# Band order of the 13-band Sentinel-2 input stack
+S2_BANDS = ("B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B8A", "B9", "B10", "B11", "B12")
+
+
+@functools.lru_cache(maxsize=32)
+def _transformer(src_crs, dst_crs):
+    """Cached pyproj Transformer between two CRS (any form pyproj accepts, hashable)."""
+    from pyproj import Transformer
+
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+def transform_points(xs, ys, src_crs, dst_crs):
+    """
+    Transform coordinate arrays between CRS (x/lon first).
+
+    Returns:
+        tuple: (xs, ys) as float64 arrays
+    """
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    if src_crs == dst_crs:
+        return xs, ys
+    return _transformer(src_crs, dst_crs).transform(xs, ys)
+
+
+# ============================================================================
+# Block Cache
+# ============================================================================
+
+class BlockCache:
+    """
+    LRU of decoded raster blocks with a byte budget.
+
+    Args:
+        max_bytes: Budget for cached block data
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BLOCK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._blocks = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def _size(block):
+        return block.data.nbytes + np.ma.getmaskarray(block).nbytes
+
+    def get(self, key):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self.counters['misses'] += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.counters['hits'] += 1
+            return block
+
+    def put(self, key, block):
+        size = self._size(block)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._used -= self._size(old)
+            self._blocks[key] = block
+            self._used += size
+            while self._used > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self._used -= self._size(evicted)
+                self.counters['evictions'] += 1
+
+    def stats(self):
+        """Counters plus the number and bytes of cached blocks."""
+        with self._lock:
+            return dict(self.counters, blocks=len(self._blocks), bytes=self._used)
+
+
+# ============================================================================
+# Open Rasters
+# ============================================================================
+
+class _OpenRaster:
+    """A dataset handle with its grid; reads are serialized by a lock."""
+
+    def __init__(self, path, mtime_ns):
+        from src.read_cache import closer_for, open_raster
+
+        self.key = (path, mtime_ns)
+        self.dataset = open_raster(path)
+        self._close = closer_for(self.dataset)  # Evictions close from other threads
+        self.lock = threading.Lock()
+        src = self.dataset
+        self.crs = src.crs.to_wkt() if src.crs else None
+        self.geographic = bool(src.crs and src.crs.is_geographic)
+        self.inverse = ~src.transform
+        self.width, self.height, self.count = src.width, src.height, src.count
+        self.dtype = np.result_type(*src.dtypes)
+        self.descriptions = src.descriptions
+        self.pixel_size = max(abs(src.transform.a), abs(src.transform.e))
+        block_h, block_w = src.block_shapes[0]
+        if block_h * block_w > MAX_BLOCK_PIXELS:
+            block_h, block_w = min(block_h, READ_BLOCK), min(block_w, READ_BLOCK)
+        self.block_shape = block_h, block_w
+
+    def read_block(self, block_row, block_col):
+        from rasterio.windows import Window
+
+        block_h, block_w = self.block_shape
+        window = Window(block_col * block_w, block_row * block_h,
+                        min(block_w, self.width - block_col * block_w),
+                        min(block_h, self.height - block_row * block_h))
+        with self.lock:
+            return self.dataset.read(window=window, masked=True)
+
+    def band_names(self):
+        if any(self.descriptions):
+            return [d or f"band_{i + 1}" for i, d in enumerate(self.descriptions)]
+        if self.count == len(S2_BANDS):
+            return list(S2_BANDS)
+        return [f"band_{i + 1}" for i in range(self.count)]
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+# ============================================================================
+# Query Service
+# ============================================================================
+
+class PixelQuery:
+    """
+    Point, window and batch pixel reads through a shared block cache.
+
+    Args:
+        cache_bytes: Budget of the decoded block cache
+        max_open: Dataset handles kept open
+    """
+
+    def __init__(self, cache_bytes=DEFAULT_BLOCK_CACHE_BYTES, max_open=DEFAULT_MAX_OPEN):
+        self.blocks = BlockCache(cache_bytes)
+        self.max_open = max_open
+        self._rasters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def raster(self, path):
+        """Open handle for a raster, reopened when the file's mtime changes."""
+        path = os.path.abspath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            raster = self._rasters.get(path)
+            if raster is not None and raster.key[1] == mtime_ns:
+                self._rasters.move_to_end(path)
+                return raster
+        opened = _OpenRaster(path, mtime_ns)
+        with self._lock:
+            stale = self._rasters.pop(path, None)
+            self._rasters[path] = opened
+            while len(self._rasters) > self.max_open:
+                _, evicted = self._rasters.popitem(last=False)
+                evicted.close()
+        if stale is not None:
+            stale.close()
+        return opened
+
+    def _block(self, raster, block_row, block_col):
+        key = (*raster.key, block_row, block_col)
+        block = self.blocks.get(key)
+        if block is None:
+            block = raster.read_block(block_row, block_col)
+            self.blocks.put(key, block)
+        return block
+
+    def read_pixels(self, raster, rows, cols):
+        """
+        Values of every band at pixel positions, reading each block once.
+
+        Args:
+            raster: Handle from raster()
+            rows, cols: Integer pixel coordinates (outside the raster is masked)
+
+        Returns:
+            np.ma.MaskedArray: (n, bands)
+        """
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        values = np.zeros((rows.size, raster.count), dtype=raster.dtype)
+        mask = np.ones((rows.size, raster.count), dtype=bool)
+        inside = (rows >= 0) & (rows < raster.height) & (cols >= 0) & (cols < raster.width)
+        block_h, block_w = raster.block_shape
+        block_rows, block_cols = rows // block_h, cols // block_w
+        for block_row, block_col in set(zip(block_rows[inside].tolist(), block_cols[inside].tolist())):
+            selected = inside & (block_rows == block_row) & (block_cols == block_col)
+            block = self._block(raster, block_row, block_col)
+            r, c = rows[selected] - block_row * block_h, cols[selected] - block_col * block_w
+            values[selected] = block.data[:, r, c].T
+            mask[selected] = np.ma.getmaskarray(block)[:, r, c].T
+        return np.ma.MaskedArray(values, mask)
+
+    def to_pixels(self, raster, xs, ys, crs="EPSG:4326"):
+        """Pixel (row, col) arrays of coordinates given in `crs`."""
+        xs, ys = transform_points(xs, ys, crs, raster.crs or crs)
+        cols, rows = raster.inverse * (xs, ys)
+        return np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+
+    def sample(self, path, xs, ys, crs="EPSG:4326"):
+        """
+        Batched point query.
+
+        Args:
+            path: Raster path
+            xs, ys: Coordinates (lon/lat by default)
+            crs: CRS of the coordinates
+
+        Returns:
+            np.ma.MaskedArray: (n, bands); masked outside the raster and at nodata
+        """
+        raster = self.raster(path)
+        rows, cols = self.to_pixels(raster, np.atleast_1d(xs), np.atleast_1d(ys), crs)
+        return self.read_pixels(raster, rows, cols)
+
+    def sample_window(self, path, x, y, radius=1, crs="EPSG:4326"):
+        """
+        Pixels within `radius` of the pixel containing a point.
+
+        Returns:
+            np.ma.MaskedArray: (bands, 2 * radius + 1, 2 * radius + 1)
+        """
+        raster = self.raster(path)
+        rows, cols = self.to_pixels(raster, [x], [y], crs)
+        offsets = np.arange(-radius, radius + 1)
+        grid_rows, grid_cols = np.meshgrid(rows[0] + offsets, cols[0] + offsets, indexing='ij')
+        size = 2 * radius + 1
+        values = self.read_pixels(raster, grid_rows.ravel(), grid_cols.ravel())
+        return values.T.reshape(raster.count, size, size)
+
+    def stats(self):
+        """Block cache counters and open handle count."""
+        with self._lock:
+            open_count = len(self._rasters)
+        return dict(self.blocks.stats(), open=open_count)
+
+    def close(self):
+        """Close every dataset handle."""
+        with self._lock:
+            rasters, self._rasters = list(self._rasters.values()), OrderedDict()
+        for raster in rasters:
+            raster.close()
+
+
+_QUERY = None
+_QUERY_LOCK = threading.Lock()
+
+
+def get_pixel_query(**kwargs):
+    """
+    Return the process-wide PixelQuery, creating it on first call.
+
+    Keyword arguments are only used when the service is created.
+    """
+    global _QUERY
+    with _QUERY_LOCK:
+        if _QUERY is None:
+            _QUERY = PixelQuery(**kwargs)
+        return _QUERY
+
+
+# ============================================================================
+# Scene Queries
+# ============================================================================
+
+def _value(values, index):
+    """One band of a single-point result as a Python number, or None when masked."""
+    if index >= values.shape[-1] or np.ma.getmaskarray(values)[0, index]:
+        return None
+    value = values.data[0, index].item()
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def inspect_point(scene, lon, lat):
+    """
+    Class, uncertainty and input reflectances at a point.
+
+    Args:
+        scene: Scene record with input_path and output_path (see src/catalog.py)
+        lon, lat: WGS84 coordinates
+
+    Returns:
+        dict: lon, lat, class, class_name, uncertainty, bands ({name: value});
+            values are None outside the rasters or at nodata
+    """
+    query = get_pixel_query()
+    result = {'lon': lon, 'lat': lat, 'class': None, 'class_name': None, 'uncertainty': None, 'bands': {}}
+    if scene.get('output_path'):
+        values = query.sample(scene['output_path'], [lon], [lat])
+        code = _value(values, 0)
+        if code is not None:
+            result['class'] = int(code)
+            result['class_name'] = CLASS_NAMES.get(int(code))
+        result['uncertainty'] = _value(values, 1)
+    if scene.get('input_path'):
+        raster = query.raster(scene['input_path'])
+        values = query.sample(scene['input_path'], [lon], [lat])
+        result['bands'] = {name: _value(values, i) for i, name in enumerate(raster.band_names())}
+    return result
+
+
+def _densify(xs, ys, spacing, max_samples):
+    """Points every `spacing` map units along a polyline, with their distance from the start."""
+    lengths = np.hypot(np.diff(xs), np.diff(ys))
+    total = float(lengths.sum())
+    if total == 0:
+        return xs[:1], ys[:1], np.zeros(1)
+    count = min(max_samples, int(total / spacing) + 1)
+    distances = np.linspace(0.0, total, max(count, 2))
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    return np.interp(distances, cumulative, xs), np.interp(distances, cumulative, ys), distances
+
+
+def _geodesic_distances(lons, lats):
+    """Cumulative WGS84 distance (m) along a lon/lat polyline."""
+    from pyproj import Geod
+
+    _, _, steps = Geod(ellps="WGS84").inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
+def sample_transect(scene, coords, with_bands=False, max_samples=MAX_TRANSECT_SAMPLES):
+    """
+    Class and uncertainty profile along a polyline, one sample per output pixel.
+
+    Args:
+        scene: Scene record with output_path (and input_path for bands)
+        coords: [(lon, lat), ...] vertices, at least two
+        with_bands: Also sample the input reflectances
+        max_samples: Upper bound on the number of samples
+
+    Returns:
+        dict: distance (m), lon, lat, class and uncertainty arrays (NaN / -1 where masked), bands
+            ({name: array}) when requested
+    """
+    query = get_pixel_query()
+    raster = query.raster(scene['output_path'])
+    lons, lats = np.asarray(coords, dtype=np.float64).T
+    xs, ys = transform_points(lons, lats, "EPSG:4326", raster.crs or "EPSG:4326")
+    xs, ys, distances = _densify(xs, ys, raster.pixel_size, max_samples)
+    lons, lats = transform_points(xs, ys, raster.crs or "EPSG:4326", "EPSG:4326")
+    if raster.geographic:
+        distances = _geodesic_distances(lons, lats)
+
+    values = query.read_pixels(raster, *query.to_pixels(raster, xs, ys, raster.crs or "EPSG:4326"))
+    classes = np.ma.filled(values[:, 0].astype(np.float64), np.nan)
+    profile = {
+        'distance': distances,
+        'lon': lons,
+        'lat': lats,
+        'class': np.where(np.isnan(classes), -1, classes).astype(np.int64),
+        'uncertainty': np.ma.filled(values[:, 1].astype(np.float64), np.nan) if raster.count > 1
+        else np.full(len(xs), np.nan),
+    }
+    if with_bands and scene.get('input_path'):
+        input_raster = query.raster(scene['input_path'])
+        bands = query.sample(scene['input_path'], lons, lats)
+        profile['bands'] = {name: np.ma.filled(bands[:, i].astype(np.float64), np.nan)
+                            for i, name in enumerate(input_raster.band_names())}
+    return profile
+
+
+def summarize_transect(profile):
+    """
+    Length, class composition and uncertainty summary of a transect profile.
+
+    Returns:
+        dict: length (m), samples, class_fractions ({name: fraction}),
+            uncertainty_mean, uncertainty_max (None when nothing is valid)
+    """
+    classes = profile['class']
+    valid = classes >= 0
+    fractions = {}
+    if valid.any():
+        codes, counts = np.unique(classes[valid], return_counts=True)
+        fractions = {CLASS_NAMES.get(int(c), str(int(c))): float(n) / int(valid.sum()) for c, n in zip(codes, counts)}
+    uncertainty = profile['uncertainty'][~np.isnan(profile['uncertainty'])]
+    return {
+        'length': float(profile['distance'][-1]),
+        'samples': int(len(classes)),
+        'class_fractions': fractions,
+        'uncertainty_mean': float(uncertainty.mean()) if uncertainty.size else None,
+        'uncertainty_max': float(uncertainty.max()) if uncertainty.size else None,
+    }
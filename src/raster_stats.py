@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import numpy as np
+import rasterio
+from pathlib import Path
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from src.read_cache import open_raster
+
+# Histogram resolution and per-read memory budget
+DEFAULT_BINS = 64
+DEFAULT_BLOCK_BUDGET_MB = 64
+# Target size (pixels on the long side) for overview-based approximate stats
+APPROX_SIZE = 1024
+# Fallback location for sidecars when the raster's directory is read-only
+STATS_CACHE_DIR = os.environ.get('STATS_CACHE_DIR', 'dataset/cache/stats')
+SIDECAR_VERSION = 1
+
+class StreamingHistogram:
+    """
+    Fixed-bin histogram accumulated block by block without knowing the range upfront.
+
+    The range starts at the first block's span and doubles (merging adjacent
+    bins pairwise) whenever a later block falls outside it, so bin edges stay
+    exact and a single pass suffices.
+    """
+
+    def __init__(self, bins: int = DEFAULT_BINS, value_range: tuple | None = None):
+        if bins % 2:
+            raise ValueError("bins must be even")
+        self.bins = bins
+        self.fixed = value_range is not None
+        self.lo, self.hi = value_range if value_range else (None, None)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.outside = 0
+
+    def _grow_to(self, vmin: float, vmax: float):
+        half = self.bins // 2
+        while vmax > self.hi:
+            merged = self.counts.reshape(half, 2).sum(axis=1)
+            self.counts = np.concatenate([merged, np.zeros(half, dtype=np.int64)])
+            self.hi = self.lo + 2 * (self.hi - self.lo)
+        while vmin < self.lo:
+            merged = self.counts.reshape(half, 2).sum(axis=1)
+            self.counts = np.concatenate([np.zeros(half, dtype=np.int64), merged])
+            self.lo = self.hi - 2 * (self.hi - self.lo)
+
+    def update(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.lo is None:
+            self.lo, self.hi = vmin, vmax if vmax > vmin else vmin + 1.0
+        if self.fixed:
+            inside = (values >= self.lo) & (values <= self.hi)
+            self.outside += int(values.size - np.count_nonzero(inside))
+            values = values[inside]
+        else:
+            self._grow_to(vmin, vmax)
+        counts, _ = np.histogram(values, bins=self.bins, range=(self.lo, self.hi))
+        self.counts += counts
+
+    def to_dict(self) -> dict:
+        edges = np.linspace(self.lo, self.hi, self.bins + 1) if self.lo is not None else []
+        return {
+            "edges": [float(e) for e in edges],
+            "counts": self.counts.tolist(),
+            "outside": self.outside,
+        }
+
+def histogram_percentiles(histogram: dict, percentiles) -> list:
+    """
+    Approximate percentiles from a histogram returned by compute_band_stats().
+
+    Values are interpolated linearly within bins, so precision is one bin width.
+    """
+    edges = np.asarray(histogram["edges"], dtype=np.float64)
+    counts = np.asarray(histogram["counts"], dtype=np.float64)
+    if edges.size == 0 or counts.sum() == 0:
+        return [None for _ in percentiles]
+    cdf = np.concatenate([[0.0], np.cumsum(counts)]) / counts.sum()
+    return [float(np.interp(p / 100.0, cdf, edges)) for p in percentiles]
+
+def _row_strips(src: rasterio.io.DatasetReader, band: int, block_budget_mb: float):
+    """Full-width windows, aligned to internal blocks, each within the memory budget."""
+    block_h = src.block_shapes[band - 1][0]
+    row_bytes = src.width * np.dtype(src.dtypes[band - 1]).itemsize
+    rows = max(1, int(block_budget_mb * 1024 * 1024 // row_bytes) // block_h) * block_h
+    for row in range(0, src.height, rows):
+        yield Window(0, row, src.width, min(rows, src.height - row))
+
+def _accumulate(arrays, bins: int, value_range: tuple | None) -> dict:
+    """Single vectorized pass over masked arrays: min, max, mean, std, counts, histogram."""
+    hist = StreamingHistogram(bins, value_range)
+    vmin, vmax = np.inf, -np.inf
+    total = total_sq = 0.0
+    count = nan_count = nodata_count = 0
+    for data in arrays:
+        values = np.ma.getdata(data)
+        mask = np.ma.getmaskarray(data)
+        nan = np.isnan(values) if np.issubdtype(values.dtype, np.floating) else np.zeros(values.shape, bool)
+        nan_count += int(np.count_nonzero(nan))
+        nodata_count += int(np.count_nonzero(mask & ~nan))
+        valid = values[~(mask | nan)].astype(np.float64)
+        if valid.size:
+            vmin = min(vmin, float(valid.min()))
+            vmax = max(vmax, float(valid.max()))
+            total += float(valid.sum())
+            total_sq += float(np.square(valid).sum())
+            count += valid.size
+            hist.update(valid)
+    mean = total / count if count else None
+    return {
+        "min": vmin if count else None,
+        "max": vmax if count else None,
+        "mean": mean,
+        "std": float(np.sqrt(max(total_sq / count - mean * mean, 0.0))) if count else None,
+        "count": count,
+        "nan_count": nan_count,
+        "nodata_count": nodata_count,
+        "histogram": hist.to_dict(),
+    }
+
+def _scan_band(path: str, band: int, bins: int, value_range: tuple | None,
+               approximate: bool, block_budget_mb: float) -> dict:
+    with open_raster(path) as src:
+        if approximate:
+            # Decimated read: GDAL serves it from the closest overview when present
+            scale = max(1.0, max(src.width, src.height) / APPROX_SIZE)
+            out_shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+            arrays = [src.read(band, out_shape=out_shape, masked=True, resampling=Resampling.nearest)]
+        else:
+            arrays = (src.read(band, window=w, masked=True) for w in _row_strips(src, band, block_budget_mb))
+        stats = _accumulate(arrays, bins, value_range)
+    stats["approximate"] = approximate
+    return stats
+
+def sidecar_path(path: str) -> Path:
+    """
+    Location of the statistics sidecar for a raster.
+
+    `<raster>.aux.json` next to the file when its directory is writable,
+    otherwise a hashed file under STATS_CACHE_DIR.
+    """
+    path = Path(path)
+    if os.access(path.parent, os.W_OK):
+        return path.with_name(path.name + ".aux.json")
+    digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:16]
+    return Path(STATS_CACHE_DIR) / f"{path.name}.{digest}.aux.json"
+
+def _source_signature(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "version": SIDECAR_VERSION}
+
+def _load_sidecar(path: str) -> dict:
+    try:
+        with open(sidecar_path(path)) as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if sidecar.get("source") != _source_signature(path):
+        return {}
+    return sidecar.get("bands", {})
+
+def _save_sidecar(path: str, bands: dict):
+    target = sidecar_path(path)
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"source": _source_signature(path), "bands": bands}, f)
+        os.replace(tmp, target)
+    except OSError as e:
+        print(f"Warning: could not write statistics sidecar {target}: {e}")
+
+def compute_band_stats(path: str, band: int = 2, bins: int = DEFAULT_BINS,
+                       value_range: tuple | None = None, approximate: bool = False,
+                       use_sidecar: bool = True,
+                       block_budget_mb: float = DEFAULT_BLOCK_BUDGET_MB) -> dict:
+    """
+    Streams one band block-by-block and returns its statistics.
+
+    Results are stored in a sidecar keyed by the file's size and mtime, so
+    repeated calls return without reading pixels. Exact results also answer
+    later approximate requests.
+
+    Args:
+        path: Raster path
+        band: 1-based band index
+        bins: Number of histogram bins (even)
+        value_range: Fixed histogram range; adaptive when None
+        approximate: Use overviews / decimated reads for a fast estimate
+        use_sidecar: Read and write the cached sidecar
+        block_budget_mb: Memory budget per read window
+
+    Returns:
+        dict: min, max, mean, std, count, nan_count, nodata_count, histogram, approximate
+    """
+    key = f"{band}:{bins}:{value_range}"
+    cached = _load_sidecar(path) if use_sidecar else {}
+    for variant in ("exact", "approximate" if approximate else None):
+        if variant and variant in cached.get(key, {}):
+            return cached[key][variant]
+
+    stats = _scan_band(path, band, bins, value_range, approximate, block_budget_mb)
+
+    if use_sidecar:
+        cached.setdefault(key, {})["approximate" if approximate else "exact"] = stats
+        _save_sidecar(path, cached)
+    return stats
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.raster_stats <raster> [band] [--approx]")
+        sys.exit(1)
+    target_band = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else 2
+    result = compute_band_stats(sys.argv[1], band=target_band, approximate="--approx" in sys.argv)
+    print(json.dumps({k: v for k, v in result.items() if k != "histogram"}, indent=2))
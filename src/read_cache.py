@@ -0,0 +1,482 @@
+"""
+Local Read-through Cache for NAS Files
+
+Every raster and shapefile in dataset/config.yaml lives on the NAS, so each
+cold tile source, map-center lookup, validator run and shapefile read paid
+network-filesystem latency. Reads of files under READ_CACHE_PREFIXES go
+through a cache on local disk instead:
+
+- Rasters are opened through a rasterio opener (see open_raster()) that
+  serves GDAL's reads from fixed-size chunks of the source file. A missing
+  chunk is read from the NAS once and stored; later opens, in this or any
+  other process, read it from local disk. Readers that reopen files by name
+  on their own threads (rioxarray) read the NAS path directly.
+- Vector layers are read by pyogrio, which bundles its own GDAL and cannot
+  use the opener, so local_path() mirrors the whole layer (the shapefile
+  and its sidecars) to local disk and returns the copy's path.
+
+Entries are keyed by the source's path, size and mtime, so a replaced file
+is read from the NAS again; stale entries age out. The store is an LRU
+bounded by READ_CACHE_MB (recency is the file mtime, as in the tile cache).
+
+Environment:
+    READ_CACHE_DIR        Cache directory (default dataset/cache/nas)
+    READ_CACHE_MB         Size cap in MB (default 10240)
+    READ_CACHE_CHUNK_KB   Raster chunk size in KB (default 1024)
+    READ_CACHE_PREFIXES   os.pathsep-separated directories whose files are
+                          cached (default /home/NAS; empty disables the cache)
+
+Usage:
+    python -m src.read_cache [path ...]    # Warm the cache for files (default: the configured scene)
+"""
+
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from contextvars import copy_context
+from pathlib import Path
+
+from rasterio.abc import FileContainer
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+READ_CACHE_DIR = os.environ.get('READ_CACHE_DIR', 'dataset/cache/nas')
+READ_CACHE_BYTES = int(os.environ.get('READ_CACHE_MB', 10240)) * 1024 * 1024
+READ_CACHE_CHUNK_BYTES = int(os.environ.get('READ_CACHE_CHUNK_KB', 1024)) * 1024
+READ_CACHE_PREFIXES = tuple(
+    p for p in os.environ.get('READ_CACHE_PREFIXES', '/home/NAS').split(os.pathsep) if p
+)
+MANIFEST_NAME = '.sources.json'
+VECTOR_EXTENSIONS = ('.shp', '.gpkg', '.fgb', '.geojson', '.json')
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+# ============================================================================
+# Cached Files
+# ============================================================================
+
+class CachedFile(io.RawIOBase):
+    """
+    Read-only file object serving a source file from the chunk store.
+
+    The source itself is only opened when a chunk is missing. The most
+    recently read chunk is kept in memory, since GDAL issues many small
+    reads (e.g. of TIFF headers) within one chunk.
+    """
+
+    def __init__(self, cache, path):
+        super().__init__()
+        self.cache = cache
+        self.path = path
+        self._pos = 0
+        self._fd = None
+        self._chunk = (None, b"")
+        self.size, self.mtime_ns = _signature(path)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def _read_source(self, offset, size):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY)
+        return os.pread(self._fd, size, offset)
+
+    def _get_chunk(self, index):
+        if self._chunk[0] != index:
+            self._chunk = index, self.cache.read_chunk(self, index)
+        return self._chunk[1]
+
+    def pread(self, offset, size):
+        """Read up to size bytes at offset without moving the file position."""
+        end = min(offset + size, self.size)
+        chunk_size = self.cache.chunk_size
+        parts = []
+        while offset < end:
+            index, start = divmod(offset, chunk_size)
+            chunk = self._get_chunk(index)
+            part = chunk[start:start + end - offset]
+            if not part:
+                break
+            parts.append(part)
+            offset += len(part)
+        return b"".join(parts)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(0, self.size - self._pos)
+        data = self.pread(self._pos, size)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._chunk = (None, b"")
+        super().close()
+
+
+class _CacheOpener(FileContainer):
+    """rasterio opener answering GDAL's file-system calls for cached paths."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def open(self, path, mode="rb", **kwargs):
+        if "r" not in mode or "+" in mode:
+            raise ValueError(f"Read cache files are read-only (mode {mode!r})")
+        return CachedFile(self.cache, path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def ls(self, path):
+        return [os.path.join(path, name) for name in os.listdir(path)]
+
+    def mtime(self, path):
+        return int(os.stat(path).st_mtime)
+
+    def rm(self, path):
+        raise PermissionError("Read cache files are read-only")
+
+    def size(self, path):
+        return os.stat(path).st_size
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+
+class ReadCache:
+    """
+    Chunked on-disk copy of files under a set of (network) directories.
+
+    Args:
+        cache_dir: Local directory for chunks and mirrored files
+        max_bytes: Size cap of the store (None for unbounded)
+        chunk_size: Raster chunk size in bytes
+        prefixes: Directories whose files are cached (empty disables the cache)
+    """
+
+    def __init__(self, cache_dir=READ_CACHE_DIR, max_bytes=READ_CACHE_BYTES,
+                 chunk_size=READ_CACHE_CHUNK_BYTES, prefixes=READ_CACHE_PREFIXES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.chunk_size = int(chunk_size)
+        self.prefixes = tuple(os.path.join(os.path.abspath(p), '') for p in prefixes)
+        self.opener = _CacheOpener(self)
+        self._used = None
+        self._lock = threading.Lock()
+        self._mirror_lock = threading.Lock()
+        self.counters = {
+            'chunk_hits': 0,
+            'chunk_misses': 0,
+            'bytes_fetched': 0,
+            'files_mirrored': 0,
+            'evictions': 0,
+        }
+
+    def covers(self, path):
+        """True when reads of path go through the cache."""
+        return bool(self.prefixes) and os.path.abspath(path).startswith(self.prefixes)
+
+    # ------------------------------------------------------------------------
+    # Raster chunks
+    # ------------------------------------------------------------------------
+
+    def _chunk_path(self, file, index):
+        key = (os.path.abspath(file.path), file.size, file.mtime_ns, self.chunk_size, index)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return self.cache_dir / 'chunks' / digest[:2] / f"{digest}.chunk"
+
+    def read_chunk(self, file, index):
+        """
+        One chunk of a source file, from local disk or (once) from the source.
+
+        Args:
+            file: CachedFile of the source
+            index: Chunk number
+
+        Returns:
+            bytes: The chunk (shorter than chunk_size at the end of the file)
+        """
+        path = self._chunk_path(file, index)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            data = None
+        if data is not None:
+            try:
+                os.utime(path)  # Refresh recency for eviction
+            except OSError:
+                pass
+            with self._lock:
+                self.counters['chunk_hits'] += 1
+            return data
+
+        data = file._read_source(index * self.chunk_size, self.chunk_size)
+        with self._lock:
+            self.counters['chunk_misses'] += 1
+            self.counters['bytes_fetched'] += len(data)
+        self._store(path, data)
+        return data
+
+    def _store(self, path, data):
+        self._init_usage()  # Before the write, so the first scan does not count it
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[CACHE] Read cache write failed: {e}")
+            return
+        self._grow(len(data))
+
+    def open(self, path):
+        """Open a source file for reading through the chunk store."""
+        return CachedFile(self, path)
+
+    # ------------------------------------------------------------------------
+    # Mirrored files (vector layers)
+    # ------------------------------------------------------------------------
+
+    def _mirror_dir(self, path):
+        stem = os.path.splitext(os.path.abspath(path))[0]
+        return self.cache_dir / 'files' / hashlib.sha1(stem.encode()).hexdigest()
+
+    def local_path(self, path):
+        """
+        Local copy of a file and its sidecars (files sharing its stem, e.g. .shx/.dbf/.prj).
+
+        Members whose size or mtime changed are copied again.
+
+        Returns:
+            str: Path of the local copy
+        """
+        source = Path(path).absolute()
+        members = sorted(p for p in source.parent.glob(f"{glob.escape(source.stem)}.*") if p.is_file())
+        mirror = self._mirror_dir(source)
+        manifest_path = mirror / MANIFEST_NAME
+        with self._mirror_lock:
+            self._init_usage()
+            try:
+                manifest = json.loads(manifest_path.read_text())
+            except (OSError, ValueError):
+                manifest = {}
+            current = {}
+            copied = 0
+            mirror.mkdir(parents=True, exist_ok=True)
+            for member in members:
+                signature = list(_signature(member))
+                target = mirror / member.name
+                if manifest.get(member.name) != signature or not target.exists():
+                    tmp = target.with_name(f".{member.name}.{os.getpid()}.tmp")
+                    shutil.copyfile(member, tmp)
+                    os.replace(tmp, target)
+                    copied += 1
+                current[member.name] = signature
+            for name in set(manifest) - set(current):
+                (mirror / name).unlink(missing_ok=True)
+            tmp = manifest_path.with_name(f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(current))
+            os.replace(tmp, manifest_path)  # Also refreshes recency for eviction
+            # Size change of the mirror, counted once its manifest is current
+            self._grow(sum(sig[0] for sig in current.values()) - sum(sig[0] for sig in manifest.values()), keep=mirror)
+        if copied:
+            with self._lock:
+                self.counters['files_mirrored'] += copied
+            print(f"[CACHE] Mirrored {copied} file(s) of {source.name} to local disk")
+        return str(mirror / source.name)
+
+    # ------------------------------------------------------------------------
+    # Size cap
+    # ------------------------------------------------------------------------
+
+    def _entries(self):
+        """(recency, size, paths, owner) per evictable entry: a chunk or a whole mirror."""
+        entries = []
+        for f in self.cache_dir.glob('chunks/*/*.chunk'):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, [f], f))
+        for mirror in self.cache_dir.glob('files/*'):
+            try:
+                recency = (mirror / MANIFEST_NAME).stat().st_mtime
+                files = [f for f in mirror.iterdir() if f.name != MANIFEST_NAME]
+                size = sum(f.stat().st_size for f in files)
+            except OSError:
+                continue
+            entries.append((recency, size, files + [mirror / MANIFEST_NAME], mirror))
+        return entries
+
+    def _init_usage(self):
+        """Scan the store once; later writes are added by _grow()."""
+        with self._lock:
+            if self._used is None:
+                self._used = sum(entry[1] for entry in self._entries()) if self.cache_dir.exists() else 0
+
+    def _grow(self, size, keep=None):
+        with self._lock:
+            self._used += size
+            over_budget = self.max_bytes is not None and self._used > self.max_bytes
+        if over_budget:
+            self._evict(keep)
+
+    def _evict(self, keep=None):
+        """
+        Drop least recently used entries until the store is at 90% of its cap.
+
+        Args:
+            keep: Entry (chunk file or mirror directory) never to evict, e.g. the mirror being refreshed
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[0])
+        total = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, files, owner in entries:
+            if total <= target:
+                break
+            if owner == keep:
+                continue
+            for f in files:
+                try:
+                    f.unlink()
+                except OSError:
+                    pass
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._used = total
+            self.counters['evictions'] += evicted
+
+    def stats(self):
+        """Return the store size and hit/miss counters."""
+        with self._lock:
+            return {'bytes': self._used, 'max_bytes': self.max_bytes, **self.counters}
+
+
+# ============================================================================
+# Process-wide Instance
+# ============================================================================
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_read_cache():
+    """
+    Return the process-wide ReadCache, creating it on first call.
+
+    Returns:
+        ReadCache: Shared cache
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ReadCache()
+        return _CACHE
+
+
+def opener_kwargs(path):
+    """
+    Keyword arguments routing a rasterio.open() of path through the cache.
+
+    Returns:
+        dict: {'opener': ...} for cached paths, otherwise empty
+    """
+    cache = get_read_cache()
+    return {'opener': cache.opener} if cache.covers(path) else {}
+
+
+def open_raster(path, **kwargs):
+    """
+    rasterio.open() for reading, through the cache when path is under a cached prefix.
+
+    rasterio keeps an opener's state in the opening thread's context: a cached
+    dataset reads from any thread, but must be closed on the thread that opened
+    it. Long-lived handles closed elsewhere close through closer_for().
+    """
+    import rasterio
+
+    return rasterio.open(path, **opener_kwargs(path), **kwargs)
+
+
+def closer_for(dataset):
+    """
+    Callable closing a dataset in the context of the thread that opened it.
+
+    Call it on the opening thread, right after open_raster(); the returned
+    callable may then run on any thread.
+
+    Returns:
+        callable: Closes the dataset
+    """
+    context = copy_context()
+    return lambda: context.copy().run(dataset.close)
+
+
+def local_path(path):
+    """Path to read a vector layer from: a local mirror for cached paths, otherwise path itself."""
+    cache = get_read_cache()
+    return cache.local_path(path) if cache.covers(path) else str(path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    paths = sys.argv[1:]
+    if not paths:
+        from src.config import get_scene
+
+        scene = get_scene()
+        paths = [scene['input_path'], scene['output_path'], scene['watershed_path']]
+    cache = get_read_cache()
+    for p in paths:
+        if not cache.covers(p):
+            print(f"[CACHE] Not under {READ_CACHE_PREFIXES}: {p}")
+        elif p.lower().endswith(VECTOR_EXTENSIONS):
+            print(f"[CACHE] Cached {local_path(p)}")
+        else:
+            with cache.open(p) as f:
+                while f.read(cache.chunk_size * 16):
+                    pass
+            print(f"[CACHE] Cached {p}")
+    print(f"[CACHE] {cache.stats()}")
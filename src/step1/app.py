@@ -1,17 +1,10 @@
 import solara
 import os
-import geopandas as gpd
-import ee
-import geemap
-from ipyleaflet import GeoJSON
-from src.step1.utils import get_candidate_watersheds, save_selected_watershed
+from src.step1.utils import get_candidate_watersheds, get_watershed_pyramid, save_selected_watershed
 import src.state as state
 
-# Initialize Earth Engine with geemap-484609 project
-try:
-    ee.Initialize(project="geemap-484609")
-except Exception:
-    print("Note: Earth Engine initialization skipped")
+# geemap / ipyleaflet are imported inside Page, and Earth Engine is initialized
+# lazily through src.bootstrap only when a feature needs it.
 
 # Shared State
 selected_watershed_id = solara.reactive(None)
@@ -34,6 +27,85 @@ def load_data():
         if len(gdf) == 1:
             selected_watershed_id.set(gdf.iloc[0]['HYBAS_ID'])
 
+def _create_map(cx, cy, zoom):
+    """Map - local data only, no Earth Engine session required."""
+    import geemap
+    
+    m = geemap.Map(center=[cy, cx], zoom=zoom,
+                   ee_initialize=False,
+                   toolbar_ctrl=False,
+                   draw_ctrl=False,
+                   data_ctrl=False,
+                   search_control=False)
+    m.add_basemap("OpenStreetMap")
+    return m
+
+def _create_candidates_layer(gdf, zoom):
+    """
+    All candidate watersheds (blue outline); clicking one selects it.
+    
+    Returns:
+        tuple: (GeoJSON layer, GeometryPyramid), or None without candidates
+    """
+    if gdf is None:
+        return None
+    from ipyleaflet import GeoJSON
+    
+    style_candidates = {'color': 'blue', 'fillOpacity': 0.1, 'weight': 2}
+    candidates = get_watershed_pyramid(gdf['HYBAS_ID'], style_candidates)
+    json_candidates = GeoJSON(data=candidates.for_zoom(zoom), name="Candidates")
+    
+    # Click Handler
+    def handle_click(event=None, feature=None, **kwargs):
+        if feature:
+           props = feature.get("properties", {})
+           hid = props.get("HYBAS_ID")
+           if hid:
+               print(f"Clicked Watershed: {hid}")
+               selected_watershed_id.set(int(hid))
+
+    json_candidates.on_click(handle_click)
+    return json_candidates, candidates
+
+def _create_selected_layer(gdf, current_id, zoom):
+    """
+    The selected watershed (yellow fill).
+    
+    Returns:
+        tuple: (GeoJSON layer, GeometryPyramid), or None without a selection
+    """
+    if gdf is None or not current_id:
+        return None
+    selected_row = gdf[gdf['HYBAS_ID'] == int(current_id)]
+    if selected_row.empty:
+        return None
+    from ipyleaflet import GeoJSON
+    
+    style_selected = {'color': 'red', 'fillColor': 'yellow', 'fillOpacity': 0.5, 'weight': 3}
+    selected = get_watershed_pyramid([current_id], style_selected)
+    return GeoJSON(data=selected.for_zoom(zoom), name="Selected"), selected
+
+def _show_layer(m, overlay):
+    """
+    Add an overlay to the map, simplified to the map zoom (see src/hydrobasins/pyramid.py).
+    
+    Returns:
+        callable: Cleanup removing the layer and its zoom observer, or None without an overlay
+    """
+    if overlay is None:
+        return None
+    from src.hydrobasins.pyramid import follow_zoom
+    
+    layer, pyramid = overlay
+    m.add_layer(layer)
+    stop_following = follow_zoom(m, layer, pyramid)
+    
+    def cleanup():
+        stop_following()
+        if layer in m.layers:
+            m.remove_layer(layer)
+    return cleanup
+
 @solara.component
 def Page():
     # Load data once
@@ -43,6 +115,15 @@ def Page():
     gdf = candidates_gdf.value
     cx, cy, zoom = map_center.value
     
+    # One map per session; overlays are rebuilt only when their data changes, and
+    # their zoom observers are removed with them
+    m = solara.use_memo(lambda: _create_map(cx, cy, zoom), dependencies=[])
+    candidates = solara.use_memo(lambda: _create_candidates_layer(gdf, zoom), dependencies=[gdf])
+    selected = solara.use_memo(lambda: _create_selected_layer(gdf, current_id, zoom),
+                               dependencies=[gdf, current_id])
+    solara.use_effect(lambda: _show_layer(m, candidates), dependencies=[candidates])
+    solara.use_effect(lambda: _show_layer(m, selected), dependencies=[selected])
+    
     def on_map_interaction(**kwargs):
         # Geemap click handling is tricky in Solara.
         # We use a widget callback or FeatureLayer "on_click" if possible.
@@ -78,39 +159,6 @@ def Page():
             if gdf is not None:
                 solara.Text(f"Candidates Found: {len(gdf)}")
 
-        # Map - using geemap with project geemap-484609
-        m = geemap.Map(center=[cy, cx], zoom=zoom,
-                       toolbar_ctrl=False,
-                       draw_ctrl=False,
-                       data_ctrl=False,
-                       search_control=False)
-        m.add_basemap("OpenStreetMap")
-        
-        if gdf is not None:
-            # 1. Overlay All Candidates (Blue Outline)
-            style_candidates = {'color': 'blue', 'fillOpacity': 0.1, 'weight': 2}
-            json_candidates = GeoJSON(data=gdf.__geo_interface__, style=style_candidates, name="Candidates")
-            
-            # Click Handler
-            def handle_click(event=None, feature=None, **kwargs):
-                if feature:
-                   props = feature.get("properties", {})
-                   hid = props.get("HYBAS_ID")
-                   if hid:
-                       print(f"Clicked Watershed: {hid}")
-                       selected_watershed_id.set(int(hid))
-
-            json_candidates.on_click(handle_click)
-            m.add_layer(json_candidates)
-            
-            # 2. Overlay Selected (Yellow Fill)
-            if current_id:
-                selected_row = gdf[gdf['HYBAS_ID'] == int(current_id)]
-                if not selected_row.empty:
-                    style_selected = {'color': 'red', 'fillColor': 'yellow', 'fillOpacity': 0.5, 'weight': 3}
-                    json_selected = GeoJSON(data=selected_row.__geo_interface__, style=style_selected, name="Selected")
-                    m.add_layer(json_selected)
-        
         solara.display(m)
 
 if __name__ == "__main__":
@@ -1,75 +1,120 @@
-import geopandas as gpd
-import rioxarray
-import yaml
+import functools
 import os
+import numpy as np
+import shapely
 from shapely.geometry import box
+from src.config import get_config, save_config
+from src.hydrobasins.store import ID_FIELD, read_basins_by_bbox
+
+# Points per footprint edge when reprojecting (captures curvature and rotation)
+FOOTPRINT_DENSIFY_POINTS = 21
 
 def load_config():
-    with open("dataset/config.yaml", "r") as f:
-        return yaml.safe_load(f)
+    return get_config()
+
+def raster_footprint(input_path, densify_points=FOOTPRINT_DENSIFY_POINTS):
+    """
+    Image footprint polygon in EPSG:4326.
+    
+    The native bounds are densified along each edge before reprojection, so
+    rotated or strongly curved footprints (e.g. UTM near zone edges) are not
+    truncated to the box spanned by two corners.
+    
+    Returns:
+        Polygon: Footprint in EPSG:4326
+    """
+    from pyproj import Transformer
+
+    from src.read_cache import open_raster
+    
+    # Header-only read: no pixel data is loaded
+    with open_raster(input_path) as src:
+        src_crs = src.crs
+        left, bottom, right, top = src.bounds
+    
+    footprint = box(left, bottom, right, top)
+    if not src_crs or src_crs == "EPSG:4326":
+        return footprint
+    
+    step = max(right - left, top - bottom) / (densify_points - 1)
+    footprint = shapely.segmentize(footprint, step)
+    transformer = Transformer.from_crs(src_crs, "EPSG:4326", always_xy=True)
+    return shapely.transform(
+        footprint, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1]))
+    )
+
+@functools.lru_cache(maxsize=8)
+def _find_candidates(input_path, input_mtime, shp_path, shp_mtime):
+    print(f"Reading footprint of {os.path.basename(input_path)}...")
+    footprint = raster_footprint(input_path)
+    bounds_4326 = tuple(float(v) for v in footprint.bounds)
+    print(f"Image Bounds (4326): {bounds_4326}")
+    
+    # Bbox pre-filter through the indexed basin store, reading only the
+    # HYBAS_ID and geometry columns (falls back to a bbox read of the shapefile)
+    print(f"Filtering watersheds from {os.path.basename(shp_path)}...")
+    gdf = read_basins_by_bbox(shp_path, bounds_4326, columns=[ID_FIELD])
+    
+    # Exact refinement against the real footprint polygon (vectorized)
+    tree = shapely.STRtree(gdf.geometry.values)
+    hits = np.sort(tree.query(footprint, predicate="intersects"))
+    gdf = gdf.iloc[hits].reset_index(drop=True)
+    return gdf, bounds_4326
 
 def get_candidate_watersheds():
     """
     Finds watersheds that intersect with the input Sentinel-2 image.
+    
+    Results are memoized per (raster path, raster mtime, shapefile mtime), so
+    reopening Step 1 does not touch the shapefile again.
+    
     Returns:
-        gdf (GeoDataFrame): Filtered watersheds.
+        gdf (GeoDataFrame): Filtered watersheds (HYBAS_ID, geometry).
         bounds (tuple): Image bounds (minx, miny, maxx, maxy) in EPSG:4326.
     """
     config = load_config()
     input_path = config["model"]["input_path"]
     shp_path = config["watershed"]["path"]
     
-    # 1. Get Image Bounds
-    print(f"Reading bounds from {os.path.basename(input_path)}...")
-    with rioxarray.open_rasterio(input_path) as src:
-        # Reproject bounds to EPSG:4326 if needed
-        # rioxarray bounds are in native CRS
-        # We need to transform them to 4326 to match shapefile (usually 4326)
-        # OR transform shapefile to match raster.
-        # Ideally, we work in 4326 for Leaflet compatibility.
-        
-        # Get bounds in 4326
-        # Reprojecting the whole raster is slow, just reproject bounds.
-        from pyproj import Transformer
-        
-        src_crs = src.rio.crs
-        dst_crs = "EPSG:4326"
-        
-        bounds_native = src.rio.bounds() # (left, bottom, right, top)
-        
-        # Transform bounds
-        transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
-        minx, miny = transformer.transform(bounds_native[0], bounds_native[1])
-        maxx, maxy = transformer.transform(bounds_native[2], bounds_native[3])
-        
-        # Handle flipped coordinates if any (e.g. south up)
-        minx, maxx = sorted((minx, maxx))
-        miny, maxy = sorted((miny, maxy))
+    gdf, bounds_4326 = find_candidate_watersheds(input_path, shp_path)
+    print(f"Found {len(gdf)} intersecting watersheds.")
+    return gdf, bounds_4326
+
+def find_candidate_watersheds(input_path, shp_path):
+    """
+    Watersheds intersecting a raster's footprint (memoized per file mtimes).
+    
+    Args:
+        input_path: Raster path
+        shp_path: HydroBASINS shapefile path
         
-        bounds_4326 = (minx, miny, maxx, maxy)
-        print(f"Image Bounds (4326): {bounds_4326}")
+    Returns:
+        tuple: (GeoDataFrame of HYBAS_ID + geometry, bounds in EPSG:4326)
+    """
+    gdf, bounds_4326 = _find_candidates(
+        input_path, os.stat(input_path).st_mtime_ns,
+        shp_path, os.stat(shp_path).st_mtime_ns
+    )
+    # Copy so callers cannot mutate the memoized frame
+    return gdf.copy(), bounds_4326
 
-    # 2. visual bbox for map
-    image_bbox = box(minx, miny, maxx, maxy)
+def get_watershed_pyramid(hybas_ids, style):
+    """
+    Zoom-dependent GeoJSON of watersheds from the configured layer.
     
-    # 3. Load & Filter Shapefile
-    print(f"Filtering watersheds from {os.path.basename(shp_path)}...")
-    # Use cx for spatial indexing (fast)
-    # Note: cx takes [minx:maxx, miny:maxy]
-    # We read mainly the relevant chunk.
-    # However, cx works on an ALREADY loaded GDF usually? 
-    # geopandas.read_file with bbox is supported! This is fastest.
+    Memoized per basin set and style (see src/hydrobasins/pyramid.py).
     
-    gdf = gpd.read_file(shp_path, bbox=bounds_4326)
+    Returns:
+        GeometryPyramid: Bind to a map layer with follow_zoom()
+    """
+    from src.hydrobasins.pyramid import basin_pyramid
     
-    print(f"Found {len(gdf)} intersecting watersheds.")
-    return gdf, bounds_4326
+    return basin_pyramid(load_config()["watershed"]["path"], hybas_ids, style=style)
 
 def save_selected_watershed(hybas_id):
     """Updates config.yaml with the selected ID."""
     config = load_config()
     config["watershed"]["default_id"] = int(hybas_id)
     
-    with open("dataset/config.yaml", "w") as f:
-        yaml.safe_dump(config, f)
+    save_config(config)
     print(f"Updated config with Watershed ID: {hybas_id}")
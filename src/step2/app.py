@@ -7,21 +7,27 @@ and uncertainty mapping using Solara, geemap, and localtileserver.
 Features:
 - Display Sentinel-2 imagery and model outputs
 - Split-map view for side-by-side comparison
-- Interactive uncertainty threshold filtering
+- Interactive uncertainty threshold filtering (server-side band-math flood mask)
 - Watershed boundary overlay
+- Runtime scene switching from the local scene catalog
+- Click-to-inspect pixel values and transect profiles
+- Per-watershed flooded area and uncertainty statistics
+- IMERG return-period precipitation overlay
+- Clipped COG export of the watershed (or its upstream catchment)
 """
 
 import os
+import math
+import time
 import functools
 import solara
-import geemap
-import rioxarray
-import yaml
-import ee
-import geopandas as gpd
-from ipyleaflet import GeoJSON, SplitMapControl
-from localtileserver import TileClient, get_leaflet_tile_layer
-from pyproj import Transformer
+from src import bootstrap, metrics
+from src.catalog import SCENE_CACHE_SIZE, get_catalog, get_catalog_scene
+from src.tiles.bandmath import DEFAULT_EXPRESSION as DEFAULT_MASK_EXPRESSION
+
+# Heavy geospatial imports (geemap, localtileserver, geopandas, rasterio)
+# are deferred to the functions that need them, so importing this module
+# stays cheap and Solara can serve the first byte quickly.
 
 # ============================================================================
 # Configuration Constants
@@ -31,9 +37,9 @@ from pyproj import Transformer
 TILE_SERVER_HOST = '0.0.0.0'  # Listen on all network interfaces
 TILE_SERVER_PORT = 9000        # Fixed port for VSCode auto-forwarding
 CLIENT_HOST = 'localhost'      # Client-side host for tile requests
-
-# Earth Engine configuration
-EE_PROJECT = "geemap-484609"
+TILE_SOURCE_IDLE_TTL = int(os.environ.get('TILE_SOURCE_IDLE_TTL', 600))  # Seconds before unused sources close
+# Unused sources kept open (input + output of the most recent scenes)
+TILE_SOURCE_MAX_IDLE = int(os.environ.get('TILE_SOURCE_MAX_IDLE', 2 * SCENE_CACHE_SIZE))
 
 # Map configuration
 DEFAULT_CENTER = (20, 0)       # Default map center (lat, lon)
@@ -45,6 +51,10 @@ CLASSIFICATION_COLORMAP = 'viridis'
 UNCERTAINTY_COLORMAP = 'rdylgn_r'
 WATERSHED_COLOR = '#FFD700'    # Gold color for watershed boundary
 WATERSHED_LINE_WIDTH = 4
+UPSTREAM_COLOR = '#1E90FF'     # Dodger blue for upstream catchment
+PRECIPITATION_OPACITY = 0.6    # IMERG return-period overlay
+TRANSECT_COLOR = '#FF4500'     # Orange red for drawn transects
+FLOOD_MASK_EXPRESSION = DEFAULT_MASK_EXPRESSION  # Pixels kept by the "Flood Mask" layer
 
 # ============================================================================
 # Environment Setup
@@ -54,39 +64,6 @@ WATERSHED_LINE_WIDTH = 4
 os.environ['REST_SERVER_HOST'] = TILE_SERVER_HOST
 os.environ['LOCALTILESERVER_CLIENT_PORT'] = str(TILE_SERVER_PORT)
 
-# ============================================================================
-# Earth Engine Initialization
-# ============================================================================
-
-try:
-    ee.Initialize()
-except Exception:
-    try:
-        ee.Authenticate()
-        ee.Initialize(project=EE_PROJECT)
-    except Exception as e:
-        print(f"[STEP2] Earth Engine initialization failed: {e}")
-
-# ============================================================================
-# Load Configuration
-# ============================================================================
-
-try:
-    with open("dataset/config.yaml", "r") as f:
-        config_data = yaml.safe_load(f)
-        WATERSHED_CFG = config_data.get("watershed", {})
-        WATERSHED_PATH = WATERSHED_CFG.get("path")
-        WATERSHED_ID = WATERSHED_CFG.get("default_id")
-        INPUT_PATH = config_data["model"]["input_path"]
-        OUTPUT_PATH = config_data["model"]["output_path"]
-        print(f"[STEP2] Configuration loaded successfully")
-except Exception as e:
-    print(f"[STEP2] Configuration error: {e}")
-    WATERSHED_PATH = None
-    WATERSHED_ID = None
-    INPUT_PATH = None
-    OUTPUT_PATH = None
-
 # ============================================================================
 # Reactive State
 # ============================================================================
@@ -94,12 +71,32 @@ except Exception as e:
 uncertainty_threshold = solara.reactive(0.5)
 show_split_map = solara.reactive(True)
 map_layer_mode = solara.reactive("Flood Classification") 
+show_upstream = solara.reactive(False)
+show_precipitation = solara.reactive(False)
+precipitation_period = solara.reactive(None)  # IMERG variable; None: the longest return period
+input_composite = solara.reactive(None)   # None: the default composite (INPUT_COMPOSITE)
+current_scene = solara.reactive(None)     # Catalog scene ID; None: the configured scene
+session_suspended = solara.reactive(False)  # Map torn down after inactivity (see sessions.py)
+inspected_pixel = solara.reactive(None)   # Result of the last map click (see src/pixel_query.py)
+transect_summary = solara.reactive(None)  # Summary of the last drawn transect
+export_upstream = solara.reactive(False)  # Export the whole upstream catchment
+export_status = solara.reactive(None)     # Progress/result of the running export (see src/export.py)
 
 # ============================================================================
 # Helper Functions
 # ============================================================================
 
-@functools.lru_cache(maxsize=1)
+def active_scene():
+    """
+    The scene this session is showing.
+    
+    Returns:
+        dict: Catalog scene record (input_path, output_path, watershed_path,
+            watershed_id, ...); the configured scene unless another was selected
+    """
+    return get_catalog_scene(current_scene.value)
+
+
 def get_map_center():
     """
     Calculate the center point and zoom level for the map based on input data bounds.
@@ -107,13 +104,23 @@ def get_map_center():
     Returns:
         tuple: (longitude, latitude, zoom_level)
     """
+    return _map_center(active_scene()['input_path'])
+
+
+@functools.lru_cache(maxsize=SCENE_CACHE_SIZE)
+def _map_center(input_path):
     try:
-        if not INPUT_PATH or not os.path.exists(INPUT_PATH):
+        if not input_path or not os.path.exists(input_path):
             return DEFAULT_CENTER[1], DEFAULT_CENTER[0], DEFAULT_ZOOM
         
-        with rioxarray.open_rasterio(INPUT_PATH) as src:
-            bounds = src.rio.bounds()
-            crs = src.rio.crs
+        from pyproj import Transformer
+
+        from src.read_cache import open_raster
+        
+        # Header-only read: no pixel data is loaded
+        with open_raster(input_path) as src:
+            bounds = src.bounds
+            crs = src.crs
             cx = (bounds[0] + bounds[2]) / 2
             cy = (bounds[1] + bounds[3]) / 2
             
@@ -128,6 +135,40 @@ def get_map_center():
         return DEFAULT_CENTER[1], DEFAULT_CENTER[0], DEFAULT_ZOOM
 
 
+def get_uncertainty_max():
+    """
+    Upper bound for the "Max Uncertainty" slider, from the uncertainty band's statistics.
+    
+    Uses the cached statistics sidecar (see src/raster_stats.py); the first
+    call computes a fast overview-based estimate. Kept per output file for the
+    most recent scenes.
+    
+    Returns:
+        float: Maximum uncertainty value (1.0 if unavailable)
+    """
+    return _uncertainty_max(active_scene()['output_path'])
+
+
+@functools.lru_cache(maxsize=SCENE_CACHE_SIZE)
+def _uncertainty_max(output_path):
+    try:
+        if output_path and os.path.exists(output_path):
+            from src.raster_stats import compute_band_stats
+            
+            stats = compute_band_stats(output_path, band=2, approximate=True)
+            if stats["max"] is not None and stats["max"] > 0:
+                return math.ceil(stats["max"] * 100) / 100
+    except Exception as e:
+        print(f"[STEP2] Error reading uncertainty statistics: {e}")
+    return 1.0
+
+
+def _record_setup(step, duration):
+    """Record a session setup step in the startup report and the setup-time histogram."""
+    bootstrap.mark(step, duration)
+    metrics.SETUP_SECONDS.observe(duration, step=step)
+
+
 def _create_base_map():
     """
     Create a base geemap.Map widget with initial settings.
@@ -135,96 +176,659 @@ def _create_base_map():
     Returns:
         geemap.Map: Configured map widget
     """
+    import geemap
+    
+    start = time.perf_counter()
     cx, cy, zoom = get_map_center()
+    # Earth Engine is not needed to display local COGs; see src/bootstrap.py
     m = geemap.Map(
         center=[cy, cx],
         zoom=zoom,
+        ee_initialize=False,
         lite_mode=False,
         toolbar_ctrl=False,
         draw_ctrl=False,
         search_control=False,
         data_ctrl=False
     )
+    _record_setup("base_map", time.perf_counter() - start)
     return m
 
 
+def input_source_path(composite=None):
+    """
+    File that backs the "Sentinel-2" input layer.
+    
+    The precomputed 8-bit rendition of the requested band composite when it
+    has been built (see src/tiles/rendition.py), otherwise the raw 13-band input.
+    
+    Args:
+        composite: Composite name, or None for the first of get_input_composites()
+        
+    Returns:
+        str: Raster path or None if no input is configured
+    """
+    from src.tiles.rendition import find_rendition
+    
+    input_path = active_scene()['input_path']
+    for name in [composite] if composite else get_input_composites()[:1]:
+        rendition = find_rendition(input_path, name)
+        if rendition:
+            return rendition
+    return input_path
+
+
+def get_input_composites():
+    """
+    Band composites with a built rendition for the active scene's input.
+    
+    Returns:
+        list: Composite names, the default (INPUT_COMPOSITE) first when built;
+            empty when only the raw input exists
+    """
+    return _input_composites(active_scene()['input_path'])
+
+
+@functools.lru_cache(maxsize=SCENE_CACHE_SIZE)
+def _input_composites(input_path):
+    try:
+        from src.tiles.rendition import DEFAULT_COMPOSITE, available_composites
+        composites = available_composites(input_path)
+        return sorted(composites, key=lambda name: name != DEFAULT_COMPOSITE)
+    except Exception as e:
+        print(f"[STEP2] Error listing input renditions: {e}")
+        return []
+
+
 def _create_tile_clients():
     """
-    Create TileClient instances for input and output GeoTIFF files.
-    Uses a fixed port for compatibility with remote development environments.
+    Get the shared TileClient instances for input and output GeoTIFF files.
+    
+    Clients come from the process-wide tile source pool, so every session
+    shares one tile server on the fixed port and one open handle per file.
+    Each client returned here holds a pool reference that must be handed back
+    with _release_tile_clients().
     
     Returns:
         dict: Dictionary with 'input' and 'output' TileClient instances
     """
+    from src.tiles.cogify import get_materializer
+    from src.tiles.pool import get_tile_pool
+    
+    start = time.perf_counter()
+    input_path, output_path = input_source_path(input_composite.value), active_scene()['output_path']
+    pool = get_tile_pool(
+        host=TILE_SERVER_HOST,
+        port=TILE_SERVER_PORT,
+        client_host=CLIENT_HOST,
+        client_port=TILE_SERVER_PORT,
+        idle_ttl=TILE_SOURCE_IDLE_TTL,
+        max_idle=TILE_SOURCE_MAX_IDLE
+    )
     clients = {}
     
-    # Create input TileClient (Sentinel-2 imagery)
-    if INPUT_PATH and os.path.exists(INPUT_PATH):
+    materializer = get_materializer()
+    
+    # Input TileClient (Sentinel-2 imagery: 8-bit rendition or raw stack)
+    if input_path and os.path.exists(input_path):
         try:
-            clients['input'] = TileClient(
-                INPUT_PATH,
-                port=TILE_SERVER_PORT,
-                host=TILE_SERVER_HOST,
-                client_port=TILE_SERVER_PORT,
-                client_host=CLIENT_HOST
-            )
-            print(f"[STEP2] Input TileClient created: {clients['input'].client_base_url}")
+            # Serves the optimized copy if one is cached; otherwise the original
+            # while a copy is built in the background (see _watch_optimized_sources)
+            clients['input'] = pool.acquire(materializer.resolve(input_path)[0])
+            print(f"[STEP2] Input TileClient acquired: {clients['input'].client_base_url}")
         except Exception as e:
             print(f"[STEP2] Failed to create input TileClient: {e}")
     
-    # Create output TileClient (model predictions)
-    if OUTPUT_PATH and os.path.exists(OUTPUT_PATH):
+    # Output TileClient (model predictions)
+    if output_path and os.path.exists(output_path):
         try:
-            clients['output'] = TileClient(
-                OUTPUT_PATH,
-                port=TILE_SERVER_PORT,
-                host=TILE_SERVER_HOST,
-                client_port=TILE_SERVER_PORT,
-                client_host=CLIENT_HOST
-            )
-            print(f"[STEP2] Output TileClient created: {clients['output'].client_base_url}")
+            clients['output'] = pool.acquire(materializer.resolve(output_path)[0])
+            print(f"[STEP2] Output TileClient acquired: {clients['output'].client_base_url}")
         except Exception as e:
             print(f"[STEP2] Failed to create output TileClient: {e}")
     
+    _record_setup("tile_clients", time.perf_counter() - start)
     return clients
 
 
+def _release_tile_clients(clients):
+    """
+    Return a session's TileClients to the shared pool.
+    
+    Args:
+        clients: Dictionary returned by _create_tile_clients()
+    """
+    from src.tiles.pool import get_tile_pool
+    
+    pool = get_tile_pool()
+    for client in clients.values():
+        pool.release(client)
+
+
+def _watch_optimized_sources(tile_clients, layer_manager):
+    """
+    Switch layers to optimized copies of their rasters once they are built.
+    
+    Sources without internal tiling or overviews are served as-is while a
+    COG copy is materialized in the background (see src/tiles/cogify.py).
+    When the copy is ready the session acquires it from the pool, repoints
+    the layer and releases the original.
+    
+    Args:
+        tile_clients: Dictionary returned by _create_tile_clients()
+        layer_manager: The session's LayerManager
+        
+    Returns:
+        callable: Cleanup that stops further switches for this session
+    """
+    from src.step2.layers import call_in_context, current_kernel_context
+    from src.tiles.cogify import get_materializer
+    from src.tiles.pool import get_tile_pool
+    
+    scene = active_scene()
+    materializer = get_materializer()
+    pool = get_tile_pool()
+    context = current_kernel_context()
+    active = {'value': True}
+    
+    def switch(key, path):
+        if not active['value']:
+            return
+        try:
+            old_client = tile_clients.get(key)
+            new_client = pool.acquire(path)
+            call_in_context(context, lambda: layer_manager.replace_client(key, new_client))
+            pool.release(old_client)
+            print(f"[STEP2] Switched {key} layer to optimized copy: {os.path.basename(path)}")
+        except Exception as e:
+            print(f"[STEP2] Failed to switch {key} layer: {e}")
+    
+    sources = (('input', input_source_path(input_composite.value)), ('output', scene['output_path']))
+    for key, source in sources:
+        if key not in tile_clients:
+            continue
+        serve_path, future = materializer.resolve(source)
+        if future is not None:
+            future.add_done_callback(
+                lambda f, key=key: f.exception() is None and switch(key, f.result())
+            )
+        elif os.path.abspath(serve_path) != os.path.abspath(tile_clients[key].filename):
+            # Finished between client creation and this effect
+            switch(key, serve_path)
+    
+    def stop():
+        active['value'] = False
+    
+    return stop
+
+
+def _switch_input_composite(tile_clients, layer_manager, composite):
+    """
+    Point the input layer at the rendition of another band composite.
+    
+    Args:
+        tile_clients: Dictionary returned by _create_tile_clients()
+        layer_manager: The session's LayerManager
+        composite: Composite name
+    """
+    from src.tiles.cogify import get_materializer
+    from src.tiles.pool import get_tile_pool
+    
+    current = tile_clients.get('input')
+    source = input_source_path(composite)
+    if current is None or not source:
+        return
+    path = get_materializer().resolve(source)[0]
+    if os.path.abspath(path) == os.path.abspath(current.filename):
+        return
+    pool = get_tile_pool()
+    try:
+        layer_manager.replace_client('input', pool.acquire(path))
+        pool.release(current)
+        print(f"[STEP2] Input layer switched to {os.path.basename(path)}")
+    except Exception as e:
+        print(f"[STEP2] Failed to switch input composite: {e}")
+
+
+def _watershed_pyramid(watershed_path, watershed_id):
+    """
+    Styled watershed boundary at every detail level, shared by every session.
+    
+    Returns:
+        GeometryPyramid: See src/hydrobasins/pyramid.py; None if not found
+    """
+    from src.hydrobasins.pyramid import basin_pyramid
+    
+    # Reads only the matching feature through the indexed basin store; basin_pyramid
+    # memoizes per shapefile mtime, so a replaced shapefile is picked up
+    pyramid = basin_pyramid(watershed_path, [watershed_id], style={
+        'color': WATERSHED_COLOR,
+        'fillOpacity': 0.0,
+        'weight': WATERSHED_LINE_WIDTH
+    })
+    return pyramid if pyramid.levels[-1]['features'] else None
+
+
+def _upstream_pyramid(watershed_path, watershed_id):
+    """
+    Styled upstream catchment at every detail level, shared by every session.
+    
+    Memoized per shapefile and topology build, so it appears once the
+    topology is built and is rebuilt when either changes.
+    
+    Returns:
+        GeometryPyramid: See src/hydrobasins/pyramid.py; None if not available
+    """
+    from src.hydrobasins.topology import upstream_signature
+    
+    signature = upstream_signature(watershed_path)
+    if signature is None:
+        return None
+    return _cached_upstream_pyramid(watershed_path, int(watershed_id), signature)
+
+
+@functools.lru_cache(maxsize=SCENE_CACHE_SIZE)
+def _cached_upstream_pyramid(watershed_path, watershed_id, signature):
+    from src.hydrobasins.pyramid import GeometryPyramid
+    from src.hydrobasins.topology import upstream_geometry
+    
+    geometry = upstream_geometry(watershed_path, watershed_id)
+    if geometry is None:
+        return None
+    return GeometryPyramid([geometry], [{'HYBAS_ID': int(watershed_id)}], style={
+        'color': UPSTREAM_COLOR,
+        'fillColor': UPSTREAM_COLOR,
+        'fillOpacity': 0.15,
+        'weight': 2
+    })
+
+
 def _create_watershed_layer():
     """
     Create a GeoJSON layer for the watershed boundary.
     
+    The layer shows one level of the process-wide watershed pyramid, so
+    sessions showing the same watershed share its coordinates; bind it to a
+    map with _follow_zoom() to switch levels as the user zooms.
+    
     Returns:
         GeoJSON: ipyleaflet GeoJSON layer or None if not available
     """
-    if not WATERSHED_PATH or not WATERSHED_ID:
+    scene = active_scene()
+    watershed_path, watershed_id = scene['watershed_path'], scene['watershed_id']
+    if not watershed_path or not watershed_id:
         return None
     
     try:
-        gdf = gpd.read_file(WATERSHED_PATH)
-        target = gdf[gdf['HYBAS_ID'] == WATERSHED_ID]
+        from ipyleaflet import GeoJSON
         
-        if not target.empty:
-            return GeoJSON(
-                data=target.__geo_interface__,
-                style={
-                    'color': WATERSHED_COLOR,
-                    'fillOpacity': 0.0,
-                    'weight': WATERSHED_LINE_WIDTH
-                },
-                name=f"Watershed {WATERSHED_ID}"
-            )
+        start = time.perf_counter()
+        pyramid = _watershed_pyramid(watershed_path, watershed_id)
+        _record_setup("watershed_layer", time.perf_counter() - start)
+        
+        if pyramid is not None:
+            return GeoJSON(data=pyramid.for_zoom(WATERSHED_ZOOM), name=f"Watershed {watershed_id}")
     except Exception as e:
         print(f"[STEP2] Error loading watershed: {e}")
     
     return None
 
 
+def _create_upstream_layer():
+    """
+    Create a GeoJSON layer for the dissolved upstream catchment of the watershed.
+    
+    Uses the precomputed upstream topology (see src/hydrobasins/topology.py).
+    
+    Returns:
+        GeoJSON: ipyleaflet GeoJSON layer or None if not available
+    """
+    scene = active_scene()
+    watershed_path, watershed_id = scene['watershed_path'], scene['watershed_id']
+    if not watershed_path or not watershed_id:
+        return None
+    
+    try:
+        from ipyleaflet import GeoJSON
+        
+        pyramid = _upstream_pyramid(watershed_path, watershed_id)
+        if pyramid is not None:
+            return GeoJSON(data=pyramid.for_zoom(WATERSHED_ZOOM), name=f"Upstream of {watershed_id}")
+    except Exception as e:
+        print(f"[STEP2] Error loading upstream catchment: {e}")
+    
+    return None
+
+
+def _imerg_variables():
+    """Return-period variables of the IMERG catalog (opened lazily on first call)."""
+    from src.imerg import return_period_variables
+    
+    return return_period_variables()
+
+
+def _create_precipitation_layer(tile_clients, variable):
+    """
+    Create a tile layer of an IMERG return-period variable around the scene.
+    
+    Tiles are regridded on demand by the tile server (see src/imerg.py).
+    
+    Returns:
+        TileLayer: ipyleaflet TileLayer or None if not available
+    """
+    client = tile_clients.get('output') or tile_clients.get('input')
+    if client is None or not variable or not hasattr(client, 'get_imerg_url'):
+        return None
+    
+    try:
+        from ipyleaflet import TileLayer
+        
+        url = client.get_imerg_url(variable)
+        if url:
+            return TileLayer(url=url, name=f"IMERG {variable}", opacity=PRECIPITATION_OPACITY,
+                             max_native_zoom=10, attribution="GPM IMERG")
+    except Exception as e:
+        print(f"[STEP2] Error creating precipitation layer: {e}")
+    
+    return None
+
+
+def _follow_zoom(map_widget, layer, pyramid_fn):
+    """
+    Switch an overlay between detail levels of its pyramid as the map zooms.
+    
+    Args:
+        map_widget: The session's map
+        layer: Layer from _create_watershed_layer() / _create_upstream_layer(), or None
+        pyramid_fn: _watershed_pyramid or _upstream_pyramid
+        
+    Returns:
+        callable: Cleanup, or None when there is no layer
+    """
+    if layer is None:
+        return None
+    from src.hydrobasins.pyramid import follow_zoom
+    
+    scene = active_scene()
+    pyramid = pyramid_fn(scene['watershed_path'], scene['watershed_id'])
+    return follow_zoom(map_widget, layer, pyramid) if pyramid is not None else None
+
+
+def _close_map(m):
+    """
+    Close a map widget with its layers, controls and style widgets.
+    
+    Widgets hosted inside WidgetControls belong to whoever added them and
+    are left alone.
+    """
+    widgets = (*m.layers, *m.controls, m.default_style, m.dragging_style, m.style, m)
+    for widget in widgets:
+        try:
+            widget.close()
+        except Exception as e:
+            # Comm already gone (e.g. the browser disconnected); keep closing the rest
+            print(f"[STEP2] Error closing {type(widget).__name__}: {e!r}")
+
+
+def _attach_inspector(map_widget):
+    """
+    Wire click-to-inspect and transect drawing to the map for the active scene.
+    
+    A click queries the pixel under the cursor; a drawn polyline samples the
+    class and uncertainty profile along it (see src/pixel_query.py). Results
+    go to `inspected_pixel` and `transect_summary`.
+    
+    Returns:
+        callable: Cleanup that detaches the handlers
+    """
+    from ipyleaflet import DrawControl
+    from src.pixel_query import inspect_point, sample_transect, summarize_transect
+    
+    scene = active_scene()
+    inspected_pixel.set(None)
+    transect_summary.set(None)
+    
+    def on_interaction(**kwargs):
+        if kwargs.get('type') != 'click':
+            return
+        lat, lon = kwargs['coordinates']
+        try:
+            inspected_pixel.set(inspect_point(scene, lon, lat))
+        except Exception as e:
+            print(f"[STEP2] Pixel query failed: {e}")
+    
+    def on_draw(target, action, geo_json):
+        geometry = geo_json.get('geometry') or {}
+        if action != 'created' or geometry.get('type') != 'LineString':
+            return
+        try:
+            profile = sample_transect(scene, geometry['coordinates'])
+            transect_summary.set(summarize_transect(profile))
+        except Exception as e:
+            print(f"[STEP2] Transect query failed: {e}")
+    
+    draw_control = DrawControl(
+        polyline={'shapeOptions': {'color': TRANSECT_COLOR, 'weight': 3}},
+        polygon={}, rectangle={}, circle={}, circlemarker={}, marker={}
+    )
+    draw_control.on_draw(on_draw)
+    map_widget.add_control(draw_control)
+    map_widget.on_interaction(on_interaction)
+    
+    def detach():
+        map_widget.on_interaction(on_interaction, remove=True)
+        # On unmount the map (and its controls) may already be closed
+        if map_widget.comm is not None and draw_control in map_widget.controls:
+            map_widget.remove_control(draw_control)
+            draw_control.close()
+    
+    return detach
+
+
+def _format_value(value):
+    if value is None:
+        return "–"
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def _format_pixel(pixel):
+    """Markdown for an inspect_point() result."""
+    if pixel['class'] is None and all(v is None for v in pixel['bands'].values()):
+        return f"No data at {pixel['lat']:.5f}, {pixel['lon']:.5f}"
+    lines = [
+        f"**{pixel['lat']:.5f}, {pixel['lon']:.5f}**",
+        "",
+        f"Class: **{_format_value(pixel['class'])}** ({pixel['class_name'] or 'unknown'})  ",
+        f"Uncertainty: **{_format_value(pixel['uncertainty'])}**",
+    ]
+    if pixel['bands']:
+        lines += ["", "| Band | Value |", "|---|---|"]
+        lines += [f"| {name} | {_format_value(value)} |" for name, value in pixel['bands'].items()]
+    return "\n".join(lines)
+
+
+def _format_transect(summary):
+    """Markdown for a summarize_transect() result."""
+    lines = [f"**Transect**: {summary['length'] / 1000:.2f} km, {summary['samples']} samples", ""]
+    lines += [f"- {name}: {fraction:.0%}" for name, fraction in summary['class_fractions'].items()]
+    if summary['uncertainty_mean'] is not None:
+        lines += ["", f"Uncertainty mean {summary['uncertainty_mean']:.3f}, "
+                      f"max {summary['uncertainty_max']:.3f}"]
+    return "\n".join(lines)
+
+
+def _watershed_stats(scene):
+    """
+    Zonal statistics of the scene's watershed (see src/zonal_stats.py).
+    
+    Returns:
+        dict: Basin record, or None if not available
+    """
+    try:
+        from src.zonal_stats import scene_watershed_stats
+        
+        start = time.perf_counter()
+        stats = scene_watershed_stats(scene)
+        _record_setup("watershed_stats", time.perf_counter() - start)
+        return stats
+    except Exception as e:
+        print(f"[STEP2] Error computing watershed statistics: {e}")
+        return None
+
+
+def _sparkline(counts):
+    """Unicode bar sparkline of histogram counts."""
+    bars = "▁▂▃▄▅▆▇█"
+    peak = max(counts) if counts else 0
+    if not peak:
+        return ""
+    return "".join(bars[min(len(bars) - 1, int(c / peak * len(bars)))] if c else " " for c in counts)
+
+
+def _format_zonal(stats):
+    """Markdown for a zonal_stats() basin record."""
+    areas = stats['area_km2']
+    observed = sum(area for name, area in areas.items() if name != "invalid")
+    lines = [f"Flooded: **{stats['flooded_km2']:.2f} km²**"
+             + (f" ({stats['flooded_km2'] / observed:.0%} of observed)" if observed else ""), ""]
+    lines += ["| Class | km² |", "|---|---|"]
+    lines += [f"| {name} | {area:.2f} |" for name, area in areas.items() if area]
+    uncertainty = stats['uncertainty']
+    if uncertainty['mean'] is not None:
+        edges = uncertainty['histogram']['edges']
+        lines += ["", f"Uncertainty mean **{uncertainty['mean']:.3f}**  ",
+                  f"`{edges[0]:g} {_sparkline(uncertainty['histogram']['counts'])} {edges[-1]:g}`"]
+    return "\n".join(lines)
+
+
+def _start_export(scene, upstream):
+    """
+    Export the scene's output clipped to its watershed on a background thread.
+    
+    Progress and the result are published to export_status in the session's
+    kernel context, at most every 5% of the blocks.
+    """
+    import threading
+    from src.export import export_watershed
+    from src.step2.layers import call_in_context, current_kernel_context
+    
+    context = current_kernel_context()
+    last = [-1]
+    
+    def publish(status):
+        call_in_context(context, lambda: export_status.set(status))
+    
+    def progress(done, total):
+        percent = done * 100 // total
+        if percent // 5 != last[0] // 5:
+            last[0] = percent
+            publish({'running': True, 'percent': percent})
+    
+    def run():
+        try:
+            result = export_watershed(scene, upstream=upstream, progress=progress)
+            publish({'path': result['path'], 'seconds': result['seconds']})
+        except Exception as e:
+            print(f"[STEP2] Export failed: {e}")
+            publish({'error': str(e)})
+    
+    export_status.set({'running': True, 'percent': 0})
+    threading.Thread(target=run, name="export", daemon=True).start()
+
+
+def _track_activity(map_widget):
+    """
+    Register the session for idle teardown; panning and zooming count as activity.
+    
+    Returns:
+        tuple: (Session handle, cleanup callable)
+    """
+    from src.step2.sessions import get_session_tracker
+    
+    tracker = get_session_tracker()
+    session = tracker.register(lambda: session_suspended.set(True))
+    map_widget.observe(session.touch, names=['center', 'zoom'])
+    
+    def stop():
+        map_widget.unobserve(session.touch, names=['center', 'zoom'])
+        tracker.unregister(session)
+    
+    return session, stop
+
+
+def _select_scene(scene_id):
+    """Switch the session to another catalog scene."""
+    if scene_id == active_scene()['id']:
+        return
+    print(f"[STEP2] Switching to scene {scene_id}")
+    # Renditions and the uncertainty range differ per scene
+    input_composite.set(None)
+    current_scene.set(scene_id)
+    uncertainty_threshold.set(min(uncertainty_threshold.value, get_uncertainty_max()))
+
+
+def output_layer_style(layer_mode, threshold):
+    """
+    Tile parameters for the output layer in the given mode.
+    
+    Args:
+        layer_mode: "Flood Classification", "Uncertainty" or "Flood Mask"
+        threshold: Max uncertainty shown by the colormap, or kept by the mask
+        
+    Returns:
+        dict: Layer name and tile parameters
+    """
+    if layer_mode == "Flood Classification":
+        return {
+            'name': "Classification",
+            'indexes': [1],
+            'colormap': CLASSIFICATION_COLORMAP,
+        }
+    if layer_mode == "Flood Mask":
+        # Water / flood trace pixels with uncertainty <= threshold, masked
+        # server-side; plain classification tiles are the fallback
+        return {
+            'name': "Flood Mask",
+            'expression': FLOOD_MASK_EXPRESSION,
+            'threshold': threshold,
+            'indexes': [1],
+            'colormap': CLASSIFICATION_COLORMAP,
+        }
+    return {
+        'name': "Uncertainty",
+        'indexes': [2],
+        'colormap': UNCERTAINTY_COLORMAP,
+        'vmin': 0.0,
+        'vmax': threshold,
+    }
+
+
 # ============================================================================
 # Main Component
 # ============================================================================
 
 @solara.component
 def Page():
+    """
+    Step 2 page: the flood map, or a placeholder while the session is suspended.
+    
+    Suspending unmounts FloodMap, whose effect cleanups release the session's
+    map widget, tile sources and overlays.
+    """
+    if not session_suspended.value:
+        FloodMap()
+        return
+    
+    from src.step2.sessions import SESSION_IDLE_TIMEOUT
+    
+    with solara.Column(style={"height": "100vh", "padding": "2em"}):
+        solara.Title("Step 2: Flood Visualization")
+        solara.Markdown(f"The map was paused after {SESSION_IDLE_TIMEOUT // 60} minutes of inactivity.")
+        solara.Button("Resume", color="primary", on_click=lambda: session_suspended.set(False))
+
+
+@solara.component
+def FloodMap():
     """
     Main Solara component for the flood visualization interface.
     
@@ -234,125 +838,135 @@ def Page():
     - Layer mode selection (Classification vs Uncertainty)
     - Uncertainty threshold filtering
     - Watershed boundary overlay
+    - Scene selection from the catalog
+    - Flooded area and uncertainty summary of the watershed
     """
+    bootstrap.mark("first_render")
+    
     # Reactive state values
     threshold = uncertainty_threshold.value
     is_split = show_split_map.value
     layer_mode = map_layer_mode.value
+    with_upstream = show_upstream.value
+    with_precipitation = show_precipitation.value
+    period = precipitation_period.value
+    composite = input_composite.value
+    scene_id = current_scene.value
+    pixel = inspected_pixel.value
+    transect = transect_summary.value
     
-    # Create map widget (memoized)
+    # Create map widget (memoized), closed with its layers on unmount
     map_widget = solara.use_memo(_create_base_map, dependencies=[])
+    solara.use_effect(lambda: lambda: _close_map(map_widget), dependencies=[])
+    
+    # Idle teardown: every render and map movement counts as activity
+    session, stop_tracking = solara.use_memo(lambda: _track_activity(map_widget), dependencies=[])
+    solara.use_effect(lambda: stop_tracking, dependencies=[])
+    session.touch()
+    
+    # Acquire shared tile clients (memoized per scene), released when the
+    # scene changes or the session ends; the pool keeps recent sources open
+    tile_clients = solara.use_memo(_create_tile_clients, dependencies=[scene_id])
+    solara.use_effect(lambda: lambda: _release_tile_clients(tile_clients), dependencies=[tile_clients])
     
-    # Create tile clients (memoized)
-    tile_clients = solara.use_memo(_create_tile_clients, dependencies=[])
+    # Create watershed layer (memoized per scene)
+    watershed_layer = solara.use_memo(_create_watershed_layer, dependencies=[scene_id])
     
-    # Create watershed layer (memoized)
-    watershed_layer = solara.use_memo(_create_watershed_layer, dependencies=[])
+    # Incremental layer manager (memoized per scene): layers are built once and
+    # only the output layer's tile URL changes afterwards
+    def create_layer_manager():
+        from src.step2.layers import LayerManager
+        return LayerManager(map_widget, tile_clients, watershed_layer)
+    
+    layer_manager = solara.use_memo(create_layer_manager, dependencies=[scene_id])
+    solara.use_effect(lambda: layer_manager.close, dependencies=[layer_manager])
+    
+    # Fly to the selected scene (the first scene is centered by _create_base_map)
+    def recenter():
+        if scene_id is not None:
+            cx, cy, zoom = get_map_center()
+            map_widget.center, map_widget.zoom = [cy, cx], zoom
+    
+    solara.use_effect(recenter, dependencies=[scene_id])
     
     def update_layers():
         """
         Update map layers based on current state (split mode, layer mode, threshold).
         This function is called whenever reactive dependencies change.
         """
-        m = map_widget
-        
         try:
-            # Clear existing layers and reset basemap
-            m.clear_layers()
-            m.add_basemap("OpenStreetMap")
-            
-            # Remove existing SplitMapControl to prevent duplication
-            # This fixes the split panel corruption issue when threshold changes
-            controls_to_remove = [ctrl for ctrl in m.controls if isinstance(ctrl, SplitMapControl)]
-            for ctrl in controls_to_remove:
-                m.remove_control(ctrl)
-            
-            input_available = 'input' in tile_clients
-            output_available = 'output' in tile_clients
-            
-            if is_split and input_available and output_available:
-                # Split-map mode: show input on left, output on right
-                print(f"[STEP2] Rendering split-map view")
-                
-                # Create input layer (Sentinel-2)
-                l_input = get_leaflet_tile_layer(
-                    tile_clients['input'],
-                    name="Sentinel-2",
-                    opacity=1.0
-                )
-                
-                # Create output layer based on selected mode
-                if layer_mode == "Flood Classification":
-                    l_output = get_leaflet_tile_layer(
-                        tile_clients['output'],
-                        name="Classification",
-                        indexes=[1],
-                        colormap=CLASSIFICATION_COLORMAP,
-                        opacity=0.7
-                    )
-                else:  # Uncertainty mode
-                    l_output = get_leaflet_tile_layer(
-                        tile_clients['output'],
-                        name="Uncertainty",
-                        indexes=[2],
-                        colormap=UNCERTAINTY_COLORMAP,
-                        vmin=0.0,
-                        vmax=threshold,
-                        opacity=0.7
-                    )
-                
-                # Add layers to map
-                m.add_layer(l_input)
-                m.add_layer(l_output)
-                
-                # Add split map control
-                split_control = SplitMapControl(left_layer=l_input, right_layer=l_output)
-                m.add_control(split_control)
-                
-            else:
-                # Single layer mode
-                if input_available:
-                    print(f"[STEP2] Adding Sentinel-2 layer")
-                    l_input = get_leaflet_tile_layer(
-                        tile_clients['input'],
-                        name="Sentinel-2",
-                        opacity=1.0
-                    )
-                    m.add_layer(l_input)
-                
-                if output_available:
-                    print(f"[STEP2] Adding {layer_mode} layer")
-                    if layer_mode == "Flood Classification":
-                        l_output = get_leaflet_tile_layer(
-                            tile_clients['output'],
-                            name="Classification",
-                            indexes=[1],
-                            colormap=CLASSIFICATION_COLORMAP,
-                            opacity=0.7
-                        )
-                    else:  # Uncertainty mode
-                        l_output = get_leaflet_tile_layer(
-                            tile_clients['output'],
-                            name="Uncertainty",
-                            indexes=[2],
-                            colormap=UNCERTAINTY_COLORMAP,
-                            vmin=0.0,
-                            vmax=threshold,
-                            opacity=0.7
-                        )
-                    m.add_layer(l_output)
-            
-            # Always add watershed boundary on top
-            if watershed_layer:
-                m.add_layer(watershed_layer)
-                
+            print(f"[STEP2] Syncing layers: split={is_split}, mode={layer_mode}")
+            with metrics.profiled("update_layers"), metrics.LAYER_UPDATE_SECONDS.time():
+                layer_manager.sync(is_split, output_layer_style(layer_mode, threshold))
         except Exception as e:
             print(f"[STEP2] Error updating layers: {e}")
             import traceback
             traceback.print_exc()
     
     # Update layers when dependencies change
-    solara.use_effect(update_layers, dependencies=[is_split, layer_mode, threshold])
+    solara.use_effect(update_layers, dependencies=[layer_manager, is_split, layer_mode, threshold])
+    
+    # Input band composite (only selectable when several renditions exist)
+    solara.use_effect(
+        lambda: _switch_input_composite(tile_clients, layer_manager, composite),
+        dependencies=[layer_manager, composite]
+    )
+    
+    # Swap in optimized COG copies when their background build finishes
+    solara.use_effect(
+        lambda: _watch_optimized_sources(tile_clients, layer_manager),
+        dependencies=[layer_manager]
+    )
+    
+    # Time-to-first-render report (once per process)
+    def report_startup():
+        if bootstrap.mark("map_ready"):
+            bootstrap.write_startup_report()
+    
+    solara.use_effect(report_startup, dependencies=[])
+    
+    # Upstream catchment overlay (built only when switched on)
+    upstream_layer = solara.use_memo(
+        lambda: _create_upstream_layer() if with_upstream else None,
+        dependencies=[scene_id, with_upstream]
+    )
+    solara.use_effect(
+        lambda: layer_manager.set_overlay('upstream', upstream_layer),
+        dependencies=[layer_manager, upstream_layer]
+    )
+    
+    # IMERG return-period overlay: the catalog is not opened until switched on
+    periods = solara.use_memo(
+        lambda: _imerg_variables() if with_precipitation else [],
+        dependencies=[with_precipitation]
+    )
+    if period not in periods:
+        period = periods[-1] if periods else None
+    precipitation_layer = solara.use_memo(
+        lambda: _create_precipitation_layer(tile_clients, period) if with_precipitation else None,
+        dependencies=[tile_clients, with_precipitation, period]
+    )
+    solara.use_effect(
+        lambda: layer_manager.set_overlay('precipitation', precipitation_layer),
+        dependencies=[layer_manager, precipitation_layer]
+    )
+    
+    # Overlays get coarser geometry when zoomed out (see src/hydrobasins/pyramid.py)
+    solara.use_effect(
+        lambda: _follow_zoom(map_widget, watershed_layer, _watershed_pyramid),
+        dependencies=[watershed_layer]
+    )
+    solara.use_effect(
+        lambda: _follow_zoom(map_widget, upstream_layer, _upstream_pyramid),
+        dependencies=[upstream_layer]
+    )
+    
+    # Click-to-inspect and transects against the active scene's rasters
+    solara.use_effect(lambda: _attach_inspector(map_widget), dependencies=[scene_id])
+    
+    # Flooded area and uncertainty inside the watershed, computed off the render thread
+    scene = active_scene()
+    zonal = solara.use_thread(lambda: _watershed_stats(scene), dependencies=[scene_id])
     
     # ========================================================================
     # UI Layout
@@ -364,29 +978,114 @@ def Page():
         with solara.Sidebar():
             solara.Markdown("### Configuration")
             
+            # Scene selection (only when the catalog lists other scenes)
+            scenes = get_catalog()
+            if len(scenes) > 1:
+                scene = active_scene()
+                solara.Select(
+                    label="Scene",
+                    value=scene['id'],
+                    values=[s['id'] for s in scenes],
+                    on_value=_select_scene
+                )
+                details = [v for v in (scene.get('emsr'), scene.get('datetime')) if v]
+                if details:
+                    solara.Text(" · ".join(details))
+            
             # Split view toggle
             solara.Checkbox(
                 label="Enable Split View",
                 value=show_split_map,
             )
             
+            # Upstream catchment toggle
+            solara.Checkbox(
+                label="Show Upstream Catchment",
+                value=show_upstream,
+            )
+            
+            # Precipitation context (IMERG return periods)
+            solara.Checkbox(
+                label="Show Precipitation Return Period",
+                value=show_precipitation,
+            )
+            if with_precipitation:
+                if periods:
+                    solara.Select(
+                        label="Return Period",
+                        value=period,
+                        values=periods,
+                        on_value=precipitation_period.set
+                    )
+                else:
+                    solara.Text("IMERG catalog not available.")
+            
+            # Input band composite selection
+            composites = get_input_composites()
+            if len(composites) > 1:
+                solara.Select(
+                    label="Input Composite",
+                    value=composite or composites[0],
+                    values=composites,
+                    on_value=input_composite.set
+                )
+            
             # Layer mode selection
             solara.ToggleButtonsSingle(
                 value=map_layer_mode,
-                values=["Flood Classification", "Uncertainty"]
+                values=["Flood Classification", "Uncertainty", "Flood Mask"]
             )
             
-            # Uncertainty threshold slider (only visible in Uncertainty mode)
-            if layer_mode == "Uncertainty":
+            # Uncertainty threshold slider (Uncertainty and Flood Mask modes)
+            if layer_mode in ("Uncertainty", "Flood Mask"):
                 solara.Markdown("#### Confidence Filter")
+                uncertainty_max = get_uncertainty_max()
                 solara.SliderFloat(
                     label="Max Uncertainty",
                     value=uncertainty_threshold,
                     min=0.0,
-                    max=1.0,
-                    step=0.05
+                    max=uncertainty_max,
+                    step=uncertainty_max / 20
                 )
                 solara.Info(f"Showing ≤ {threshold:.2f}")
+            
+            # Pixel inspector (map click) and transect profile (drawn line)
+            solara.Markdown("#### Pixel Inspector")
+            if pixel is None:
+                solara.Text("Click the map to inspect a pixel, or draw a line for a transect.")
+            else:
+                solara.Markdown(_format_pixel(pixel))
+            if transect is not None:
+                solara.Markdown(_format_transect(transect))
+            
+            # Per-watershed zonal statistics
+            if scene['watershed_id']:
+                solara.Markdown(f"#### Watershed {scene['watershed_id']}")
+                if zonal.state == solara.ResultState.FINISHED and zonal.value:
+                    solara.Markdown(_format_zonal(zonal.value))
+                elif zonal.state in (solara.ResultState.FINISHED, solara.ResultState.ERROR):
+                    solara.Text("Statistics not available.")
+                else:
+                    solara.Text("Computing flooded area ...")
+                
+                # Clipped COG export of the watershed
+                status = export_status.value
+                running = bool(status and status.get('running'))
+                solara.Checkbox(
+                    label="Clip to Upstream Catchment",
+                    value=export_upstream,
+                )
+                solara.Button(
+                    "Export COG",
+                    on_click=lambda: _start_export(scene, export_upstream.value),
+                    disabled=running
+                )
+                if running:
+                    solara.ProgressLinear(status['percent'])
+                elif status and 'path' in status:
+                    solara.Success(f"Exported {status['path']} ({status['seconds']:.1f}s)")
+                elif status and 'error' in status:
+                    solara.Error(f"Export failed: {status['error']}")
         
         # Display map
         solara.display(map_widget)
@@ -0,0 +1,249 @@
+"""
+Step 2: Incremental Layer Management
+
+Keeps the Step 2 map's layers in place across reactive updates. The basemap,
+input layer, output layer and watershed overlay are created once; afterwards
+only the output layer's tile URL and name are changed and the split control
+is toggled, so an update costs a single trait change over the widget comm
+instead of a full clear-and-rebuild (and a refetch of every visible tile).
+
+Rapid output changes, such as dragging the "Max Uncertainty" slider, are
+coalesced by a trailing debounce so only the final position is sent.
+"""
+
+import threading
+
+from ipyleaflet import SplitMapControl
+from localtileserver import get_leaflet_tile_layer
+
+DEFAULT_DEBOUNCE = 0.25        # Seconds of quiet before a slider change is applied
+STYLE_KEYS = ('indexes', 'colormap', 'vmin', 'vmax')
+INPUT_LAYER_NAME = "Sentinel-2"
+
+
+class Debouncer:
+    """
+    Trailing-edge debounce for widget updates.
+
+    Each call replaces the pending callback; it runs once no new call has
+    arrived for `delay` seconds. The Solara kernel context active at call time
+    is re-entered in the timer thread so widget messages reach the right
+    browser session.
+    """
+
+    def __init__(self, delay=DEFAULT_DEBOUNCE):
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __call__(self, fn):
+        context = current_kernel_context()
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, call_in_context, (context, fn))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+def current_kernel_context():
+    try:
+        from solara.server import kernel_context
+        if kernel_context.has_current_context():
+            return kernel_context.get_current_context()
+    except Exception:
+        pass
+    return None
+
+
+def call_in_context(context, fn):
+    """Run fn inside a captured Solara kernel context (if any), e.g. from a worker thread."""
+    if context is None:
+        return fn()
+    with context:
+        return fn()
+
+
+class LayerManager:
+    """
+    Diff-based layer manager for the Step 2 map.
+
+    Args:
+        m: geemap.Map widget
+        tile_clients: Dictionary with optional 'input' and 'output' TileClients
+        watershed_layer: GeoJSON overlay or None
+        debounce: Seconds to coalesce output URL changes (0 disables)
+    """
+
+    def __init__(self, m, tile_clients, watershed_layer=None, debounce=DEFAULT_DEBOUNCE):
+        self.m = m
+        self.tile_clients = tile_clients
+        self.watershed_layer = watershed_layer
+        self.input_layer = None
+        self.output_layer = None
+        self.split_control = None
+        self.overlays = {}
+        self._output_style = None
+        self._initialized = False
+        self._debouncer = Debouncer(debounce) if debounce else None
+
+    def _build(self, output_style):
+        """Create every layer once, in stacking order."""
+        m = self.m
+        stale = list(m.layers)
+        m.clear_layers()
+        m.add_basemap("OpenStreetMap")
+
+        # Drop split controls left over from a previous manager on this map
+        for ctrl in [c for c in m.controls if isinstance(c, SplitMapControl)]:
+            m.remove_control(ctrl)
+
+        if 'input' in self.tile_clients:
+            self.input_layer = get_leaflet_tile_layer(
+                self.tile_clients['input'],
+                name=INPUT_LAYER_NAME,
+                opacity=1.0
+            )
+            self.input_layer.url = self._input_url()
+            m.add_layer(self.input_layer)
+
+        if 'output' in self.tile_clients:
+            self.output_layer = get_leaflet_tile_layer(
+                self.tile_clients['output'],
+                opacity=0.7,
+                name=output_style['name'],
+                **{k: output_style[k] for k in STYLE_KEYS if k in output_style}
+            )
+            self.output_layer.url = self._output_url(output_style)
+            m.add_layer(self.output_layer)
+
+        # Always keep watershed boundary on top
+        if self.watershed_layer:
+            m.add_layer(self.watershed_layer)
+
+        # Layers from the map's defaults or a previous scene's manager are
+        # unreachable now; close them so their widgets are released
+        for layer in stale:
+            if layer not in m.layers:
+                layer.close()
+
+        self._initialized = True
+
+    def _input_url(self):
+        return self.tile_clients['input'].get_tile_url(client=True, layer=INPUT_LAYER_NAME)
+
+    def _output_url(self, output_style):
+        client = self.tile_clients['output']
+        if 'expression' in output_style and hasattr(client, 'get_mask_url'):
+            url = client.get_mask_url(output_style['expression'], output_style['threshold'],
+                                      client=True, layer=output_style['name'])
+            if url:
+                return url
+        # Mask styles also carry plain tile parameters, used without the band-math endpoint
+        style = {k: output_style.get(k) for k in STYLE_KEYS}
+        return client.get_tile_url(client=True, layer=output_style['name'], **style)
+
+    def _apply_output(self, url, name):
+        layer = self.output_layer
+        if layer.name != name:
+            layer.name = name
+        if layer.url != url:
+            layer.url = url
+
+    def _update_output(self, output_style):
+        self._output_style = output_style
+        if self.output_layer is None:
+            return
+        url = self._output_url(output_style)
+        name = output_style['name']
+        if url == self.output_layer.url and name == self.output_layer.name:
+            if self._debouncer:
+                self._debouncer.cancel()
+            return
+
+        if self._debouncer and name == self.output_layer.name:
+            # Same layer, new parameters (slider drag): coalesce
+            self._debouncer(lambda: self._apply_output(url, name))
+        else:
+            if self._debouncer:
+                self._debouncer.cancel()
+            self._apply_output(url, name)
+
+    def _set_split(self, is_split):
+        want_split = is_split and self.input_layer is not None and self.output_layer is not None
+        if want_split and self.split_control is None:
+            self.split_control = SplitMapControl(
+                left_layer=self.input_layer,
+                right_layer=self.output_layer
+            )
+            self.m.add_control(self.split_control)
+        elif not want_split and self.split_control is not None:
+            self.m.remove_control(self.split_control)
+            self.split_control = None
+
+    def sync(self, is_split, output_style):
+        """
+        Bring the map in line with the current UI state.
+
+        Args:
+            is_split: Whether the split view is enabled
+            output_style: Output layer name and tile parameters
+                (name, indexes, colormap, vmin, vmax); mask layers add
+                expression and threshold
+        """
+        if not self._initialized:
+            self._output_style = output_style
+            self._build(output_style)
+        else:
+            self._update_output(output_style)
+        self._set_split(is_split)
+
+    def replace_client(self, key, client):
+        """
+        Point a layer at a different TileClient for the same raster.
+
+        Used when an optimized copy of a source becomes available; the layer
+        object (and the split control holding it) stays in place.
+
+        Args:
+            key: 'input' or 'output'
+            client: TileClient serving the replacement file
+        """
+        self.tile_clients[key] = client
+        if key == 'input' and self.input_layer is not None:
+            self.input_layer.url = self._input_url()
+        elif key == 'output' and self.output_layer is not None and self._output_style:
+            if self._debouncer:
+                self._debouncer.cancel()
+            self._apply_output(self._output_url(self._output_style), self._output_style['name'])
+
+    def set_overlay(self, key, layer):
+        """
+        Show an optional overlay (or remove it when layer is None).
+
+        Args:
+            key: Overlay slot name, e.g. 'upstream'
+            layer: ipyleaflet layer or None
+        """
+        current = self.overlays.get(key)
+        if current is layer:
+            return
+        if current is not None and current in self.m.layers:
+            self.m.remove_layer(current)
+        if layer is None:
+            self.overlays.pop(key, None)
+        else:
+            self.m.add_layer(layer)
+            self.overlays[key] = layer
+
+    def close(self):
+        """Cancel pending debounced updates."""
+        if self._debouncer:
+            self._debouncer.cancel()
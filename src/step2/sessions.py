@@ -0,0 +1,131 @@
+"""
+Step 2: Session Activity and Idle Teardown
+
+Every open browser tab keeps its own map widget, tile layers and overlays
+alive in the server process, even when nobody has looked at it for hours.
+Sessions register here and report activity (renders, map pans and zooms); a
+background sweep calls a session's teardown callback, inside its own Solara
+kernel context, once it has been idle for SESSION_IDLE_TIMEOUT seconds.
+
+Step 2 uses the callback to swap the map for a "paused" placeholder, which
+unmounts the map component and releases its widgets and tile sources; the
+user resumes with one click.
+
+Environment:
+    SESSION_IDLE_TIMEOUT   Seconds of inactivity before teardown (default 1800, 0 disables)
+"""
+
+import os
+import threading
+import time
+
+from src.step2.layers import call_in_context, current_kernel_context
+
+SESSION_IDLE_TIMEOUT = int(os.environ.get('SESSION_IDLE_TIMEOUT', 1800))
+SWEEP_INTERVAL = 30            # Seconds between idle sweeps
+
+
+class Session:
+    """Activity record of one registered session."""
+
+    def __init__(self, context, on_idle):
+        self.context = context
+        self.on_idle = on_idle
+        self.last_active = time.monotonic()
+
+    def touch(self, *args):
+        """Record activity (accepts and ignores traitlets observer arguments)."""
+        self.last_active = time.monotonic()
+
+
+class SessionTracker:
+    """
+    Registry of live sessions with idle teardown.
+
+    Args:
+        idle_timeout: Seconds of inactivity before a session's on_idle runs (0 disables)
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def register(self, on_idle):
+        """
+        Track the calling session (its current Solara kernel context).
+
+        Args:
+            on_idle: Called once, in the session's context, when it goes idle
+
+        Returns:
+            Session: Handle whose touch() records activity
+        """
+        session = Session(current_kernel_context(), on_idle)
+        with self._lock:
+            self._sessions.add(session)
+        self._start_sweeper()
+        return session
+
+    def unregister(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _start_sweeper(self):
+        if not self.idle_timeout or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+
+        def loop():
+            while True:
+                time.sleep(SWEEP_INTERVAL)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def sweep(self, now=None):
+        """
+        Tear down sessions idle for longer than the timeout.
+
+        Returns:
+            int: Number of sessions torn down
+        """
+        if not self.idle_timeout:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [s for s in self._sessions if now - s.last_active > self.idle_timeout]
+            self._sessions.difference_update(idle)
+        for session in idle:
+            try:
+                call_in_context(session.context, session.on_idle)
+            except Exception as e:
+                print(f"[STEP2] Error tearing down idle session: {e}")
+        if idle:
+            print(f"[STEP2] Tore down {len(idle)} idle session(s); {len(self._sessions)} active")
+        return len(idle)
+
+    def stats(self):
+        """Number of tracked sessions and their idle times in seconds."""
+        now = time.monotonic()
+        with self._lock:
+            return {'sessions': len(self._sessions),
+                    'idle': sorted(now - s.last_active for s in self._sessions)}
+
+
+_TRACKER = None
+_TRACKER_LOCK = threading.Lock()
+
+
+def get_session_tracker(**kwargs):
+    """
+    Return the process-wide SessionTracker, creating it on first call.
+
+    Keyword arguments are only used when the tracker is created.
+    """
+    global _TRACKER
+    with _TRACKER_LOCK:
+        if _TRACKER is None:
+            _TRACKER = SessionTracker(**kwargs)
+        return _TRACKER
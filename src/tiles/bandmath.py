@@ -0,0 +1,218 @@
+"""
+Band-math Mask Tiles
+
+The "Max Uncertainty" slider of the uncertainty layer only rescales its
+colormap. A mask tile instead shows the classification only where a
+per-pixel expression over the output bands holds, e.g. water and flood
+trace pixels whose uncertainty is at most the slider value:
+
+    ((cls == 2) | (cls == 4)) & (unc <= t)
+
+Both output bands are read in one windowed read per tile, the expression is
+evaluated vectorized in NumPy, and the class codes that pass are encoded
+with a categorical palette (everything else is transparent). Decoded band
+windows are kept in a small LRU, so moving the slider re-evaluates the
+expression without reading the COG again, and rendered tiles go through the
+shared TileCache keyed by expression and threshold, so slider stops that
+were already visited are served without recomputation.
+
+Expressions are parsed with `ast` and may only use:
+    names       cls / b1 (class band), unc / b2 (uncertainty band), t (threshold)
+    operators   & | ^ ~, and / or / not, == != < <= > >=, + - * /
+    literals    numbers and booleans
+Chained comparisons (`a < b < c`, or the unparenthesized `cls == 2 | cls == 4`)
+are rejected; parenthesize each comparison.
+
+Environment:
+    FLOOD_MASK_EXPRESSION   Expression of the Step 2 "Flood Mask" layer
+    MASK_WINDOW_CACHE_MB    Budget of the decoded band window cache (default 64)
+"""
+
+import ast
+import functools
+import operator
+import os
+
+import numpy as np
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_EXPRESSION = os.environ.get('FLOOD_MASK_EXPRESSION', "((cls == 2) | (cls == 4)) & (unc <= t)")
+MASK_WINDOW_CACHE_BYTES = int(os.environ.get('MASK_WINDOW_CACHE_MB', 64)) * 1024 * 1024
+MASK_INDEXES = (1, 2)          # Output bands read per tile: class, uncertainty
+
+# Class code -> RGBA; codes not listed (and masked pixels) are transparent
+MASK_PALETTE = {
+    1: (139, 90, 43, 255),     # land
+    2: (0, 92, 230, 255),      # water
+    3: (220, 220, 220, 255),   # cloud
+    4: (0, 200, 255, 255),     # flood trace
+}
+
+_NAMES = {'cls': 0, 'b1': 0, 'unc': 1, 'b2': 1}
+
+_BINARY = {
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+
+# ============================================================================
+# Expressions
+# ============================================================================
+
+def _check(node):
+    """Reject anything outside the expression language."""
+    if isinstance(node, ast.Expression):
+        _check(node.body)
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        _check(node.left)
+        _check(node.right)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Invert, ast.Not, ast.USub)):
+        _check(node.operand)
+    elif isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _check(value)
+    elif isinstance(node, ast.Compare):
+        if len(node.ops) != 1:
+            raise ValueError("Chained comparisons are not supported; parenthesize each comparison, "
+                             "e.g. (cls == 2) | (cls == 4)")
+        if type(node.ops[0]) not in _COMPARE:
+            raise ValueError(f"Unsupported comparison: {type(node.ops[0]).__name__}")
+        _check(node.left)
+        _check(node.comparators[0])
+    elif isinstance(node, ast.Name):
+        if node.id not in _NAMES and node.id != 't':
+            raise ValueError(f"Unknown name '{node.id}' (use cls, unc, b1, b2 or t)")
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float, bool)):
+            raise ValueError(f"Unsupported literal: {node.value!r}")
+    else:
+        raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+
+
+@functools.lru_cache(maxsize=64)
+def parse_expression(text):
+    """
+    Validate a mask expression.
+
+    Args:
+        text: Expression source
+
+    Returns:
+        tuple: (normalized source, AST); equivalent spellings normalize to
+            the same source, which is used in cache keys
+
+    Raises:
+        ValueError: Syntax error or a construct outside the expression language
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}") from e
+    _check(tree)
+    return ast.unparse(tree), tree
+
+
+def _evaluate(node, bands, threshold):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, bands, threshold)
+    if isinstance(node, ast.BinOp):
+        return _BINARY[type(node.op)](_evaluate(node.left, bands, threshold),
+                                      _evaluate(node.right, bands, threshold))
+    if isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, bands, threshold)
+        if isinstance(node.op, ast.USub):
+            return -operand
+        return np.logical_not(operand) if isinstance(node.op, ast.Not) else ~operand
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return functools.reduce(combine, (_evaluate(v, bands, threshold) for v in node.values))
+    if isinstance(node, ast.Compare):
+        return _COMPARE[type(node.ops[0])](_evaluate(node.left, bands, threshold),
+                                           _evaluate(node.comparators[0], bands, threshold))
+    if isinstance(node, ast.Name):
+        return threshold if node.id == 't' else bands[_NAMES[node.id]]
+    return node.value
+
+
+def evaluate_mask(expression, classes, uncertainty, threshold):
+    """
+    Evaluate a mask expression over band arrays.
+
+    Args:
+        expression: Expression source (see module docstring)
+        classes, uncertainty: Band arrays of the same shape
+        threshold: Value of `t`
+
+    Returns:
+        np.ndarray: Boolean mask (non-zero results count as True)
+
+    Raises:
+        ValueError: Invalid expression, or operators that do not apply to the
+            band types (e.g. `&` on float bands)
+    """
+    _, tree = parse_expression(expression)
+    try:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = _evaluate(tree, (classes, uncertainty), threshold)
+    except TypeError as e:
+        raise ValueError(f"Expression does not apply to the band types: {e}") from e
+    return np.broadcast_to(np.asarray(result).astype(bool), np.shape(classes))
+
+
+# ============================================================================
+# Rendering
+# ============================================================================
+
+@functools.lru_cache(maxsize=1)
+def _window_cache():
+    from src.pixel_query import BlockCache
+
+    return BlockCache(MASK_WINDOW_CACHE_BYTES)
+
+
+def read_tile_bands(reader, key_path, mtime, z, x, y):
+    """
+    Class and uncertainty bands of one tile, from one windowed read.
+
+    Returns:
+        np.ma.MaskedArray: (2, height, width), cached per source and tile
+    """
+    key = (key_path, mtime, z, x, y)
+    cache = _window_cache()
+    bands = cache.get(key)
+    if bands is None:
+        # Nearest-neighbour resampling keeps class codes intact
+        bands = reader.tile(x, y, z, indexes=MASK_INDEXES, resampling_method="nearest").array
+        cache.put(key, bands)
+    return bands
+
+
+def render_mask(bands, expression, threshold, img_format="PNG"):
+    """
+    Encode the class codes that pass the expression with MASK_PALETTE.
+
+    Args:
+        bands: Array from read_tile_bands()
+        expression: Mask expression
+        threshold: Value of `t`
+        img_format: Encoding from format_to_encoding()
+
+    Returns:
+        bytes: Encoded tile
+    """
+    from rio_tiler.models import ImageData
+
+    classes = np.ma.getdata(bands[0])
+    uncertainty = np.ma.getdata(bands[1]).astype(np.float64)
+    valid = ~np.ma.getmaskarray(bands).any(axis=0) & ~np.isnan(uncertainty)
+    keep = valid & evaluate_mask(expression, classes, uncertainty, threshold)
+    codes = np.where(keep, np.nan_to_num(classes), 0).astype(np.uint8)
+    return ImageData(codes[np.newaxis]).render(img_format=img_format, colormap=MASK_PALETTE)
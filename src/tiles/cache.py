@@ -0,0 +1,299 @@
+"""
+Two-tier Rendered Tile Cache
+
+Rendered PNG tiles are kept in an in-memory LRU bounded by a byte budget and
+mirrored to a persistent on-disk store, so a tile viewed by one analyst is
+served to everyone else (and after a restart) without decoding and
+colormapping COG blocks again.
+
+Keys identify everything that affects the rendered bytes:
+(file path, mtime, z, x, y, band indexes, colormap, vmin, vmax, ...).
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', 'dataset/cache/tiles')
+DEFAULT_MEMORY_BYTES = int(os.environ.get('TILE_CACHE_MEMORY_MB', 256)) * 1024 * 1024
+DEFAULT_DISK_BYTES = int(os.environ.get('TILE_CACHE_DISK_MB', 2048)) * 1024 * 1024
+
+
+def make_tile_key(path, mtime, z, x, y, **style):
+    """
+    Build a hashable cache key for one rendered tile.
+
+    Args:
+        path: Source raster path
+        mtime: Source modification time (invalidates tiles when the file changes)
+        z, x, y: Tile coordinates
+        **style: Rendering parameters (indexes, colormap, vmin, vmax, ...)
+
+    Returns:
+        tuple: Normalized cache key
+    """
+    normalized = []
+    for name, value in sorted(style.items()):
+        if isinstance(value, list):
+            value = tuple(value)
+        normalized.append((name, value))
+    return (str(path), mtime, int(z), int(x), int(y), tuple(normalized))
+
+
+class TileCache:
+    """
+    In-memory LRU with a byte budget in front of an on-disk tile store.
+
+    Args:
+        memory_bytes: Budget for the in-memory tier
+        disk_dir: Directory of the persistent tier (None disables it)
+        disk_bytes: Size cap of the persistent tier (None for unbounded)
+    """
+
+    def __init__(self, memory_bytes=DEFAULT_MEMORY_BYTES, disk_dir=DEFAULT_CACHE_DIR,
+                 disk_bytes=DEFAULT_DISK_BYTES):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+
+    # ------------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------------
+
+    def _memory_put(self, key, data):
+        size = len(data)
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old)
+        self._memory[key] = data
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self.counters['memory_evictions'] += 1
+
+    # ------------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------------
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return self.disk_dir / digest[:2] / f"{digest}.tile"
+
+    def _disk_usage(self):
+        if self._disk_used is None:
+            self._disk_used = sum(
+                f.stat().st_size for f in self.disk_dir.glob('*/*.tile')
+            ) if self.disk_dir.exists() else 0
+        return self._disk_used
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Refresh recency for eviction
+        except OSError:
+            pass
+        return data
+
+    def _disk_put(self, key, data):
+        path = self._disk_path(key)
+        with self._lock:
+            self._disk_usage()
+        try:
+            previous = path.stat().st_size
+        except OSError:
+            previous = 0
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[TILES] Tile cache write failed: {e}")
+            return
+        with self._lock:
+            self._disk_used += len(data) - previous
+            over_budget = self.disk_bytes is not None and self._disk_used > self.disk_bytes
+        if over_budget:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """Drop least recently used files until the store is at 90% of its cap."""
+        files = []
+        for f in self.disk_dir.glob('*/*.tile'):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_bytes * 0.9
+        evicted = 0
+        for _, size, f in files:
+            if total <= target:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_used = total
+            self.counters['disk_evictions'] += evicted
+
+    # ------------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------------
+
+    def _lookup(self, key, count=True):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                if count:
+                    self.counters['memory_hits'] += 1
+                return data, 'memory'
+
+        if self.disk_dir is not None:
+            data = self._disk_get(key)
+            if data is not None:
+                with self._lock:
+                    self._memory_put(key, data)
+                    if count:
+                        self.counters['disk_hits'] += 1
+                return data, 'disk'
+
+        if count:
+            with self._lock:
+                self.counters['misses'] += 1
+        return None, 'miss'
+
+    def get(self, key):
+        """
+        Look up a tile in memory, then on disk.
+
+        Returns:
+            tuple: (bytes or None, tier) where tier is 'memory', 'disk' or 'miss'
+        """
+        return self._lookup(key)
+
+    def put(self, key, data):
+        """Store a rendered tile in both tiers."""
+        data = bytes(data)
+        with self._lock:
+            self._memory_put(key, data)
+        if self.disk_dir is not None:
+            self._disk_put(key, data)
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached tile for key, rendering and storing it on a miss.
+
+        Concurrent misses for the same key render once: the first caller
+        renders, the others wait for it and are served from the cache
+        (counted as 'coalesced'). When the tile cannot be read back (the
+        render failed, or no tier keeps it) each waiter renders on its own.
+
+        Args:
+            key: Cache key from make_tile_key()
+            render: Zero-argument callable producing the tile bytes
+
+        Returns:
+            tuple: (bytes, tier)
+        """
+        data, tier = self.get(key)
+        if data is not None:
+            return data, tier
+
+        with self._lock:
+            done = self._inflight.get(key)
+            leader = done is None
+            if leader:
+                done = self._inflight[key] = threading.Event()
+        if not leader:
+            done.wait()
+            data, tier = self._lookup(key, count=False)
+            if data is not None:
+                with self._lock:
+                    self.counters['coalesced'] += 1
+                return data, tier
+            data = render()
+            self.put(key, data)
+            return data, 'miss'
+
+        try:
+            data = render()
+            self.put(key, data)
+            return data, 'miss'
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            done.set()
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+
+    def stats(self):
+        """Return hit/miss counters and tier occupancy."""
+        with self._lock:
+            lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return {
+                **self.counters,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_used,
+                'memory_budget': self.memory_bytes,
+                'disk_bytes': self._disk_used,
+                'disk_budget': self.disk_bytes,
+            }
+
+
+# ============================================================================
+# Process-wide Instance
+# ============================================================================
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_tile_cache(**kwargs):
+    """
+    Return the process-wide TileCache, creating it on first call.
+
+    Keyword arguments are only used when the cache is created.
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = TileCache(**kwargs)
+        return _CACHE
@@ -0,0 +1,294 @@
+"""
+Automatic COG Materialization
+
+Rasters that are striped or have no overviews make every low-zoom tile read
+full-resolution data. When the app opens such a file, a Cloud Optimized copy
+(internal tiling plus overviews) is built in a local cache directory by a
+background job, and the map switches to it once it is ready. Until then the
+original file is served.
+
+Cached copies are keyed by source path, size and mtime, so editing or
+replacing a source builds a fresh copy. The directory is an LRU bounded by
+COG_CACHE_MB (recency is the file mtime, as in the tile cache), so copies
+of replaced sources age out.
+
+Environment:
+    COG_CACHE_DIR      Where optimized copies are written (default dataset/cache/cog)
+    COG_CACHE_MB       Size cap of the directory in MB (default 20480)
+    COG_CACHE_ENABLED  0 to always serve sources as they are
+"""
+
+import functools
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rasterio.shutil import copy as rio_copy
+
+from src.read_cache import open_raster
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_COG_DIR = os.environ.get('COG_CACHE_DIR', 'dataset/cache/cog')
+COG_CACHE_BYTES = int(os.environ.get('COG_CACHE_MB', 20480)) * 1024 * 1024
+COG_CACHE_ENABLED = os.environ.get('COG_CACHE_ENABLED', '1') != '0'
+COG_BLOCK_SIZE = 512
+# Rasters smaller than this (pixels on the long side) do not need overviews
+MIN_OVERVIEW_SIZE = 1024
+
+
+# ============================================================================
+# Inspection
+# ============================================================================
+
+@functools.lru_cache(maxsize=64)
+def _inspect(path, mtime_ns):
+    with open_raster(path) as src:
+        block_h, block_w = src.block_shapes[0]
+        tiled = (block_w < src.width and block_h < src.height) or max(src.width, src.height) <= COG_BLOCK_SIZE
+        has_overviews = bool(src.overviews(1)) or max(src.width, src.height) <= MIN_OVERVIEW_SIZE
+    problems = []
+    if not tiled:
+        problems.append(f"striped ({block_w}x{block_h} blocks)")
+    if not has_overviews:
+        problems.append("no overviews")
+    return ", ".join(problems) or None
+
+
+def needs_optimization(path):
+    """
+    Check whether a raster lacks internal tiling or overviews.
+
+    Args:
+        path: Raster path
+
+    Returns:
+        str: Description of what is missing, or None if the file is tile-friendly
+    """
+    return _inspect(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+def cog_cache_path(path, cache_dir=DEFAULT_COG_DIR):
+    """
+    Location of the optimized copy for a source raster.
+
+    Returns:
+        str: `<cache_dir>/<stem>.<hash>.cog.tif`, hashed on path, size and mtime
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    digest = hashlib.sha1(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}.{digest}.cog.tif")
+
+
+def _overview_resampling(path):
+    """Average for multi-band imagery, nearest for model outputs (class labels must not blend)."""
+    with open_raster(path) as src:
+        return "AVERAGE" if src.count >= 3 else "NEAREST"
+
+
+def build_cog(path, dst_path):
+    """
+    Write a tiled, overviewed, DEFLATE-compressed copy of a raster.
+
+    The copy is written under a temporary name and renamed into place, so a
+    partially written file is never picked up.
+
+    Args:
+        path: Source raster path
+        dst_path: Destination COG path
+
+    Returns:
+        str: dst_path
+    """
+    os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    try:
+        with open_raster(path) as src:
+            rio_copy(
+                src, tmp_path, driver="COG",
+                BLOCKSIZE=COG_BLOCK_SIZE,
+                COMPRESS="DEFLATE",
+                BIGTIFF="IF_SAFER",
+                NUM_THREADS="ALL_CPUS",
+                OVERVIEW_RESAMPLING=_overview_resampling(path),
+            )
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dst_path
+
+
+def evict_cog_cache(cache_dir=DEFAULT_COG_DIR, max_bytes=COG_CACHE_BYTES, keep=()):
+    """
+    Drop least recently used optimized copies until the directory is at 90% of its cap.
+
+    Copies that are being served stay readable through their open handles;
+    a later resolve() builds them again.
+
+    Args:
+        cache_dir: Directory of optimized copies
+        max_bytes: Size cap (None for unbounded)
+        keep: Paths never to remove (e.g. the copy just built)
+
+    Returns:
+        int: Number of copies removed
+    """
+    if max_bytes is None or not os.path.isdir(cache_dir):
+        return 0
+    keep = {os.path.abspath(p) for p in keep}
+    files = []
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith('.cog.tif'):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, entry.path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    if total <= max_bytes:
+        return 0
+    target = max_bytes * 0.9
+    evicted = 0
+    for _, size, f in files:
+        if total <= target:
+            break
+        if os.path.abspath(f) in keep:
+            continue
+        try:
+            os.remove(f)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    if evicted:
+        print(f"[TILES] Evicted {evicted} optimized copies (cache over {max_bytes // (1024 * 1024)} MB)")
+    return evicted
+
+
+# ============================================================================
+# Background Materializer
+# ============================================================================
+
+class CogMaterializer:
+    """
+    Builds optimized copies of rasters in the background, one at a time.
+
+    Args:
+        cache_dir: Directory for optimized copies
+        enabled: When False, sources are always served as they are
+        max_bytes: Size cap of cache_dir (None for unbounded)
+    """
+
+    def __init__(self, cache_dir=DEFAULT_COG_DIR, enabled=COG_CACHE_ENABLED, max_bytes=COG_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._jobs = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cogify")
+
+    def _build(self, path, dst_path):
+        print(f"[TILES] Building optimized copy of {os.path.basename(path)} ...")
+        try:
+            build_cog(path, dst_path)
+        except Exception as e:
+            print(f"[TILES] Could not optimize {os.path.basename(path)}: {e}")
+            with self._lock:
+                self._failed.add(dst_path)
+            raise
+        finally:
+            with self._lock:
+                self._jobs.pop(dst_path, None)
+        print(f"[TILES] Optimized copy ready: {dst_path}")
+        evict_cog_cache(self.cache_dir, self.max_bytes, keep=[dst_path])
+        return dst_path
+
+    def resolve(self, path):
+        """
+        Choose the file to serve for a raster and start optimizing it if needed.
+
+        Args:
+            path: Source raster path
+
+        Returns:
+            tuple: (path to serve now, Future resolving to the optimized path
+                or None when no switch will follow)
+        """
+        if not self.enabled:
+            return path, None
+        try:
+            problem = needs_optimization(path)
+            if problem is None:
+                return path, None
+            dst_path = cog_cache_path(path, self.cache_dir)
+        except Exception as e:
+            print(f"[TILES] Could not inspect {os.path.basename(path)}: {e}")
+            return path, None
+
+        if os.path.exists(dst_path):
+            try:
+                os.utime(dst_path)  # Refresh recency for eviction
+            except OSError:
+                pass
+            return dst_path, None
+        if dst_path in self._failed:
+            return path, None
+
+        with self._lock:
+            future = self._jobs.get(dst_path)
+            if future is None:
+                print(f"[TILES] {os.path.basename(path)} is not tile-optimized ({problem}); "
+                      f"serving original until the cached copy is built")
+                future = self._executor.submit(self._build, path, dst_path)
+                self._jobs[dst_path] = future
+        return path, future
+
+    def pending(self):
+        """Return the optimized paths currently being built."""
+        with self._lock:
+            return list(self._jobs)
+
+
+# ============================================================================
+# Process-wide Instance
+# ============================================================================
+
+_MATERIALIZER = None
+_MATERIALIZER_LOCK = threading.Lock()
+
+
+def get_materializer(**kwargs):
+    """
+    Return the process-wide CogMaterializer, creating it on first call.
+
+    Keyword arguments are only used when the materializer is created.
+    """
+    global _MATERIALIZER
+    with _MATERIALIZER_LOCK:
+        if _MATERIALIZER is None:
+            _MATERIALIZER = CogMaterializer(**kwargs)
+        return _MATERIALIZER
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.tiles.cogify <raster> [<raster> ...]")
+        sys.exit(1)
+    for source in sys.argv[1:]:
+        reason = needs_optimization(source)
+        if reason is None:
+            print(f"{source}: already tile-optimized")
+        else:
+            print(f"{source}: {reason} -> {build_cog(source, cog_cache_path(source))}")
+            evict_cog_cache(keep=[cog_cache_path(source)])
@@ -0,0 +1,290 @@
+"""
+Cached Tile Endpoint
+
+Flask routes registered on the localtileserver application that serve tiles
+through the shared TileCache. Sources are resolved through the process-wide
+TileSourcePool, and cache misses are rendered by the TileWorkers pool, whose
+workers keep their own dataset handles open (see src/tiles/workers.py), so
+no request reopens the COG or waits on another request's read.
+
+Routes:
+    /api/cached/tiles/<z>/<x>/<y>.<format>   Cached equivalent of /api/tiles
+    /api/cached/mask/<z>/<x>/<y>.<format>    Band-math mask tiles (see src/tiles/bandmath.py)
+    /api/cached/imerg/<z>/<x>/<y>.<format>   IMERG return-period overlay (see src/imerg.py)
+    /api/cached/stats                        Cache, pool and render worker counters (JSON)
+    /api/metrics                             Prometheus metrics (see src/metrics.py)
+"""
+
+import contextlib
+import os
+import time
+
+from flask import Blueprint, Response, jsonify, request
+from rio_tiler.errors import TileOutsideBounds
+from werkzeug.exceptions import BadRequest, NotFound
+
+from localtileserver.tiler import format_to_encoding, get_tile
+from localtileserver.web.utils import reformat_list_query_parameters
+
+from src import metrics
+from src.tiles import bandmath, workers as tile_workers
+from src.tiles.cache import get_tile_cache, make_tile_key
+
+CACHED_TILES_PATH = "api/cached/tiles/{z}/{x}/{y}.png"
+MASK_TILES_PATH = "api/cached/mask/{z}/{x}/{y}.png"
+IMERG_TILES_PATH = "api/cached/imerg/{z}/{x}/{y}.png"
+STYLE_PARAMS = ('indexes', 'colormap', 'vmin', 'vmax', 'nodata')
+
+cached_tiles = Blueprint("cached_tiles", __name__)
+
+
+def style_from_args(args):
+    """
+    Extract rendering parameters from tile URL query arguments.
+
+    Shared with the pre-warm job so both produce identical cache keys.
+
+    Args:
+        args: werkzeug MultiDict of query arguments
+    """
+    args = reformat_list_query_parameters(args)
+    return {k: v for k, v in args.items() if k in STYLE_PARAMS}
+
+
+def render_cached(reader, key_path, mtime, z, x, y, img_format, style, cache=None, lock=None,
+                  layer="unknown", workers=None):
+    """
+    Return a tile from the cache, rendering and storing it on a miss.
+
+    Args:
+        reader: Open rio-tiler reader for the source
+        key_path, mtime: Source identity from source_key()
+        z, x, y: Tile coordinates
+        img_format: Encoding from format_to_encoding()
+        style: Rendering parameters from style_from_args()
+        cache: TileCache (the process-wide one by default)
+        lock: Lock serializing reads on the reader, if shared between threads
+        layer: Layer label for the render-time metric
+        workers: TileWorkers rendering misses with their own handles (reader and lock unused)
+
+    Returns:
+        tuple: (bytes, tier)
+    """
+    cache = cache if cache is not None else get_tile_cache()
+    key = make_tile_key(key_path, mtime, z, x, y, format=img_format, **style)
+
+    def render():
+        if workers is not None:
+            with metrics.TILE_RENDER_SECONDS.time(layer=layer, zoom=z):
+                return workers.run(tile_workers.render_tile, key_path, mtime, z, x, y, img_format, style)
+        with metrics.TILE_RENDER_SECONDS.time(layer=layer, zoom=z), \
+                metrics.count_io(os.path.basename(key_path)):
+            if lock is None:
+                return get_tile(reader, z, x, y, img_format=img_format, **style)
+            with lock:
+                return get_tile(reader, z, x, y, img_format=img_format, **style)
+
+    return cache.get_or_render(key, render)
+
+
+def render_mask_cached(reader, key_path, mtime, z, x, y, img_format, expression, threshold,
+                       cache=None, lock=None, layer="unknown", workers=None):
+    """
+    Return a band-math mask tile from the cache, rendering it on a miss.
+
+    The cache key holds the normalized expression and the threshold, so every
+    slider stop is cached separately. On a miss the decoded band window is
+    reused when only the threshold or expression changed.
+
+    Args:
+        reader: Open rio-tiler reader for the source
+        key_path, mtime: Source identity from source_key()
+        z, x, y: Tile coordinates
+        img_format: Encoding from format_to_encoding()
+        expression: Mask expression (see bandmath.parse_expression())
+        threshold: Value of `t` in the expression
+        cache: TileCache (the process-wide one by default)
+        lock: Lock serializing reads on the reader, if shared between threads
+        layer: Layer label for the render-time metric
+        workers: TileWorkers rendering misses with their own handles (reader and lock unused)
+
+    Returns:
+        tuple: (bytes, tier)
+
+    Raises:
+        ValueError: Invalid expression
+    """
+    cache = cache if cache is not None else get_tile_cache()
+    normalized, _ = bandmath.parse_expression(expression)
+    key = make_tile_key(key_path, mtime, z, x, y, format=img_format, expression=normalized,
+                        threshold=threshold, palette=tuple(sorted(bandmath.MASK_PALETTE.items())))
+
+    def render():
+        if workers is not None:
+            with metrics.TILE_RENDER_SECONDS.time(layer=layer, zoom=z):
+                return workers.run(tile_workers.render_mask, key_path, mtime, z, x, y, img_format,
+                                   normalized, threshold)
+        with metrics.TILE_RENDER_SECONDS.time(layer=layer, zoom=z), \
+                metrics.count_io(os.path.basename(key_path)):
+            if lock is None:
+                bands = bandmath.read_tile_bands(reader, key_path, mtime, z, x, y)
+            else:
+                with lock:
+                    bands = bandmath.read_tile_bands(reader, key_path, mtime, z, x, y)
+            return bandmath.render_mask(bands, normalized, threshold, img_format)
+
+    return cache.get_or_render(key, render)
+
+
+@cached_tiles.route("/api/cached/tiles/<int:z>/<int:x>/<int:y>.<string:fmt>")
+def cached_tile(z, x, y, fmt):
+    with metrics.profiled(f"tile-{z}-{x}-{y}"):
+        return _cached_tile(z, x, y, fmt, mask=False)
+
+
+@cached_tiles.route("/api/cached/mask/<int:z>/<int:x>/<int:y>.<string:fmt>")
+def mask_tile(z, x, y, fmt):
+    with metrics.profiled(f"mask-{z}-{x}-{y}"):
+        return _cached_tile(z, x, y, fmt, mask=True)
+
+
+def _mask_args(args):
+    """Expression and threshold of a mask tile request."""
+    expression = args.get("expression", bandmath.DEFAULT_EXPRESSION)
+    try:
+        threshold = float(args.get("t", 1.0))
+    except ValueError as e:
+        raise BadRequest(f"Invalid threshold: {args.get('t')}") from e
+    try:
+        bandmath.parse_expression(expression)
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
+    return expression, threshold
+
+
+def _cached_tile(z, x, y, fmt, mask=False):
+    from src.tiles.pool import get_tile_pool
+
+    start = time.perf_counter()
+    # Set by the Step 2 layer manager; only used as a metrics label
+    layer = request.args.get("layer", "unknown")[:64]
+    filename = request.args.get("filename")
+    if not filename:
+        raise BadRequest("Missing 'filename' parameter.")
+    try:
+        img_format = format_to_encoding(fmt)
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
+    if mask:
+        expression, threshold = _mask_args(request.args)
+
+    with contextlib.ExitStack() as stack:
+        try:
+            # A reference keeps the pool from closing the reader mid-render
+            entry = stack.enter_context(get_tile_pool().borrow(filename))
+        except OSError as e:
+            raise NotFound(str(e)) from e
+
+        path, mtime = entry.key
+        # Without render workers, reads share the TileClient's handle, which is
+        # not thread-safe, so they are serialized per source
+        workers = tile_workers.get_tile_workers()
+        try:
+            if mask:
+                data, tier = render_mask_cached(
+                    entry.client.reader, path, mtime, z, x, y, img_format,
+                    expression, threshold, lock=entry.lock, layer=layer, workers=workers
+                )
+            else:
+                data, tier = render_cached(
+                    entry.client.reader, path, mtime, z, x, y, img_format,
+                    style_from_args(request.args), lock=entry.lock, layer=layer, workers=workers
+                )
+        except TileOutsideBounds as e:
+            raise NotFound(str(e)) from e
+        except ValueError as e:
+            if not mask:
+                raise
+            raise BadRequest(str(e)) from e
+
+    response = Response(data, mimetype=f"image/{img_format.lower()}")
+    response.headers['X-Tile-Cache'] = tier
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    metrics.TILE_REQUEST_SECONDS.observe(time.perf_counter() - start, layer=layer, zoom=z, cache=tier)
+    return response
+
+
+@cached_tiles.route("/api/cached/imerg/<int:z>/<int:x>/<int:y>.<string:fmt>")
+def imerg_tile(z, x, y, fmt):
+    """Return-period tile around the footprint of the raster in `filename`."""
+    from src import imerg
+    from src.tiles.pool import source_key
+
+    start = time.perf_counter()
+    variable = request.args.get("variable")
+    filename = request.args.get("filename")
+    if not variable or not filename:
+        raise BadRequest("Missing 'variable' or 'filename' parameter.")
+    try:
+        img_format = format_to_encoding(fmt)
+        vmax = float(request.args["vmax"]) if "vmax" in request.args else None
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
+    catalog = imerg.source_key()
+    if catalog is None:
+        raise NotFound("IMERG catalog not configured.")
+    if variable not in imerg.return_period_variables():
+        raise BadRequest(f"Unknown variable: {variable}")
+    try:
+        raster = source_key(filename)
+    except OSError as e:
+        raise NotFound(str(e)) from e
+
+    key = make_tile_key(*catalog, z, x, y, format=img_format, variable=variable, footprint=raster, vmax=vmax)
+
+    def render():
+        with metrics.TILE_RENDER_SECONDS.time(layer="imerg", zoom=z):
+            # An empty tile is cached too, so views away from the footprint stay cheap
+            return imerg.render_tile(variable, raster[0], z, x, y, img_format, vmax) or b""
+
+    data, tier = get_tile_cache().get_or_render(key, render)
+    if not data:
+        raise NotFound("No IMERG data in this tile.")
+    response = Response(data, mimetype=f"image/{img_format.lower()}")
+    response.headers['X-Tile-Cache'] = tier
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    metrics.TILE_REQUEST_SECONDS.observe(time.perf_counter() - start, layer="imerg", zoom=z, cache=tier)
+    return response
+
+
+@cached_tiles.route("/api/cached/stats")
+def cache_stats():
+    from src.tiles.pool import get_tile_pool
+
+    workers = tile_workers.get_tile_workers()
+    return jsonify({
+        'cache': get_tile_cache().stats(),
+        'sources': get_tile_pool().stats(),
+        'workers': workers.stats() if workers is not None else None,
+    })
+
+
+@cached_tiles.route("/api/metrics")
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def register(app):
+    """
+    Attach the cached tile routes to a Flask app.
+
+    Must run before the app serves its first request; safe to call twice.
+    """
+    if cached_tiles.name in app.blueprints:
+        return True
+    try:
+        app.register_blueprint(cached_tiles)
+        return True
+    except AssertionError as e:
+        print(f"[TILES] Could not register cached tile routes: {e}")
+        return False
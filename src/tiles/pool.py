@@ -0,0 +1,338 @@
+"""
+Process-wide Tile Source Pool
+
+A single registry of localtileserver tile sources shared by every Solara
+session. Sources are keyed by (path, mtime) and reference-counted, so a dozen
+browser tabs looking at the same scene share one TileClient, one open COG and
+one tile endpoint. The tile server itself is started lazily on first use and
+sources that nobody holds are closed after an idle TTL, or earlier when more
+than `max_idle` of them are open (least recently used first), so switching
+between recent scenes reuses open handles while memory stays bounded.
+"""
+
+import contextlib
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+from localtileserver import TileClient
+from localtileserver.manager import AppManager
+from server_thread import ServerManager, launch_server
+
+from src.tiles import endpoint, workers
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_IDLE_TTL = 600         # Seconds an unreferenced source stays open
+DEFAULT_MAX_IDLE = 16          # Unreferenced sources kept open at most
+REAP_INTERVAL = 60             # Seconds between idle sweeps
+
+
+# ============================================================================
+# Shared Tile Client
+# ============================================================================
+
+class SharedTileClient(TileClient):
+    """
+    TileClient whose server lifetime is owned by the pool.
+
+    The stock TileClient shuts the server on its port down when it is garbage
+    collected, which would take tiles away from every other session sharing
+    the same fixed port.
+    """
+
+    use_cache = False
+
+    @property
+    def filename(self):
+        """Source path (the dataset may be opened through the read cache, under a /vsi name)."""
+        return self.reader.input
+
+    def shutdown(self, force: bool = False):
+        pass
+
+    def get_tile_url(self, *args, layer=None, **kwargs):
+        """
+        Tile URL template, routed through the cached endpoint when enabled.
+
+        Args:
+            layer: Optional layer name, sent along as a metrics label
+        """
+        url = super().get_tile_url(*args, **kwargs)
+        if self.use_cache:
+            url = url.replace("/api/tiles/", "/api/cached/tiles/", 1)
+        if layer:
+            url += "&" + urlencode({"layer": layer})
+        return url
+
+    def get_mask_url(self, expression, threshold, client=True, layer=None):
+        """
+        Tile URL template of a band-math mask layer (see src/tiles/bandmath.py).
+
+        Args:
+            expression: Mask expression over cls / unc / t
+            threshold: Value of `t`
+            client: Use the browser-facing host and port
+            layer: Optional layer name, sent along as a metrics label
+
+        Returns:
+            str: URL template, or None when the cached endpoint is unavailable
+        """
+        if not self.use_cache:
+            return None
+        params = {"expression": expression, "t": f"{float(threshold):g}"}
+        if layer:
+            params["layer"] = layer
+        return self.create_url(endpoint.MASK_TILES_PATH, client=client) + "&" + urlencode(params)
+
+    def get_imerg_url(self, variable, vmax=None, client=True):
+        """
+        Tile URL template of the IMERG return-period overlay around this source's footprint.
+
+        Returns:
+            str: URL template, or None when the cached endpoint is unavailable
+        """
+        if not self.use_cache:
+            return None
+        params = {"variable": variable}
+        if vmax is not None:
+            params["vmax"] = f"{float(vmax):g}"
+        return self.create_url(endpoint.IMERG_TILES_PATH, client=client) + "&" + urlencode(params)
+
+    def close(self):
+        """Release the underlying dataset handle."""
+        try:
+            self.reader.close()
+        except Exception as e:
+            print(f"[TILES] Error closing {self.filename}: {e}")
+
+
+class _PoolEntry:
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.refcount = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+def source_key(path):
+    """
+    Build the registry key for a raster path.
+
+    Returns:
+        tuple: (absolute path, mtime in ns)
+    """
+    path = os.path.abspath(path)
+    return path, os.stat(path).st_mtime_ns
+
+
+# ============================================================================
+# Pool
+# ============================================================================
+
+class TileSourcePool:
+    """
+    Reference-counted registry of tile sources behind one tile server.
+
+    Args:
+        host: Interface the tile server listens on
+        port: Fixed tile server port
+        client_host: Hostname the browser uses for tile requests
+        client_port: Port the browser uses for tile requests
+        idle_ttl: Seconds an unreferenced source is kept open
+        max_idle: Unreferenced sources kept open at most (LRU beyond that)
+        use_cache: Serve tiles through the two-tier tile cache endpoint
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, client_host=None,
+                 client_port=None, idle_ttl=DEFAULT_IDLE_TTL, max_idle=DEFAULT_MAX_IDLE,
+                 use_cache=True):
+        self.host = host
+        self.port = port
+        self.client_host = client_host
+        self.client_port = client_port if client_port is not None else port
+        self.idle_ttl = idle_ttl
+        self.max_idle = max_idle
+        self.use_cache = use_cache
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._server_key = None
+        self._reaper = None
+
+    # ------------------------------------------------------------------------
+    # Server lifecycle
+    # ------------------------------------------------------------------------
+
+    def _ensure_server(self):
+        """Start the shared tile server on first use."""
+        if self._server_key is not None and ServerManager.is_server_live(self._server_key):
+            return
+        app = AppManager.get_or_create_app()
+        workers.configure_gdal()
+        if self.use_cache:
+            self.use_cache = endpoint.register(app)
+        self._server_key = launch_server(app, port=self.port, host=self.host)
+        print(f"[TILES] Tile server listening on {self.host}:{self._server_key}")
+        self._start_reaper()
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+
+        def loop():
+            while True:
+                time.sleep(REAP_INTERVAL)
+                self.reap_idle()
+
+        self._reaper = threading.Thread(target=loop, name="tile-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def shutdown(self):
+        """Close every source and stop the tile server."""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.client.close()
+            self._entries.clear()
+            if self._server_key is not None:
+                ServerManager.shutdown_server(self._server_key, force=True)
+                self._server_key = None
+
+    # ------------------------------------------------------------------------
+    # Sources
+    # ------------------------------------------------------------------------
+
+    def _open(self, key):
+        from localtileserver.tiler.utilities import get_clean_filename
+
+        client = SharedTileClient(
+            workers.CachedReader(get_clean_filename(key[0])),
+            port=self._server_key,
+            host=self.host,
+            client_port=self.client_port,
+            client_host=self.client_host,
+        )
+        client.use_cache = self.use_cache
+        print(f"[TILES] Opened tile source: {os.path.basename(key[0])}")
+        return _PoolEntry(key, client)
+
+    def _get_entry(self, path):
+        """Entry for a path, opened if needed, with one reference taken."""
+        key = source_key(path)
+        with self._lock:
+            self._ensure_server()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._open(key)
+                self._entries[key] = entry
+            # Referenced before trimming, so the entry is never seen as idle
+            entry.refcount += 1
+            entry.touch()
+            self._trim_idle()
+            return entry
+
+    def _release_entry(self, entry):
+        with self._lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.touch()
+            self._trim_idle()
+
+    def acquire(self, path):
+        """
+        Get the shared TileClient for a raster, opening it if needed.
+
+        Every call must be paired with release().
+
+        Returns:
+            TileClient: Shared client serving the raster
+        """
+        return self._get_entry(path).client
+
+    def release(self, client):
+        """Drop one reference taken by acquire()."""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.client is client:
+                    self._release_entry(entry)
+                    return
+
+    @contextlib.contextmanager
+    def borrow(self, path):
+        """
+        Hold a reference to the pool entry for a path while rendering from it.
+
+        Used by the cached tile endpoint, which must keep serving any source a
+        browser still holds a URL for and reopens it if it was reaped. The
+        reference keeps the reaper and LRU trim from closing the reader mid-render.
+
+        Yields:
+            _PoolEntry: Entry with key, client and lock
+        """
+        entry = self._get_entry(path)
+        try:
+            yield entry
+        finally:
+            self._release_entry(entry)
+
+    def reap_idle(self, now=None):
+        """
+        Close sources that have been unreferenced for longer than the TTL.
+
+        Returns:
+            int: Number of sources closed
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.refcount == 0 and now - entry.last_used > self.idle_ttl
+            ]
+            for key in stale:
+                self._entries.pop(key).client.close()
+                print(f"[TILES] Closed idle tile source: {os.path.basename(key[0])}")
+        return len(stale)
+
+    def _trim_idle(self):
+        """Close the least recently used unreferenced sources beyond max_idle."""
+        idle = sorted(
+            (e for e in self._entries.values() if e.refcount == 0),
+            key=lambda e: e.last_used
+        )
+        for entry in idle[:max(0, len(idle) - self.max_idle)]:
+            self._entries.pop(entry.key).client.close()
+            print(f"[TILES] Closed least recently used tile source: {os.path.basename(entry.key[0])}")
+
+    def stats(self):
+        """Return a snapshot of open sources and their reference counts."""
+        with self._lock:
+            return {
+                key[0]: {'refcount': e.refcount, 'idle': time.monotonic() - e.last_used}
+                for key, e in self._entries.items()
+            }
+
+
+# ============================================================================
+# Process-wide Instance
+# ============================================================================
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_tile_pool(**kwargs):
+    """
+    Return the process-wide TileSourcePool, creating it on first call.
+
+    Keyword arguments are only used when the pool is created.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = TileSourcePool(**kwargs)
+        return _POOL
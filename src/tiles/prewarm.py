@@ -0,0 +1,305 @@
+"""
+Tile Pyramid Pre-warming
+
+Renders the XYZ tiles covering the configured watershed (or the raster
+footprint when no watershed is set) into the persistent tile cache, for a
+zoom range and every Step 2 layer style: input imagery, classification and
+uncertainty. The first session at WATERSHED_ZOOM then gets disk-cache hits
+instead of waiting on cold renders from NAS-hosted COGs.
+
+Tiles are rendered by a process pool; each worker opens its own dataset
+handles and writes straight into the on-disk tier of the tile cache, using
+the same keys as the cached tile endpoint.
+
+Usage:
+    python -m src.tiles.prewarm [--zoom 9-13] [--workers N] [--footprint]
+
+Environment:
+    TILE_PREWARM          1 to run a pre-warm in the background at server start
+    TILE_PREWARM_ZOOMS    Zoom range, e.g. "9-13" (default WATERSHED_ZOOM-2 .. +2)
+    TILE_PREWARM_WORKERS  Worker processes (default: CPU count, at most 8)
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import parse_qsl, urlsplit
+
+from src.config import get_scene
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+TILE_FORMAT = 'png'
+BATCH_SIZE = 32                # Tiles per worker task
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+PROGRESS_INTERVAL = 2.0        # Seconds between progress lines
+
+_worker_readers = {}
+_worker_caches = {}
+
+
+# ============================================================================
+# Jobs
+# ============================================================================
+
+def parse_zoom_range(text):
+    """
+    Parse "9-13" or "11" into a list of zoom levels.
+
+    Returns:
+        list: Zoom levels, inclusive
+    """
+    lo, _, hi = str(text).partition('-')
+    return list(range(int(lo), int(hi or lo) + 1))
+
+
+def default_zooms():
+    from src.step2.app import WATERSHED_ZOOM
+
+    spec = os.environ.get('TILE_PREWARM_ZOOMS')
+    if spec:
+        return parse_zoom_range(spec)
+    return list(range(WATERSHED_ZOOM - 2, WATERSHED_ZOOM + 3))
+
+
+def query_style(style):
+    """
+    Normalize layer parameters exactly as the cached endpoint sees them.
+
+    The parameters go through the same URL encoding as a TileClient tile URL
+    and are parsed back, so pre-warmed tiles share cache keys with browser
+    requests.
+
+    Args:
+        style: Tile parameters (indexes, colormap, vmin, vmax, ...)
+
+    Returns:
+        dict: Query-string style for render_cached()
+    """
+    from localtileserver.utilities import add_query_parameters
+    from werkzeug.datastructures import MultiDict
+
+    from src.tiles.endpoint import style_from_args
+
+    params = {k: v for k, v in style.items() if v is not None and k != 'name'}
+    query = urlsplit(add_query_parameters("", params)).query
+    return style_from_args(MultiDict(parse_qsl(query, keep_blank_values=True)))
+
+
+def layer_styles():
+    """
+    Rendering parameters of every Step 2 layer with the raster each one reads.
+
+    Returns:
+        list: (label, source path, style) tuples
+    """
+    from src.step2.app import input_source_path, output_layer_style, uncertainty_threshold
+
+    output_path = get_scene()['output_path']
+    return [
+        ("input", input_source_path(), {}),
+        ("classification", output_path, output_layer_style("Flood Classification", None)),
+        ("uncertainty", output_path, output_layer_style("Uncertainty", uncertainty_threshold.value)),
+    ]
+
+
+def served_path(path):
+    """
+    The file the tile server will serve for a raster.
+
+    Rasters that need optimization are cogified first (see cogify.py), so the
+    tiles warmed here are the ones sessions will request.
+    """
+    from src.tiles.cogify import get_materializer
+
+    serve_path, future = get_materializer().resolve(path)
+    if future is not None:
+        print(f"[PREWARM] Waiting for optimized copy of {os.path.basename(path)} ...")
+        serve_path = future.result()
+    return serve_path
+
+
+def target_bounds(path, use_watershed=True):
+    """
+    Lon/lat bounds to warm: the watershed bbox clipped to the raster, or the footprint.
+
+    Returns:
+        tuple: (west, south, east, north) or None if they do not overlap
+    """
+    from rasterio.warp import transform_bounds
+
+    from src.read_cache import open_raster
+
+    with open_raster(path) as src:
+        west, south, east, north = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+
+    scene = get_scene()
+    if use_watershed and scene['watershed_path'] and scene['watershed_id']:
+        from src.hydrobasins.store import read_basins_by_id
+
+        basin = read_basins_by_id(scene['watershed_path'], [scene['watershed_id']])
+        if not basin.empty:
+            bw, bs, be, bn = basin.to_crs("EPSG:4326").total_bounds
+            west, south, east, north = max(west, bw), max(south, bs), min(east, be), min(north, bn)
+    if west >= east or south >= north:
+        return None
+    return west, south, east, north
+
+
+def enumerate_tiles(bounds, zooms):
+    """
+    List the Web Mercator XYZ tiles covering lon/lat bounds.
+
+    Returns:
+        list: (z, x, y) tuples
+    """
+    import morecantile
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    return [(t.z, t.x, t.y) for t in tms.tiles(*bounds, zooms=zooms)]
+
+
+# ============================================================================
+# Worker
+# ============================================================================
+
+def _render_batch(path, mtime, style, tiles, cache_dir):
+    """Render a batch of tiles into the disk cache (runs in a worker process)."""
+    from localtileserver.tiler import format_to_encoding
+    from localtileserver.tiler.utilities import get_clean_filename
+    from rio_tiler.errors import TileOutsideBounds
+
+    from src.tiles.cache import TileCache
+    from src.tiles.endpoint import render_cached
+    from src.tiles.workers import WorkerReader
+
+    reader = _worker_readers.get(path)
+    if reader is None or reader.mtime != mtime:
+        if reader is not None:
+            reader.close()
+        # Read cache and memoized statistics, as the tile server's workers
+        reader = _worker_readers[path] = WorkerReader(get_clean_filename(path))
+        reader.mtime = mtime
+    cache = _worker_caches.get(cache_dir)
+    if cache is None:
+        # Memory tier disabled: the pool's workers only feed the shared disk tier.
+        # One instance per worker, so the disk usage scan runs once, not per batch
+        cache = _worker_caches[cache_dir] = TileCache(memory_bytes=0, disk_dir=cache_dir)
+    img_format = format_to_encoding(TILE_FORMAT)
+
+    counts = {'rendered': 0, 'cached': 0, 'outside': 0, 'failed': 0}
+    for z, x, y in tiles:
+        try:
+            _, tier = render_cached(reader, path, mtime, z, x, y, img_format, style, cache=cache)
+            counts['rendered' if tier == 'miss' else 'cached'] += 1
+        except TileOutsideBounds:
+            counts['outside'] += 1
+        except Exception as e:
+            counts['failed'] += 1
+            print(f"[PREWARM] Tile {z}/{x}/{y} of {os.path.basename(path)} failed: {e}")
+    return counts
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def prewarm(zooms=None, workers=DEFAULT_WORKERS, use_watershed=True, cache_dir=None):
+    """
+    Render every tile of the configured scene's layers over the target extent.
+
+    Args:
+        zooms: Zoom levels (default_zooms() when None)
+        workers: Worker processes
+        use_watershed: Limit to the watershed bbox when one is configured
+        cache_dir: Disk tier of the tile cache (the process-wide cache's by default)
+
+    Returns:
+        dict: Tile counts, elapsed seconds and throughput
+    """
+    from src.tiles.cache import get_tile_cache
+    from src.tiles.pool import source_key
+
+    zooms = zooms or default_zooms()
+    cache_dir = str(cache_dir or get_tile_cache().disk_dir)
+
+    batches = []
+    for label, source, style in layer_styles():
+        if not source or not os.path.exists(source):
+            print(f"[PREWARM] Skipping {label}: raster not available")
+            continue
+        path, mtime = source_key(served_path(source))
+        bounds = target_bounds(path, use_watershed)
+        if bounds is None:
+            print(f"[PREWARM] Skipping {label}: watershed does not overlap the raster")
+            continue
+        tiles = enumerate_tiles(bounds, zooms)
+        print(f"[PREWARM] {label}: {len(tiles)} tiles at zooms {zooms[0]}-{zooms[-1]}")
+        batches += [
+            (path, mtime, query_style(style), tiles[i:i + BATCH_SIZE], cache_dir)
+            for i in range(0, len(tiles), BATCH_SIZE)
+        ]
+
+    total = sum(len(b[3]) for b in batches)
+    totals = {'rendered': 0, 'cached': 0, 'outside': 0, 'failed': 0}
+    start = last_report = time.perf_counter()
+    done = 0
+    # spawn: forking a process that runs the tile server's threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as executor:
+        futures = {executor.submit(_render_batch, *batch): len(batch[3]) for batch in batches}
+        for future in as_completed(futures):
+            for name, count in future.result().items():
+                totals[name] += count
+            done += futures[future]
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL or done == total:
+                last_report = now
+                rate = done / (now - start) if now > start else 0.0
+                print(f"[PREWARM] {done}/{total} tiles ({100 * done / total:.0f}%), {rate:.1f} tiles/s")
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        **totals,
+        'total': total,
+        'elapsed': round(elapsed, 2),
+        'tiles_per_second': round(total / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print(f"[PREWARM] Done: {summary}")
+    return summary
+
+
+def start_prewarm_in_background():
+    """Run prewarm() in a daemon thread when TILE_PREWARM=1 (called at server start)."""
+    if os.environ.get('TILE_PREWARM') != '1':
+        return None
+    workers = int(os.environ.get('TILE_PREWARM_WORKERS', DEFAULT_WORKERS))
+
+    def run():
+        try:
+            prewarm(workers=workers)
+        except Exception as e:
+            print(f"[PREWARM] Pre-warm failed: {e}")
+
+    thread = threading.Thread(target=run, name="tile-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-render Step 2 tiles into the tile cache")
+    parser.add_argument("--zoom", help="Zoom range, e.g. 9-13")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('TILE_PREWARM_WORKERS', DEFAULT_WORKERS)))
+    parser.add_argument("--footprint", action="store_true", help="Warm the whole raster footprint")
+    args = parser.parse_args()
+    prewarm(
+        zooms=parse_zoom_range(args.zoom) if args.zoom else None,
+        workers=args.workers,
+        use_watershed=not args.footprint,
+    )
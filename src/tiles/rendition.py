@@ -0,0 +1,188 @@
+"""
+8-bit Band Composite Renditions
+
+The 13-band Sentinel-2 input is expensive to tile: every tile decodes a
+multi-band uint16/float stack and contrast-stretches it on the fly. This
+module writes derived 3-band uint8 COGs (true color, SWIR/NIR/Red, ...) with
+a percentile stretch computed once per scene, and the Step 2 input layer
+serves them instead of the raw stack when they exist.
+
+Stretch limits come from the streamed band statistics (see raster_stats.py),
+so they are cached in the input's statistics sidecar. Renditions are keyed by
+source path, size and mtime plus the stretch percentiles.
+
+Usage:
+    python -m src.tiles.rendition [<input.tif>] [--composite true_color swir_nir_red]
+
+Environment:
+    RENDITION_DIR     Where renditions are written (default dataset/cache/renditions)
+    INPUT_COMPOSITE   Composite shown by default (default true_color)
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import rasterio
+from rasterio.shutil import copy as rio_copy
+from rasterio.windows import Window
+
+from src.read_cache import open_raster
+from src.raster_stats import compute_band_stats, histogram_percentiles
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+DEFAULT_RENDITION_DIR = os.environ.get('RENDITION_DIR', 'dataset/cache/renditions')
+
+# 1-based band indexes into the 13-band stack
+# (B1, B2, B3, B4, B5, B6, B7, B8, B8A, B9, B10, B11, B12)
+COMPOSITES = {
+    'true_color': {'bands': (4, 3, 2), 'label': "True Color (B4/B3/B2)"},
+    'swir_nir_red': {'bands': (12, 8, 4), 'label': "SWIR/NIR/Red (B11/B8/B4)"},
+    'nir_red_green': {'bands': (8, 4, 3), 'label': "Color Infrared (B8/B4/B3)"},
+}
+DEFAULT_COMPOSITE = os.environ.get('INPUT_COMPOSITE', 'true_color')
+
+STRETCH_PERCENTILES = (2, 98)
+STRETCH_BINS = 1024            # Histogram bins used to estimate the percentiles
+WRITE_ROWS = 512               # Rows per window when writing
+
+
+# ============================================================================
+# Stretch
+# ============================================================================
+
+def stretch_limits(path, bands, percentiles=STRETCH_PERCENTILES):
+    """
+    Per-band percentile stretch limits of a raster.
+
+    Args:
+        path: Source raster path
+        bands: 1-based band indexes
+        percentiles: (low, high) percentiles
+
+    Returns:
+        list: (low, high) value pairs, one per band
+    """
+    limits = []
+    for band in bands:
+        stats = compute_band_stats(path, band=band, bins=STRETCH_BINS, approximate=True)
+        lo, hi = histogram_percentiles(stats["histogram"], percentiles)
+        if lo is None:
+            lo, hi = 0.0, 1.0
+        limits.append((lo, hi if hi > lo else lo + 1.0))
+    return limits
+
+
+def _to_uint8(data, lo, hi):
+    """Scale a masked band to 1-255, leaving 0 for nodata."""
+    values = np.ma.getdata(data).astype(np.float32)
+    scaled = np.clip((values - lo) / (hi - lo) * 254.0 + 1.0, 1, 255).astype(np.uint8)
+    invalid = np.ma.getmaskarray(data) | ~np.isfinite(values)
+    scaled[invalid] = 0
+    return scaled
+
+
+# ============================================================================
+# Renditions
+# ============================================================================
+
+def rendition_path(path, composite, rendition_dir=DEFAULT_RENDITION_DIR):
+    """
+    Location of a composite rendition for a source raster.
+
+    Returns:
+        str: `<rendition_dir>/<stem>.<composite>.<hash>.tif`
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    signature = f"{path}:{st.st_size}:{st.st_mtime_ns}:{COMPOSITES[composite]['bands']}:{STRETCH_PERCENTILES}"
+    digest = hashlib.sha1(signature.encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(rendition_dir, f"{stem}.{composite}.{digest}.tif")
+
+
+def find_rendition(path, composite=DEFAULT_COMPOSITE, rendition_dir=DEFAULT_RENDITION_DIR):
+    """
+    Return the rendition of a raster if it has been built.
+
+    Returns:
+        str: Rendition path or None
+    """
+    if composite not in COMPOSITES or not path or not os.path.exists(path):
+        return None
+    target = rendition_path(path, composite, rendition_dir)
+    return target if os.path.exists(target) else None
+
+
+def available_composites(path, rendition_dir=DEFAULT_RENDITION_DIR):
+    """
+    Composites with a built rendition for a raster, in COMPOSITES order.
+
+    Returns:
+        list: Composite names
+    """
+    return [name for name in COMPOSITES if find_rendition(path, name, rendition_dir)]
+
+
+def build_rendition(path, composite=DEFAULT_COMPOSITE, rendition_dir=DEFAULT_RENDITION_DIR):
+    """
+    Write a 3-band uint8 COG with overviews for one band composite.
+
+    Only the three composite bands are read, in full-width row windows, so
+    memory stays bounded regardless of scene size.
+
+    Args:
+        path: Source raster path (13-band stack)
+        composite: Key of COMPOSITES
+        rendition_dir: Output directory
+
+    Returns:
+        str: Rendition path
+    """
+    bands = COMPOSITES[composite]['bands']
+    dst_path = rendition_path(path, composite, rendition_dir)
+    os.makedirs(rendition_dir, exist_ok=True)
+    limits = stretch_limits(path, bands)
+    print(f"[TILES] {composite} stretch limits ({STRETCH_PERCENTILES[0]}-{STRETCH_PERCENTILES[1]}%): "
+          + ", ".join(f"B{b}={lo:.1f}..{hi:.1f}" for b, (lo, hi) in zip(bands, limits)))
+
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp.tif"
+    try:
+        with open_raster(path) as src:
+            profile = src.profile
+            profile.update(driver="GTiff", count=3, dtype="uint8", nodata=0, photometric="RGB",
+                           tiled=True, blockxsize=256, blockysize=256,
+                           compress="DEFLATE", BIGTIFF="IF_SAFER")
+            profile.pop('interleave', None)
+            with rasterio.open(tmp_path, "w", **profile) as dst:
+                for row in range(0, src.height, WRITE_ROWS):
+                    window = Window(0, row, src.width, min(WRITE_ROWS, src.height - row))
+                    for i, (band, (lo, hi)) in enumerate(zip(bands, limits), start=1):
+                        dst.write(_to_uint8(src.read(band, window=window, masked=True), lo, hi), i, window=window)
+        rio_copy(tmp_path, dst_path, driver="COG", COMPRESS="DEFLATE", PREDICTOR="2",
+                 OVERVIEW_RESAMPLING="AVERAGE", BIGTIFF="IF_SAFER")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"[TILES] Rendition ready: {dst_path}")
+    return dst_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.config import get_scene
+
+    parser = argparse.ArgumentParser(description="Build 8-bit composite renditions of the input raster")
+    parser.add_argument("input", nargs="?", help="Input raster (default: configured input_path)")
+    parser.add_argument("--composite", nargs="+", default=list(COMPOSITES), choices=list(COMPOSITES))
+    args = parser.parse_args()
+
+    source = args.input or get_scene()['input_path']
+    if not source or not os.path.exists(source):
+        parser.error(f"Input raster not found: {source}")
+    for name in args.composite:
+        build_rendition(source, name)
@@ -0,0 +1,306 @@
+"""
+Tile Render Workers
+
+The tile server handles every request on its own thread, but renders of one
+source used to share the TileClient's dataset handle behind a lock, so
+several users panning the same scene queued behind each other. Cache misses
+are instead rendered by a pool of workers, each with its own reusable
+dataset handles:
+
+- thread (default): a thread pool in the tile server process. GDAL releases
+  the GIL while reading and decompressing blocks, so renders overlap I/O and
+  decoding, and all workers share one GDAL block cache.
+- process: a pool of spawned processes, for when colormapping and PNG
+  encoding (which hold the GIL) dominate. Each process has its own block
+  cache, so the cache budget applies per process. GDAL read metrics
+  (METRICS_IO) are only collected in thread mode.
+
+Each worker keeps the readers of its TILE_WORKER_SOURCES most recently used
+sources open, keyed by (path, mtime), so a replaced file is reopened, and
+runs inside its own long-lived GDAL environment. localtileserver rescales
+every non-palette tile with the source's statistics, which rio-tiler
+recomputes from a full-raster preview on each call; the workers' readers
+share one memoized copy per source instead. Sources are opened through the
+local read cache, so NAS-hosted files are read from local disk once cached.
+
+GDAL_CACHEMAX and GDAL_NUM_THREADS are applied to the tile server process
+when the server starts, and to every worker process.
+
+Environment:
+    TILE_WORKERS            Render workers (default: CPU count, at most 8). 0 renders
+                            on the request thread through the shared, locked handle
+    TILE_WORKER_MODE        thread or process (default thread)
+    TILE_WORKER_SOURCES     Sources kept open per worker (default 8)
+    TILE_GDAL_CACHEMAX_MB   GDAL block cache per process in MB (default 512)
+    TILE_GDAL_NUM_THREADS   GDAL decoding threads per read, or ALL_CPUS (default 1;
+                            the workers already read in parallel)
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+
+from rio_tiler.io import Reader
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from src import metrics
+from src.read_cache import closer_for, open_raster
+from src.tiles import bandmath
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+TILE_WORKERS = int(os.environ.get('TILE_WORKERS', min(8, os.cpu_count() or 1)))
+TILE_WORKER_MODE = os.environ.get('TILE_WORKER_MODE', 'thread')
+TILE_WORKER_SOURCES = int(os.environ.get('TILE_WORKER_SOURCES', 8))
+TILE_GDAL_CACHEMAX_MB = int(os.environ.get('TILE_GDAL_CACHEMAX_MB', 512))
+TILE_GDAL_NUM_THREADS = os.environ.get('TILE_GDAL_NUM_THREADS', '1')
+WORKER_MODES = ('thread', 'process')
+MAX_STATISTICS = 64            # Memoized statistics results (per source and arguments)
+
+_local = threading.local()
+_statistics = OrderedDict()
+_statistics_lock = threading.Lock()
+
+
+# ============================================================================
+# GDAL Configuration
+# ============================================================================
+
+def configure_gdal(cachemax_mb=TILE_GDAL_CACHEMAX_MB, num_threads=TILE_GDAL_NUM_THREADS):
+    """
+    Set the GDAL block cache size and decoding threads for this process.
+
+    GDAL applies GDAL_CACHEMAX immediately, also after datasets were opened.
+    """
+    from rasterio.env import set_gdal_config
+
+    # rasterio passes an integer GDAL_CACHEMAX to GDAL as bytes
+    set_gdal_config('GDAL_CACHEMAX', int(cachemax_mb) * 1024 * 1024)
+    set_gdal_config('GDAL_NUM_THREADS', str(num_threads))
+
+
+# ============================================================================
+# Jobs (run on a worker)
+# ============================================================================
+
+class CachedReader(Reader):
+    """
+    rio-tiler Reader opening its dataset through the local read cache (see src/read_cache.py).
+
+    Readers are shared, so close() may run on another thread than the one
+    that opened the dataset; the dataset is closed in its opening context.
+    """
+
+    def __attrs_post_init__(self):
+        if not self.dataset:
+            self.dataset = open_raster(self.input)
+            self._ctx_stack.callback(closer_for(self.dataset))
+        super().__attrs_post_init__()
+
+
+class WorkerReader(CachedReader):
+    """rio-tiler Reader whose dataset statistics are memoized process-wide, per (path, mtime)."""
+
+    mtime = None
+
+    def statistics(self, *args, **kwargs):
+        key = (self.input, self.mtime, repr(args), repr(sorted(kwargs.items())))
+        with _statistics_lock:
+            entry = _statistics.get(key)
+            if entry is None:
+                entry = _statistics[key] = [threading.Lock(), None]
+                while len(_statistics) > MAX_STATISTICS:
+                    _statistics.popitem(last=False)
+            else:
+                _statistics.move_to_end(key)
+        # Workers asking for the same statistics wait for one computation
+        with entry[0]:
+            if entry[1] is None:
+                entry[1] = super().statistics(*args, **kwargs)
+            return entry[1]
+
+
+def _init_worker(cachemax_mb=None, num_threads=None):
+    """
+    Enter a GDAL environment for the worker's lifetime.
+
+    Datasets opened inside it do not carry their own environment, so they can
+    be closed from any thread (e.g. when the worker's thread-locals are freed).
+    """
+    import rasterio
+
+    if cachemax_mb is not None:
+        # Worker process: closed before the interpreter tears GDAL down
+        configure_gdal(cachemax_mb, num_threads)
+        atexit.register(_close_worker)
+    _local.env = rasterio.Env()
+    _local.env.__enter__()
+
+
+def _close_worker():
+    for reader in getattr(_local, 'readers', {}).values():
+        reader.close()
+    _local.readers = OrderedDict()
+    env = getattr(_local, 'env', None)
+    if env is not None:
+        env.__exit__(None, None, None)
+        _local.env = None
+
+
+def _reader(path, mtime):
+    """This worker's reader for a source, opened on first use."""
+    readers = getattr(_local, 'readers', None)
+    if readers is None:
+        readers = _local.readers = OrderedDict()
+    key = (path, mtime)
+    reader = readers.get(key)
+    if reader is None:
+        from localtileserver.tiler.utilities import get_clean_filename
+
+        reader = readers[key] = WorkerReader(get_clean_filename(path))
+        reader.mtime = mtime
+        while len(readers) > TILE_WORKER_SOURCES:
+            _, stale = readers.popitem(last=False)
+            stale.close()
+    else:
+        readers.move_to_end(key)
+    return reader
+
+
+def render_tile(path, mtime, z, x, y, img_format, style):
+    """Render one tile with localtileserver's styling (see endpoint.render_cached())."""
+    from localtileserver.tiler import get_tile
+
+    with metrics.count_io(os.path.basename(path)):
+        return get_tile(_reader(path, mtime), z, x, y, img_format=img_format, **style)
+
+
+def render_mask(path, mtime, z, x, y, img_format, expression, threshold):
+    """Render one band-math mask tile (see endpoint.render_mask_cached())."""
+    with metrics.count_io(os.path.basename(path)):
+        bands = bandmath.read_tile_bands(_reader(path, mtime), path, mtime, z, x, y)
+    return bandmath.render_mask(bands, expression, threshold, img_format)
+
+
+# ============================================================================
+# Pool
+# ============================================================================
+
+class TileWorkers:
+    """
+    Pool rendering tiles off the request threads.
+
+    Args:
+        workers: Threads or processes
+        mode: 'thread' or 'process'
+        cachemax_mb: GDAL_CACHEMAX of worker processes
+        num_threads: GDAL_NUM_THREADS of worker processes
+    """
+
+    def __init__(self, workers=TILE_WORKERS, mode=TILE_WORKER_MODE,
+                 cachemax_mb=TILE_GDAL_CACHEMAX_MB, num_threads=TILE_GDAL_NUM_THREADS):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"Unknown worker mode '{mode}' (use one of {WORKER_MODES})")
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self.cachemax_mb = cachemax_mb
+        self.num_threads = num_threads
+        self._executor = None
+        self._lock = threading.Lock()
+        self.counters = {'renders': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    # spawn: forking the multi-threaded server process is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker, initargs=(self.cachemax_mb, self.num_threads),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tile-render",
+                                                        initializer=_init_worker)
+                print(f"[TILES] Rendering on {self.workers} {self.mode} workers")
+            return self._executor
+
+    def run(self, fn, *args):
+        """
+        Run a job on a worker and wait for its result.
+
+        Args:
+            fn: Module-level job (render_tile or render_mask)
+            *args: Picklable job arguments
+
+        Returns:
+            Result of fn; exceptions raised by fn propagate
+        """
+        executor = self._get_executor()
+        with self._lock:
+            self.counters['in_flight'] += 1
+            self.counters['peak_in_flight'] = max(self.counters['peak_in_flight'], self.counters['in_flight'])
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.counters['in_flight'] -= 1
+                self.counters['renders'] += 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        """Return the pool configuration and render counters."""
+        with self._lock:
+            return {'mode': self.mode, 'workers': self.workers, **self.counters}
+
+
+# ============================================================================
+# Process-wide Instance
+# ============================================================================
+
+_WORKERS = None
+_WORKERS_CREATED = False
+_WORKERS_LOCK = threading.Lock()
+
+
+def get_tile_workers():
+    """
+    Return the process-wide TileWorkers, creating it on first call.
+
+    Returns:
+        TileWorkers: Shared pool, or None when TILE_WORKERS is 0
+    """
+    global _WORKERS, _WORKERS_CREATED
+    with _WORKERS_LOCK:
+        if not _WORKERS_CREATED:
+            _WORKERS = TileWorkers() if TILE_WORKERS > 0 else None
+            _WORKERS_CREATED = True
+        return _WORKERS
+
+
+def configure_tile_workers(workers, mode=TILE_WORKER_MODE, **kwargs):
+    """
+    Replace the process-wide pool, e.g. to compare configurations in a load test.
+
+    Args:
+        workers: Render workers; 0 renders on the request threads (serialized per source)
+        mode: 'thread' or 'process'
+
+    Returns:
+        TileWorkers: The new pool, or None when workers is 0
+    """
+    global _WORKERS, _WORKERS_CREATED
+    with _WORKERS_LOCK:
+        previous, _WORKERS = _WORKERS, (TileWorkers(workers, mode, **kwargs) if workers > 0 else None)
+        _WORKERS_CREATED = True
+    if previous is not None:
+        previous.shutdown()
+    return _WORKERS
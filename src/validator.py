@@ -1,10 +1,108 @@
+import math
+import os
 import rioxarray
 import xarray as xr
 import numpy as np
 import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as rio_copy
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
 from pathlib import Path
+from src.raster_stats import compute_band_stats
+from src.read_cache import open_raster
 
-def validate_inputs(input_path: str, output_path: str) -> tuple[xr.DataArray, xr.DataArray]:
+# Default peak-memory budget for windowed resampling
+DEFAULT_BLOCK_BUDGET_MB = 64
+
+def check_alignment(input_path: str, output_path: str) -> dict:
+    """
+    Compares CRS, transform and shape of two rasters from metadata only.
+    
+    No pixel data is read.
+    
+    Args:
+        input_path: Path to the model input raster
+        output_path: Path to the model output raster
+        
+    Returns:
+        dict: crs_match, grid_match and the output grid (crs, transform, width, height)
+    """
+    with open_raster(input_path) as src_in, open_raster(output_path) as src_out:
+        crs_match = src_in.crs == src_out.crs
+        grid_match = crs_match and \
+            src_in.shape == src_out.shape and \
+            np.allclose(tuple(src_in.transform), tuple(src_out.transform))
+        return {
+            "crs_match": crs_match,
+            "grid_match": grid_match,
+            "crs": src_out.crs,
+            "transform": src_out.transform,
+            "width": src_out.width,
+            "height": src_out.height,
+        }
+
+def aligned_input_vrt(src: rasterio.io.DatasetReader, alignment: dict,
+                      resampling: Resampling = Resampling.nearest) -> WarpedVRT:
+    """
+    Virtual view of the input warped onto the output grid.
+    
+    Pixels are resampled on demand, window by window, when the VRT is read.
+    """
+    return WarpedVRT(
+        src,
+        crs=alignment["crs"],
+        transform=alignment["transform"],
+        width=alignment["width"],
+        height=alignment["height"],
+        resampling=resampling,
+    )
+
+def _block_size(count: int, dtype: str, block_budget_mb: float, multiple: int = 256) -> int:
+    """Largest square block (multiple of 256 px) whose bands fit in the budget."""
+    bytes_per_pixel = count * np.dtype(dtype).itemsize
+    side = int(math.sqrt(block_budget_mb * 1024 * 1024 / bytes_per_pixel))
+    return max(multiple, side // multiple * multiple)
+
+def write_aligned_input(input_path: str, output_path: str, dst_path: str,
+                        block_budget_mb: float = DEFAULT_BLOCK_BUDGET_MB,
+                        resampling: Resampling = Resampling.nearest) -> str:
+    """
+    Streams the input, resampled onto the output grid, to a Cloud Optimized GeoTIFF.
+    
+    The warp runs in fixed-size windows, so peak memory is bounded by
+    block_budget_mb rather than by scene size.
+    
+    Args:
+        input_path: Path to the model input raster
+        output_path: Path to the model output raster (target grid)
+        dst_path: Destination COG path
+        block_budget_mb: Memory budget for one window of all bands
+        resampling: Resampling method
+        
+    Returns:
+        str: dst_path
+    """
+    alignment = check_alignment(input_path, output_path)
+    tmp_path = f"{dst_path}.tmp.tif"
+    with open_raster(input_path) as src, aligned_input_vrt(src, alignment, resampling) as vrt:
+        block = _block_size(vrt.count, vrt.dtypes[0], block_budget_mb)
+        profile = vrt.profile
+        profile.update(driver="GTiff", tiled=True, blockxsize=256, blockysize=256,
+                       compress="DEFLATE", BIGTIFF="IF_SAFER")
+        print(f"Streaming aligned input in {block}x{block} windows -> {dst_path}")
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            for row in range(0, vrt.height, block):
+                for col in range(0, vrt.width, block):
+                    window = Window(col, row, min(block, vrt.width - col), min(block, vrt.height - row))
+                    dst.write(vrt.read(window=window), window=window)
+    with rasterio.Env(GDAL_CACHEMAX=int(block_budget_mb)):
+        rio_copy(tmp_path, dst_path, driver="COG", COMPRESS="DEFLATE", BIGTIFF="IF_SAFER")
+    os.remove(tmp_path)
+    return dst_path
+
+def validate_inputs(input_path: str, output_path: str, mode: str = "eager",
+                    resampling: Resampling = Resampling.nearest) -> tuple[xr.DataArray, xr.DataArray]:
     """
     Validates and aligns input and output rasters.
     
@@ -16,10 +114,19 @@ def validate_inputs(input_path: str, output_path: str) -> tuple[xr.DataArray, xr
     Args:
         input_path: Path to the model input raster (e.g., Satellite Image)
         output_path: Path to the model output raster (e.g., Flood Map + Uncertainty)
+        mode: "eager" resamples in memory with rio.reproject_match;
+              "windowed" checks metadata only and returns lazy arrays, with the
+              input warped on read through a WarpedVRT (no full-scene copy)
+        resampling: Resampling of the input onto the output grid, in both modes
+              (nearest by default, so class and uncertainty codes are not blended)
         
     Returns:
         tuple: (aligned_input, aligned_output) as xarray DataArrays
     """
+    if mode == "windowed":
+        return _validate_inputs_windowed(input_path, output_path, resampling)
+    if mode != "eager":
+        raise ValueError(f"Unknown validation mode: {mode}")
     
     print(f"Loading Input: {input_path}")
     rxr_in = rioxarray.open_rasterio(input_path, masked=True)
@@ -31,7 +138,7 @@ def validate_inputs(input_path: str, output_path: str) -> tuple[xr.DataArray, xr
     if rxr_in.rio.crs != rxr_out.rio.crs:
         print(f"CRS Mismatch detected. Input: {rxr_in.rio.crs}, Output: {rxr_out.rio.crs}")
         print("Reprojecting Input to match Output CRS...")
-        rxr_in = rxr_in.rio.reproject_match(rxr_out)
+        rxr_in = rxr_in.rio.reproject_match(rxr_out, resampling=resampling)
     else:
         print("CRS Validation Passed.")
 
@@ -41,20 +148,69 @@ def validate_inputs(input_path: str, output_path: str) -> tuple[xr.DataArray, xr
        not np.allclose(rxr_in.rio.transform(), rxr_out.rio.transform()):
         print("Grid Alignment Mismatch (Shape or Transform).")
         print("Resampling Input to match Output grid...")
-        rxr_in = rxr_in.rio.reproject_match(rxr_out)
+        rxr_in = rxr_in.rio.reproject_match(rxr_out, resampling=resampling)
     else:
         print("Grid Alignment Validation Passed.")
 
     return rxr_in, rxr_out
 
-def check_uncertainty_range(da: xr.DataArray) -> xr.DataArray:
+def _validate_inputs_windowed(input_path: str, output_path: str,
+                              resampling: Resampling = Resampling.nearest) -> tuple[xr.DataArray, xr.DataArray]:
+    """
+    Metadata-only validation returning lazily read, aligned DataArrays.
+    
+    Arrays are not cached in memory, so each slice reads (and warps) only
+    the pixels it covers.
+    """
+    for path in (input_path, output_path):
+        if not Path(path).exists():
+            raise FileNotFoundError(path)
+    
+    alignment = check_alignment(input_path, output_path)
+    print("CRS Validation Passed." if alignment["crs_match"] else "CRS Mismatch detected.")
+    
+    rxr_out = rioxarray.open_rasterio(output_path, masked=True, cache=False)
+    if alignment["grid_match"]:
+        print("Grid Alignment Validation Passed.")
+        rxr_in = rioxarray.open_rasterio(input_path, masked=True, cache=False)
+    else:
+        print("Grid Alignment Mismatch. Input will be warped to the Output grid on read.")
+        # rioxarray reopens the VRT's source by name, so it is opened by its plain path
+        with rasterio.open(input_path) as src, aligned_input_vrt(src, alignment, resampling) as vrt:
+            rxr_in = rioxarray.open_rasterio(vrt, masked=True, cache=False)
+    
+    return rxr_in, rxr_out
+
+def _covers_raster(da: xr.DataArray, path: str) -> bool:
+    """True when da spans the whole raster at path (same shape and transform)."""
+    try:
+        shape, transform = da.rio.shape, da.rio.transform()
+    except Exception:
+        return False
+    with open_raster(path) as src:
+        return shape == (src.height, src.width) and np.allclose(transform, src.transform)
+
+def check_uncertainty_range(da: xr.DataArray, path: str | None = None) -> xr.DataArray:
     """
     Checks if the DataArray is in the [0, 1] range.
     If max > 1, assumes it might be 0-255 or similar and normalizes.
     This is a heuristic.
+    
+    When the array covers a whole file (`path`, or the `source` rioxarray
+    records in its encoding), min/max come from the block-streamed statistics
+    engine and its cached sidecar instead of two passes over the array.
+    Slices and subsets are reduced directly.
     """
-    min_val = float(da.min())
-    max_val = float(da.max())
+    path = path or da.encoding.get("source")
+    if path and Path(path).exists() and _covers_raster(da, path):
+        bands = [int(b) for b in np.atleast_1d(da["band"].values)] if "band" in da.coords else [1]
+        band_stats = [compute_band_stats(path, band=b) for b in bands]
+        valid = [s for s in band_stats if s["count"]]
+        min_val = min(s["min"] for s in valid) if valid else float("nan")
+        max_val = max(s["max"] for s in valid) if valid else float("nan")
+    else:
+        min_val = float(da.min())
+        max_val = float(da.max())
     print(f"Value Range Check: min={min_val}, max={max_val}")
     
     if max_val > 1.0:
@@ -70,8 +226,12 @@ def check_uncertainty_range(da: xr.DataArray) -> xr.DataArray:
     return da
 
 if __name__ == "__main__":
+    import sys
     import yaml
     
+    # Optional mode argument: python src/validator.py [eager|windowed]
+    validation_mode = sys.argv[1] if len(sys.argv) > 1 else "eager"
+    
     # Load config to test
     with open("dataset/config.yaml", "r") as f:
         config = yaml.safe_load(f)
@@ -80,7 +240,7 @@ if __name__ == "__main__":
     output_p = config["model"]["output_path"]
     
     try:
-        data_in, data_out = validate_inputs(input_p, output_p)
+        data_in, data_out = validate_inputs(input_p, output_p, mode=validation_mode)
         print("\n--- Validation Successful ---")
         print(f"Input Shape: {data_in.shape}")
         print(f"Output Shape: {data_out.shape}")
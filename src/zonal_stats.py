@@ -0,0 +1,337 @@
+"""
+Per-watershed Zonal Statistics
+
+Flooded area and uncertainty inside HydroBASINS polygons, from the 2-band
+output raster (band 1: class code, band 2: uncertainty).
+
+Basin polygons are rasterized once onto the output grid into a label raster
+(0 = outside every basin, i = i-th basin), cached on disk as a memory-mapped
+.npy keyed by the grid and the shapefile's signature. The output is then
+streamed in row strips restricted to the basins' window, and every statistic
+is a grouped reduction with `np.bincount` over (label, class) or
+(label, histogram bin) keys, so one pass serves a single basin or every
+basin in the footprint alike.
+
+Per HYBAS_ID:
+    class_counts    pixels per class (land / water / cloud / flood_trace / invalid)
+    area_km2        the same as areas (per-row pixel areas on geographic grids)
+    flooded_km2     area of FLOOD_CLASSES
+    uncertainty     mean and fixed-range histogram over classified pixels
+
+Environment:
+    ZONAL_CACHE_DIR   Directory of cached label rasters (default dataset/cache/zonal)
+
+Usage:
+    python -m src.zonal_stats <output.tif> <basins.shp> [HYBAS_ID ...]
+"""
+
+import functools
+import hashlib
+import json
+import math
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from src.pixel_query import CLASS_NAMES
+
+# ============================================================================
+# Configuration Constants
+# ============================================================================
+
+ZONAL_CACHE_DIR = os.environ.get('ZONAL_CACHE_DIR', 'dataset/cache/zonal')
+LABELS_VERSION = 1
+DEFAULT_BLOCK_BUDGET_MB = 64
+BYTES_PER_PIXEL = 48           # Band values, labels, keys and masks held per pixel of a strip
+FLOOD_CLASSES = (2, 4)         # Water and flood trace, as in the Step 2 flood mask
+INVALID_CLASS = 0
+UNCERTAINTY_BINS = 20
+UNCERTAINTY_RANGE = (0.0, 1.0)
+EARTH_RADIUS_KM = 6371.0088
+N_CLASSES = max(CLASS_NAMES) + 1
+
+_BUILD_LOCK = threading.Lock()
+
+
+# ============================================================================
+# Label Raster
+# ============================================================================
+
+class BasinLabels:
+    """
+    Basin polygons burned into the output grid.
+
+    Attributes:
+        ids: HYBAS_ID of label i + 1
+        window: (row_off, col_off, height, width) of `array` in the output grid
+        array: Label array over the window (memory-mapped, read-only)
+    """
+
+    def __init__(self, ids, window, array):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.window = tuple(int(v) for v in window)
+        self.array = array
+
+    @property
+    def empty(self):
+        return len(self.ids) == 0 or self.window[2] == 0 or self.window[3] == 0
+
+
+def _grid_signature(src):
+    return {'crs': src.crs.to_wkt() if src.crs else None, 'transform': list(src.transform)[:6],
+            'width': src.width, 'height': src.height}
+
+
+def _labels_path(output_path, source_path, hybas_ids):
+    from src.read_cache import open_raster
+
+    with open_raster(output_path) as src:
+        grid = _grid_signature(src)
+    st = os.stat(source_path)
+    key = json.dumps({
+        'grid': grid,
+        'source': [os.path.abspath(source_path), st.st_size, st.st_mtime_ns],
+        'ids': None if hybas_ids is None else sorted(int(i) for i in hybas_ids),
+        'version': LABELS_VERSION,
+    }, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:20]
+    return Path(ZONAL_CACHE_DIR) / f"{digest}.labels.npy"
+
+
+def _read_basins(output_path, source_path, hybas_ids):
+    """Selected basins, or every basin intersecting the raster footprint (EPSG:4326)."""
+    if hybas_ids is not None:
+        from src.hydrobasins.store import ID_FIELD, read_basins_by_id
+
+        return read_basins_by_id(source_path, list(hybas_ids), columns=[ID_FIELD])
+    from src.step1.utils import find_candidate_watersheds
+
+    basins, _ = find_candidate_watersheds(output_path, source_path)
+    return basins
+
+
+def _build_labels(output_path, source_path, hybas_ids, target):
+    from rasterio.errors import WindowError
+    from rasterio.features import rasterize
+    from rasterio.windows import Window, from_bounds
+
+    from src.hydrobasins.store import ID_FIELD
+    from src.read_cache import open_raster
+
+    basins = _read_basins(output_path, source_path, hybas_ids)
+    with open_raster(output_path) as src:
+        if src.crs and not basins.empty:
+            basins = basins.to_crs(src.crs)
+        full = Window(0, 0, src.width, src.height)
+        window = Window(0, 0, 0, 0)
+        if not basins.empty:
+            bounds = from_bounds(*basins.total_bounds, transform=src.transform)
+            row, col = math.floor(bounds.row_off), math.floor(bounds.col_off)
+            outer = Window(col, row, math.ceil(bounds.col_off + bounds.width) - col,
+                           math.ceil(bounds.row_off + bounds.height) - row)
+            try:
+                window = outer.intersection(full)
+            except WindowError:
+                pass  # No overlap with the raster
+        transform = src.window_transform(window)
+
+    ids = basins[ID_FIELD].to_numpy(dtype=np.int64) if not basins.empty else np.zeros(0, np.int64)
+    shape = (int(window.height), int(window.width))
+    dtype = np.uint16 if len(ids) < np.iinfo(np.uint16).max else np.uint32
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.stem + ".tmp.npy")
+    labels = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    if labels.size and len(ids):
+        # Burned straight into the memory-mapped file; HydroBASINS levels do not overlap
+        rasterize(zip(basins.geometry.values, range(1, len(ids) + 1)), out=labels,
+                  transform=transform, fill=0)
+    labels.flush()
+    del labels
+    os.replace(tmp, target)
+    meta = {'ids': ids.tolist(), 'window': [int(window.row_off), int(window.col_off), *shape]}
+    target.with_suffix(".json").write_text(json.dumps(meta))
+    print(f"[ZONAL] Rasterized {len(ids)} basins onto a {shape[0]}x{shape[1]} label grid")
+
+
+@functools.lru_cache(maxsize=16)
+def _load_labels(target):
+    target = Path(target)
+    meta = json.loads(target.with_suffix(".json").read_text())
+    return BasinLabels(meta['ids'], meta['window'], np.load(target, mmap_mode='r'))
+
+
+def basin_labels(output_path, source_path, hybas_ids=None):
+    """
+    Label raster of basins on the output grid, built once and cached on disk.
+
+    Args:
+        output_path: Output raster defining the grid
+        source_path: HydroBASINS shapefile
+        hybas_ids: Basins to burn; None for every basin in the footprint
+
+    Returns:
+        BasinLabels: Shared, read-only instance
+    """
+    target = _labels_path(output_path, source_path, hybas_ids)
+    with _BUILD_LOCK:
+        if not target.with_suffix(".json").exists():
+            _build_labels(output_path, source_path, hybas_ids, target)
+    return _load_labels(str(target))
+
+
+# ============================================================================
+# Grouped Reductions
+# ============================================================================
+
+def _row_areas_km2(src, window):
+    """Pixel area (km²) of every row of a window."""
+    transform = src.window_transform(window)
+    height = int(window.height)
+    if src.crs and src.crs.is_geographic:
+        # Spherical zone area between the row's edge latitudes
+        edges = np.radians(transform.f + transform.e * np.arange(height + 1))
+        return (EARTH_RADIUS_KM ** 2 * np.radians(abs(transform.a))
+                * np.abs(np.diff(np.sin(edges))))
+    factor = src.crs.linear_units_factor[1] if src.crs else 1.0
+    return np.full(height, abs(transform.a * transform.e) * factor ** 2 / 1e6)
+
+
+def _strips(window, block_h, budget_mb):
+    """Row strips of a (row_off, col_off, height, width) window, aligned to internal blocks."""
+    row_off, _, height, width = window
+    rows = max(1, int(budget_mb * 1024 * 1024 // (max(width, 1) * BYTES_PER_PIXEL)) // block_h) * block_h
+    for start in range(0, height, rows):
+        yield start, min(rows, height - start)
+
+
+def _reduce(output_path, labels, block_budget_mb):
+    """One pass over the labelled window; per-label sums as flat arrays (label 0 included)."""
+    from rasterio.windows import Window
+
+    from src.read_cache import open_raster
+
+    n = len(labels.ids) + 1
+    lo, hi = UNCERTAINTY_RANGE
+    counts = np.zeros(n * N_CLASSES, dtype=np.int64)
+    areas = np.zeros(n * N_CLASSES, dtype=np.float64)
+    unc_sum = np.zeros(n, dtype=np.float64)
+    unc_count = np.zeros(n, dtype=np.int64)
+    hist = np.zeros(n * UNCERTAINTY_BINS, dtype=np.int64)
+
+    row_off, col_off, height, width = labels.window
+    with open_raster(output_path) as src:
+        row_km2 = _row_areas_km2(src, Window(col_off, row_off, width, height))
+        block_h = src.block_shapes[0][0]
+        for start, rows in _strips(labels.window, block_h, block_budget_mb):
+            window = Window(col_off, row_off + start, width, rows)
+            data = src.read((1, 2), window=window, masked=True)
+            label = np.asarray(labels.array[start:start + rows], dtype=np.int64).ravel()
+            pixel_km2 = np.repeat(row_km2[start:start + rows], width)
+
+            classes = np.ma.getdata(data[0]).ravel()
+            mask = np.ma.getmaskarray(data[0]).ravel()
+            if classes.dtype.kind == 'f':
+                mask |= ~np.isfinite(classes)
+                classes = np.where(mask, 0, classes)
+            codes = classes.astype(np.int64)
+            valid = (label > 0) & ~mask & (codes >= 0) & (codes < N_CLASSES)
+            key = label[valid] * N_CLASSES + codes[valid]
+            counts += np.bincount(key, minlength=n * N_CLASSES)
+            areas += np.bincount(key, weights=pixel_km2[valid], minlength=n * N_CLASSES)
+
+            # Uncertainty of classified pixels only (invalid pixels carry no prediction)
+            uncertainty = np.ma.getdata(data[1]).ravel().astype(np.float64)
+            scored = valid & (codes != INVALID_CLASS) & ~np.ma.getmaskarray(data[1]).ravel()
+            scored &= np.isfinite(uncertainty)
+            scored_label, values = label[scored], uncertainty[scored]
+            unc_sum += np.bincount(scored_label, weights=values, minlength=n)
+            unc_count += np.bincount(scored_label, minlength=n)
+            bins = np.clip(((values - lo) / (hi - lo) * UNCERTAINTY_BINS).astype(np.int64),
+                           0, UNCERTAINTY_BINS - 1)
+            hist += np.bincount(scored_label * UNCERTAINTY_BINS + bins, minlength=n * UNCERTAINTY_BINS)
+
+    return (counts.reshape(n, N_CLASSES), areas.reshape(n, N_CLASSES), unc_sum, unc_count,
+            hist.reshape(n, UNCERTAINTY_BINS))
+
+
+def _basin_record(hybas_id, counts, areas, unc_sum, unc_count, hist):
+    edges = np.linspace(*UNCERTAINTY_RANGE, UNCERTAINTY_BINS + 1)
+    return {
+        'hybas_id': int(hybas_id),
+        'class_counts': {CLASS_NAMES[c]: int(counts[c]) for c in range(N_CLASSES)},
+        'area_km2': {CLASS_NAMES[c]: float(areas[c]) for c in range(N_CLASSES)},
+        'flooded_km2': float(areas[list(FLOOD_CLASSES)].sum()),
+        'uncertainty': {
+            'mean': float(unc_sum / unc_count) if unc_count else None,
+            'count': int(unc_count),
+            'histogram': {'edges': [float(e) for e in edges], 'counts': hist.tolist()},
+        },
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _zonal_stats(output_path, output_mtime, source_path, source_mtime, hybas_ids, block_budget_mb):
+    labels = basin_labels(output_path, source_path, None if hybas_ids is None else list(hybas_ids))
+    if labels.empty:
+        return {}
+    counts, areas, unc_sum, unc_count, hist = _reduce(output_path, labels, block_budget_mb)
+    # Label i + 1 belongs to labels.ids[i]; label 0 (outside every basin) is dropped
+    return {
+        int(hybas_id): _basin_record(hybas_id, counts[i], areas[i], unc_sum[i], unc_count[i], hist[i])
+        for i, hybas_id in enumerate(labels.ids, start=1)
+    }
+
+
+def zonal_stats(output_path, source_path, hybas_ids=None, block_budget_mb=DEFAULT_BLOCK_BUDGET_MB):
+    """
+    Class areas and uncertainty per basin, in one pass over the output raster.
+
+    Only the window covering the requested basins is read. Results are
+    memoized per file mtimes and basin set.
+
+    Args:
+        output_path: 2-band output raster (class, uncertainty)
+        source_path: HydroBASINS shapefile
+        hybas_ids: Basins to summarize; None for every basin in the footprint
+        block_budget_mb: Memory budget per read strip
+
+    Returns:
+        dict: {HYBAS_ID: {hybas_id, class_counts, area_km2, flooded_km2, uncertainty}}
+            (shared; treat as read-only)
+    """
+    ids = None if hybas_ids is None else tuple(sorted(int(i) for i in np.atleast_1d(hybas_ids)))
+    return _zonal_stats(os.path.abspath(output_path), os.stat(output_path).st_mtime_ns,
+                        os.path.abspath(source_path), os.stat(source_path).st_mtime_ns,
+                        ids, block_budget_mb)
+
+
+def scene_watershed_stats(scene):
+    """
+    Zonal statistics of a scene's configured watershed.
+
+    Args:
+        scene: Scene record with output_path, watershed_path and watershed_id (see src/catalog.py)
+
+    Returns:
+        dict: Basin record from zonal_stats(), or None when not available
+    """
+    output_path, watershed_path = scene.get('output_path'), scene.get('watershed_path')
+    watershed_id = scene.get('watershed_id')
+    if not (output_path and watershed_path and watershed_id) or not os.path.exists(output_path):
+        return None
+    return zonal_stats(output_path, watershed_path, [watershed_id]).get(int(watershed_id))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("Usage: python -m src.zonal_stats <output.tif> <basins.shp> [HYBAS_ID ...]")
+        sys.exit(1)
+    selected = [int(i) for i in sys.argv[3:]] or None
+    for record in zonal_stats(sys.argv[1], sys.argv[2], selected).values():
+        print(json.dumps({k: v for k, v in record.items() if k != 'uncertainty'}
+                         | {'uncertainty_mean': record['uncertainty']['mean']}))